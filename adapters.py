@@ -0,0 +1,186 @@
+import json
+import re
+from abc import ABC, abstractmethod
+from typing import Callable, Iterator, Optional
+
+from lxml import etree, html
+
+from bcolors import bcolors
+from episode import parse_latest_ep
+
+# keys that hold an episode number in the JSON sites embed in their pages
+EPISODE_KEYS = ('chapterNo', 'chapterNumber', 'chapter_number', 'episodeNo', 'episodeNumber', 'episode_number',
+                'issueNumber')
+
+MANGAPLUS_API = 'https://jumpg-webapi.tokyo-cdn.com'
+NEKOPOST_API = 'https://api.osemocphoto.com'
+
+
+def find_values(data, key: str, within: Optional[str] = None) -> Iterator:
+    """Every value stored under ``key`` anywhere in ``data``, optionally only in objects that also have ``within``."""
+    if isinstance(data, dict):
+        if key in data and (within is None or within in data):
+            yield data[key]
+        for value in data.values():
+            yield from find_values(value, key, within)
+    elif isinstance(data, list):
+        for item in data:
+            yield from find_values(item, key, within)
+
+
+def latest_ep_in_json(data, keys: tuple[str, ...], within: Optional[str] = None) -> float:
+    values = [value for key in keys for value in find_values(data, key, within)]
+    return parse_latest_ep([str(value) for value in values if value is not None])
+
+
+def embedded_json(content: bytes) -> list:
+    # Next.js page data and schema.org JSON-LD, the two ways sites commonly ship their data inside the HTML
+    try:
+        tree = html.fromstring(content)
+    except etree.ParserError:
+        return []
+    scripts = tree.xpath('//script[@id="__NEXT_DATA__"]/text() | //script[@type="application/ld+json"]/text()')
+    documents = []
+    for script in scripts:
+        try:
+            documents.append(json.loads(script))
+        except ValueError:
+            continue
+    return documents
+
+
+class SiteAdapter(ABC):
+    """Reads the latest episode of a title without rendering its page.
+
+    The page check fetches ``source_url`` and hands the body to ``parse``,
+    which raises when the structured data is missing or has no episode in it;
+    the check then falls back to the XPath from the watchlist.
+    """
+
+    kind = 'xpath'
+
+    def __init__(self, hosts: tuple[str, ...]):
+        self.hosts = hosts
+
+    def source_url(self, manga_url: str) -> str:
+        return manga_url
+
+    @abstractmethod
+    def parse(self, content: bytes) -> float:
+        ...
+
+
+class JsonApiAdapter(SiteAdapter):
+    """Asks the site's own API, found from the title URL by ``endpoint``."""
+
+    kind = 'api'
+
+    def __init__(self, hosts: tuple[str, ...], endpoint: Callable[[str], Optional[str]], keys: tuple[str, ...],
+                 within: Optional[str] = None):
+        super().__init__(hosts)
+        self.endpoint = endpoint
+        self.keys = keys
+        self.within = within
+
+    def source_url(self, manga_url: str) -> str:
+        api_url = self.endpoint(manga_url)
+        if not api_url:
+            raise ValueError(f'No API endpoint for {manga_url}')
+        return api_url
+
+    def parse(self, content: bytes) -> float:
+        return latest_ep_in_json(json.loads(content), self.keys, self.within)
+
+
+class EmbeddedDataAdapter(SiteAdapter):
+    """Reads ``__NEXT_DATA__`` or JSON-LD from the page HTML, which is there before any JavaScript runs."""
+
+    kind = 'embedded'
+
+    def __init__(self, hosts: tuple[str, ...], keys: tuple[str, ...] = EPISODE_KEYS):
+        super().__init__(hosts)
+        self.keys = keys
+
+    def parse(self, content: bytes) -> float:
+        return latest_ep_in_json(embedded_json(content), self.keys)
+
+
+class RssAdapter(SiteAdapter):
+    """Reads the item titles of a feed. The feed is the watchlist URL unless ``feed`` maps it to one."""
+
+    kind = 'rss'
+
+    def __init__(self, hosts: tuple[str, ...], feed: Optional[Callable[[str], str]] = None):
+        super().__init__(hosts)
+        self.feed = feed
+
+    def source_url(self, manga_url: str) -> str:
+        return self.feed(manga_url) if self.feed else manga_url
+
+    def parse(self, content: bytes) -> float:
+        try:
+            root = etree.fromstring(content, parser=etree.XMLParser(resolve_entities=False, no_network=True))
+        except etree.XMLSyntaxError as e:
+            raise ValueError(f'Not a feed: {e}') from e
+        # RSS <item><title> and Atom <entry><title>
+        titles = root.xpath('//item/title/text() | //*[local-name()="entry"]/*[local-name()="title"]/text()')
+        return parse_latest_ep([title.strip() for title in titles])
+
+
+def mangaplus_endpoint(manga_url: str, api_base: str = MANGAPLUS_API) -> Optional[str]:
+    # https://mangaplus.shueisha.co.jp/titles/100020
+    match = re.search(r'/titles/(\d+)', manga_url)
+    return f'{api_base}/api/title_detailV3?title_id={match.group(1)}&format=json' if match else None
+
+
+def nekopost_endpoint(manga_url: str, api_base: str = NEKOPOST_API) -> Optional[str]:
+    # https://www.nekopost.net/manga/12345
+    match = re.search(r'/manga/(\d+)', manga_url)
+    return f'{api_base}/frontAPI/getProjectInfo/{match.group(1)}' if match else None
+
+
+class AdapterRegistry:
+    """Site adapters by host. Hosts without one only use the XPath."""
+
+    def __init__(self, adapters: tuple[SiteAdapter, ...] = ()):
+        self._adapters: dict[str, SiteAdapter] = {}
+        for adapter in adapters:
+            self.register(adapter)
+
+    def register(self, adapter: SiteAdapter):
+        for host in adapter.hosts:
+            self._adapters[host] = adapter
+
+    def unregister(self, host: str):
+        self._adapters.pop(host, None)
+
+    def get(self, host: str) -> Optional[SiteAdapter]:
+        return self._adapters.get(host)
+
+
+def default_registry() -> AdapterRegistry:
+    return AdapterRegistry((
+        # chapters are objects with a chapterId and a name such as "#1110"
+        JsonApiAdapter(('mangaplus.shueisha.co.jp',), mangaplus_endpoint, keys=('name',), within='chapterId'),
+        JsonApiAdapter(('www.nekopost.net', 'nekopost.net'), nekopost_endpoint, keys=('chapterNo',)),
+    ))
+
+
+def parse_site_adapters(value: Optional[str], registry: AdapterRegistry) -> AdapterRegistry:
+    # e.g. "example-next-site.com:embedded,feeds.example.com:rss,mangaplus.shueisha.co.jp:xpath" (host:kind)
+    if not value:
+        return registry
+    for entry in value.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        host, _, kind = entry.partition(':')
+        if kind == EmbeddedDataAdapter.kind:
+            registry.register(EmbeddedDataAdapter((host,)))
+        elif kind == RssAdapter.kind:
+            registry.register(RssAdapter((host,)))
+        elif kind == SiteAdapter.kind:
+            registry.unregister(host)
+        else:
+            print(f'{bcolors.WARNING}Invalid site adapter "{entry}". Ignored.{bcolors.ENDC}')
+    return registry
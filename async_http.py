@@ -0,0 +1,112 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from bcolors import bcolors
+from static_fetch import USER_AGENT, create_session
+
+
+@dataclass
+class FetchedPage:
+    """The parts of a response the checks use, the same whichever client fetched it."""
+
+    status_code: int
+    headers: CaseInsensitiveDict
+    content: bytes
+    url: str
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(errors='replace')
+
+    def raise_for_status(self):
+        # the same exception requests raises, so the fallbacks and failure reasons treat both clients alike
+        if not self.ok:
+            raise requests.HTTPError(f'{self.status_code} for url: {self.url}')
+
+
+class AiohttpClient:
+    """HTTP on the event loop with aiohttp, sharing at most ``connections`` connections.
+
+    aiohttp errors are raised as their requests counterparts.
+    """
+
+    def __init__(self, connections: int = 100, per_host: int = 0, timeout: float = 10):
+        import aiohttp
+
+        self._aiohttp = aiohttp
+        self.connections = connections
+        self.per_host = per_host
+        self.timeout = timeout
+        self._session: Optional['aiohttp.ClientSession'] = None
+
+    def _get_session(self) -> 'aiohttp.ClientSession':
+        # created on first use, so it belongs to the loop that runs the checks
+        if self._session is None:
+            aiohttp = self._aiohttp
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connections, limit_per_host=self.per_host),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={'User-Agent': USER_AGENT})
+        return self._session
+
+    async def request(self, method: str, url: str, headers: Optional[dict] = None,
+                      params: Optional[dict] = None) -> FetchedPage:
+        try:
+            async with self._get_session().request(method, url, headers=headers, params=params) as response:
+                content = await response.read()
+                return FetchedPage(response.status, CaseInsensitiveDict(response.headers), content, str(response.url))
+        except asyncio.TimeoutError as e:
+            raise requests.Timeout(f'{method} {url} timed out') from e
+        except self._aiohttp.ClientError as e:
+            raise requests.ConnectionError(f'{type(e).__name__}: {e}') from e
+
+    async def get(self, url: str, headers: Optional[dict] = None) -> FetchedPage:
+        return await self.request('GET', url, headers=headers)
+
+    async def post(self, url: str, headers: Optional[dict] = None, params: Optional[dict] = None) -> FetchedPage:
+        return await self.request('POST', url, headers=headers, params=params)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+class ThreadedHttpClient:
+    """The same interface over a requests session, each request on a thread of the loop's default executor."""
+
+    def __init__(self, session: requests.Session, timeout: float = 10):
+        self.session = session
+        self.timeout = timeout
+
+    async def request(self, method: str, url: str, headers: Optional[dict] = None,
+                      params: Optional[dict] = None) -> FetchedPage:
+        response = await asyncio.to_thread(self.session.request, method, url, headers=headers, params=params,
+                                           timeout=self.timeout)
+        return FetchedPage(response.status_code, response.headers, response.content, response.url)
+
+    async def get(self, url: str, headers: Optional[dict] = None) -> FetchedPage:
+        return await self.request('GET', url, headers=headers)
+
+    async def post(self, url: str, headers: Optional[dict] = None, params: Optional[dict] = None) -> FetchedPage:
+        return await self.request('POST', url, headers=headers, params=params)
+
+    async def close(self):
+        self.session.close()
+
+
+def create_http_client(connections: int = 100, timeout: float = 10,
+                       session: Optional[requests.Session] = None) -> AiohttpClient | ThreadedHttpClient:
+    # aiohttp is optional; without it requests still works, just with a thread per request in flight
+    try:
+        return AiohttpClient(connections=connections, timeout=timeout)
+    except ImportError:
+        print(f'{bcolors.OKCYAN}aiohttp is not installed, fetching pages on threads{bcolors.ENDC}')
+        return ThreadedHttpClient(session or create_session(pool_size=connections), timeout=timeout)
@@ -0,0 +1,251 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import partial
+from typing import Callable, ContextManager, Iterator
+
+from bench.site_server import SHAPES, StandInConfig, StandInSites, generate_watchlist
+from memory import process_table, tree_pss_mb
+from scheduler import HostPolicy, HostScheduler, PageJob, group_pages
+from static_fetch import create_session, get_latest_eps_static
+from stats import percentile
+
+
+@contextmanager
+def static_worker(workers: int) -> Iterator[Callable[[PageJob], list[float]]]:
+    with create_session(pool_size=workers) as session:
+        yield lambda job: get_latest_eps_static(session, job.url, job.xpaths)
+
+
+@contextmanager
+def bench_config(workers: int) -> Iterator[dict[str, str]]:
+    with tempfile.TemporaryDirectory(prefix='bench-') as state_dir:
+        yield {'LATEST_RELEASE_URL': os.environ.get('LATEST_RELEASE_URL', ''),
+               'DRIVER_CACHE': os.environ.get('DRIVER_CACHE', 'driver_cache.json'),
+               'SITE_MODES': os.path.join(state_dir, 'site_modes.json'),
+               'RENDER_TIMINGS': os.path.join(state_dir, 'render_timings.json'),
+               'VALIDATOR_CACHE': os.path.join(state_dir, 'validator_cache.json'),
+               'DRIVER_POOL_SIZE': str(min(workers, 4)),
+               'MAX_WORKERS': str(workers),
+               'HOST_CONCURRENCY': str(workers),
+               'HOST_MIN_INTERVAL': '0',
+               'HTTP_CONNECTIONS': str(workers)}
+
+
+@contextmanager
+def checker_worker(workers: int, force_browser: bool = False) -> Iterator[Callable[[PageJob], list[float]]]:
+    # the same PageChecker the threaded checks use: plain HTTP first, Chrome when that finds nothing
+    from main import PageChecker, create_driver_pool
+    from static_fetch import BROWSER
+
+    with bench_config(workers) as config:
+        checker = PageChecker(config, create_driver_pool(config))
+
+        def check(job: PageJob) -> list[float]:
+            if force_browser:
+                checker.site_modes.remember(job.host, BROWSER)
+            return checker.check(job)[0]
+
+        try:
+            yield check
+        finally:
+            # quits every Chrome the pool started
+            checker.close()
+
+
+def run_threaded(open_worker: Callable[[int], ContextManager[Callable[[PageJob], list[float]]]],
+                 rows: list[list[str]], workers: int) -> tuple[list[float], int]:
+    scheduler = HostScheduler(max_workers=workers, default_policy=HostPolicy(concurrency=workers, min_interval=0))
+    latencies = []
+    errors = 0
+    with open_worker(workers) as worker:
+        def timed(job: PageJob) -> tuple[list[float], float]:
+            start = time.perf_counter()
+            latest_eps = worker(job)
+            return latest_eps, (time.perf_counter() - start) * 1000
+
+        for job, future in scheduler.run(group_pages(rows), timed):
+            try:
+                _, elapsed_ms = future.result()
+            except Exception:
+                errors += len(job.row_indexes)
+                continue
+            latencies += [elapsed_ms] * len(job.row_indexes)
+    return latencies, errors
+
+
+def run_engine(rows: list[list[str]], workers: int) -> tuple[list[float], int]:
+    # what main() runs: run_watchlist's AsyncEngine, retrying checker and async page checks, minus storage and LINE
+    from async_http import create_http_client
+    from engine import AsyncEngine, AsyncPageChecker, BrowserSessions, create_host_limiter
+    from main import PageChecker, create_driver_pool, create_resilient_checker, get_int_config
+    from resilience import FAILED, AsyncResilientChecker
+
+    async def run(config: dict[str, str]) -> tuple[list[float], int]:
+        checker = PageChecker(config, create_driver_pool(config))
+        http = create_http_client(connections=get_int_config(config, 'HTTP_CONNECTIONS', 100),
+                                  session=checker.session)
+        browser = BrowserSessions(checker.pool.size)
+        resilient_checker = create_resilient_checker(config, AsyncPageChecker(checker, http, browser),
+                                                     checker_class=AsyncResilientChecker)
+        engine = AsyncEngine(resilient_checker, create_host_limiter(config))
+        latencies = []
+        errors = 0
+        try:
+            async for outcome in engine.run(rows):
+                if outcome.status == FAILED:
+                    errors += 1
+                else:
+                    latencies.append(outcome.fetch_ms)
+        finally:
+            await http.close()
+            browser.close()
+            checker.close()
+        return latencies, errors
+
+    with bench_config(workers) as config:
+        return asyncio.run(run(config))
+
+
+# mode name -> (needs Chrome, runner returning the latency of every title checked and the number that failed)
+MODES = {
+    'static': (False, partial(run_threaded, static_worker)),
+    'auto': (True, partial(run_threaded, checker_worker)),
+    'browser': (True, partial(run_threaded, partial(checker_worker, force_browser=True))),
+    'engine': (True, run_engine),
+}
+
+
+def chrome_available() -> bool:
+    return any(shutil.which(name) for name in ('google-chrome', 'google-chrome-stable', 'chromium', 'chromium-browser'))
+
+
+class PeakMemory:
+    """Samples the PSS of this process and every process under it, so chromedriver and Chrome count while they run."""
+
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def sample(self):
+        self.peak_mb = max(self.peak_mb, tree_pss_mb(os.getpid(), process_table()))
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def __enter__(self) -> 'PeakMemory':
+        self.sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+        self.sample()
+
+
+def run_mode(mode: str, rows: list[list[str]], workers: int) -> dict:
+    with PeakMemory() as memory:
+        start = time.perf_counter()
+        latencies, errors = MODES[mode][1](rows, workers)
+        wall_seconds = time.perf_counter() - start
+
+    return {
+        'mode': mode,
+        'titles': len(rows),
+        'ok': len(latencies),
+        'errors': errors,
+        'wall_seconds': round(wall_seconds, 3),
+        'titles_per_second': round(len(latencies) / wall_seconds, 2) if wall_seconds else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'peak_pss_mb': round(memory.peak_mb, 1),
+    }
+
+
+def _run_isolated(mode: str, rows: list[list[str]], workers: int, results):
+    results.put(run_mode(mode, rows, workers))
+
+
+def run_isolated(mode: str, rows: list[list[str]], workers: int) -> dict:
+    # a fresh process per run so the peak memory belongs to this mode and size only
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=_run_isolated, args=(mode, rows, workers, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def git_version() -> str:
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except OSError:
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark episode checks against local stand-in manga sites.')
+    parser.add_argument('--sizes', default='10,100,1000', help='comma separated watchlist sizes (10 to 10000)')
+    parser.add_argument('--modes', default='static', help=f'comma separated, any of {", ".join(MODES)}')
+    parser.add_argument('--shapes', default=','.join(SHAPES), help='page shapes to put in the watchlist')
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='server delay before each response')
+    parser.add_argument('--js-delay-ms', type=float, default=300.0, help='delay before the SPA shape renders')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    parser.add_argument('--output', default='bench_results.json')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    modes = args.modes.split(',')
+    shapes = tuple(args.shapes.split(','))
+    config = StandInConfig(latency_ms=args.latency_ms, js_delay_ms=args.js_delay_ms, failure_rate=args.failure_rate)
+
+    results = []
+    with StandInSites(config) as sites:
+        for mode in modes:
+            if MODES[mode][0] and not chrome_available():
+                print(f'Skipping {mode}: Chrome is not installed')
+                continue
+            for size in sizes:
+                result = run_isolated(mode, generate_watchlist(sites, size, shapes), args.workers)
+                results.append(result)
+                print(f"{mode:>8} {size:>6} titles: {result['titles_per_second']:>8} titles/s, "
+                      f"p50 {result['p50_ms']}ms p95 {result['p95_ms']}ms p99 {result['p99_ms']}ms, "
+                      f"peak PSS {result['peak_pss_mb']}MB, {result['errors']} errors")
+
+    report = {
+        'version': git_version(),
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'workers': args.workers,
+        'server': vars(config),
+        'shapes': list(shapes),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,157 @@
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Page shapes that mimic the sites in db.csv, with the XPath a watchlist row would use for each
+SHAPES = {
+    'nekopost': {'path': '/manga/{id}/', 'xpath': '//a/h2'},
+    'mangaplus': {'path': '/titles/{id}/', 'xpath': '//main/div/div/div[1]/div/p[1]'},
+    'comicwalker': {'path': '/contents/{id}/', 'xpath': "//ul[@id='episodes']/li/a/span"},
+}
+LOOPBACK_HOSTS = {'nekopost': '127.0.0.1', 'mangaplus': '127.0.0.2', 'comicwalker': '127.0.0.3'}
+
+
+@dataclass
+class StandInConfig:
+    latency_ms: float = 0.0
+    js_delay_ms: float = 0.0
+    failure_rate: float = 0.0
+    episodes: int = 30
+
+
+def latest_ep(title_id: int) -> int:
+    return title_id % 500 + 30
+
+
+def render_nekopost(title_id: int, config: StandInConfig) -> str:
+    latest = latest_ep(title_id)
+    items = ''.join(f'<a href="/manga/{title_id}/{ep}"><h2>ตอนที่ {ep}</h2><img src="/cover/{ep}.jpg"></a>'
+                    for ep in range(latest, latest - config.episodes, -1))
+    return f'<html><head><title>Manga {title_id} | NEKOPOST</title></head><body>{items}</body></html>'
+
+
+def render_mangaplus(title_id: int, config: StandInConfig) -> str:
+    # Single page app: the chapter list only exists after the script has run
+    latest = latest_ep(title_id)
+    return f"""<html><head><title>MANGA Plus {title_id}</title></head><body><main></main><script>
+setTimeout(function () {{
+    var html = '<div><div><div><div><p>#{latest:03d}</p><p>Chapter {latest}</p></div></div></div></div>';
+    document.querySelector('main').innerHTML = html;
+}}, {config.js_delay_ms:.0f});
+</script></body></html>"""
+
+
+def render_comicwalker(title_id: int, config: StandInConfig) -> str:
+    latest = latest_ep(title_id)
+    items = ''.join(f'<li><a href="/viewer/{title_id}/{ep}"><span>第{ep}話</span></a></li>'
+                    for ep in range(1, latest + 1)[-config.episodes:])
+    return (f'<html><head><title>Comic {title_id} - ComicWalker</title></head>'
+            f'<body><ul id="episodes">{items}</ul></body></html>')
+
+
+RENDERERS = {'nekopost': render_nekopost, 'mangaplus': render_mangaplus, 'comicwalker': render_comicwalker}
+PATH_ID = re.compile(r'/(\d+)/')
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    shape = ''
+    config = StandInConfig()
+
+    def do_GET(self):
+        config = self.config
+        if config.latency_ms:
+            time.sleep(config.latency_ms / 1000)
+        match = PATH_ID.search(self.path)
+        if match is None:
+            self.send_error(404)
+            return
+        if config.failure_rate and random.random() < config.failure_rate:
+            self.send_error(503)
+            return
+
+        body = RENDERERS[self.shape](int(match.group(1)), config).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalServer:
+    """A ThreadingHTTPServer for ``handler`` on a free port, served from a thread of its own."""
+
+    def __init__(self, handler: type[BaseHTTPRequestHandler], host: str = '127.0.0.1'):
+        self.handler = handler
+        self.host = host
+        self.server: ThreadingHTTPServer | None = None
+        self.base_url = ''
+
+    def start(self) -> 'LocalServer':
+        self.server = ThreadingHTTPServer((self.host, 0), self.handler)
+        self.server.daemon_threads = True
+        host, port = self.server.server_address[:2]
+        self.base_url = f'http://{host}:{port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> 'LocalServer':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class StandInSites:
+    """One local server per page shape, each on its own loopback address so they count as separate hosts."""
+
+    def __init__(self, config: StandInConfig):
+        self.config = config
+        self.servers: dict[str, LocalServer] = {}
+        self.base_urls: dict[str, str] = {}
+
+    def start(self) -> 'StandInSites':
+        for shape in SHAPES:
+            handler = type(f'{shape}Handler', (StandInHandler,), {'shape': shape, 'config': self.config})
+            try:
+                server = LocalServer(handler, LOOPBACK_HOSTS[shape]).start()
+            except OSError:
+                # not every OS routes all of 127.0.0.0/8 to loopback
+                server = LocalServer(handler).start()
+            self.servers[shape] = server
+            self.base_urls[shape] = server.base_url
+        return self
+
+    def stop(self):
+        for server in self.servers.values():
+            server.stop()
+
+    def __enter__(self) -> 'StandInSites':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def url(self, shape: str, title_id: int) -> str:
+        return self.base_urls[shape] + SHAPES[shape]['path'].format(id=title_id)
+
+
+def generate_watchlist(sites: StandInSites, size: int, shapes: tuple[str, ...] = tuple(SHAPES),
+                       new_ep_ratio: float = 0.1, seed: int = 0) -> list[list[str]]:
+    rng = random.Random(seed)
+    rows = []
+    for i in range(size):
+        shape = shapes[i % len(shapes)]
+        latest = latest_ep(i)
+        current_ep = latest - 1 if rng.random() < new_ep_ratio else latest
+        rows.append([f'{shape} {i}', sites.url(shape, i), SHAPES[shape]['xpath'], str(float(current_ep))])
+    return rows
@@ -0,0 +1,178 @@
+import heapq
+import os
+import signal
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from bcolors import bcolors
+from main import PageChecker, create_driver_pool, create_notifier, create_resilient_checker, create_scheduler, \
+    export_traces, float_to_str, get_float_config, load_env, print_outcome
+from notifier import Notification, print_notification_results
+from resilience import NEW, print_outcome_summary
+from scheduler import group_pages
+from storage import RowKey, open_storage, row_key
+from tracing import tracer
+
+
+class TitleSchedule:
+    """Priority queue of watchlist rows keyed by when each one should be checked next.
+
+    A title that has released at least twice is left alone until close to its
+    usual release gap after the last episode. Every check that finds nothing new
+    stretches the polling interval by ``backoff``, up to ``max_interval``.
+    """
+
+    def __init__(self, min_interval: float, max_interval: float, backoff: float = 1.5):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self._heap: list[tuple[float, RowKey]] = []
+        self._due: dict[RowKey, float] = {}
+        self._releases: dict[RowKey, list[float]] = {}
+        self._misses: dict[RowKey, int] = {}
+
+    def __contains__(self, key: RowKey) -> bool:
+        return key in self._due
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def keys(self) -> list[RowKey]:
+        return list(self._due)
+
+    def add(self, key: RowKey, releases: list[float], due: float):
+        self._releases[key] = sorted(releases)
+        self._misses.setdefault(key, 0)
+        self._push(key, due)
+
+    def remove(self, key: RowKey):
+        # stale heap entries are skipped when popped
+        self._due.pop(key, None)
+        self._releases.pop(key, None)
+        self._misses.pop(key, None)
+
+    def next_due(self) -> Optional[float]:
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float) -> list[RowKey]:
+        keys = []
+        while True:
+            due = self.next_due()
+            if due is None or due > now:
+                return keys
+            _, key = heapq.heappop(self._heap)
+            del self._due[key]
+            keys.append(key)
+
+    def cadence(self, key: RowKey) -> Optional[float]:
+        releases = self._releases.get(key, [])
+        gaps = [b - a for a, b in zip(releases, releases[1:]) if b > a]
+        return statistics.median(gaps) if gaps else None
+
+    def next_delay(self, key: RowKey, now: float) -> float:
+        delay = min(self.max_interval, self.min_interval * self.backoff ** self._misses.get(key, 0))
+        cadence = self.cadence(key)
+        releases = self._releases.get(key)
+        if cadence and releases:
+            # nothing is expected before the usual gap has (almost) passed
+            expected = releases[-1] + cadence * 0.9
+            delay = max(delay, expected - now)
+        return delay
+
+    def record(self, key: RowKey, new_ep: bool, now: float):
+        if key not in self._releases:
+            return
+        if new_ep:
+            self._releases[key].append(now)
+            self._misses[key] = 0
+        else:
+            self._misses[key] += 1
+        self._push(key, now + self.next_delay(key, now))
+
+    def _push(self, key: RowKey, due: float):
+        self._due[key] = due
+        heapq.heappush(self._heap, (due, key))
+
+
+def release_times(history: list[tuple[float, str, Optional[float]]]) -> list[float]:
+    return [datetime.fromisoformat(detected_at).timestamp() for _, detected_at, _ in history]
+
+
+def run_daemon():
+    CONFIG_KEYS = ('CSV', 'LATEST_RELEASE_URL', 'LINE_TOKEN')
+
+    config = load_env(filename=os.path.join(sys.path[0], '.env'), config_keys=CONFIG_KEYS)
+    if not config:
+        print(f'{bcolors.WARNING}.env file is invalid. Aborted!{bcolors.ENDC}')
+        exit()
+
+    reload_seconds = get_float_config(config, 'DAEMON_RELOAD_INTERVAL', 600)
+    schedule = TitleSchedule(min_interval=get_float_config(config, 'DAEMON_MIN_INTERVAL', 1800),
+                             max_interval=get_float_config(config, 'DAEMON_MAX_INTERVAL', 86400),
+                             backoff=get_float_config(config, 'DAEMON_BACKOFF', 1.5))
+    storage = open_storage(config['CSV'])
+    checker = PageChecker(config, create_driver_pool(config))
+    resilient_checker = create_resilient_checker(config, checker)
+    scheduler = create_scheduler(config)
+    notifier = create_notifier(config)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+
+    rows: dict[RowKey, list[str]] = {}
+    next_reload = 0.0
+    try:
+        while not stop.is_set():
+            now = time.time()
+            if now >= next_reload:
+                # pick up titles added to or removed from the watchlist while running
+                rows = {row_key(row): row for row in storage.read_rows()}
+                for name, url in rows:
+                    if (name, url) not in schedule:
+                        schedule.add((name, url), release_times(storage.history(name, url)), due=now)
+                for key in [key for key in schedule.keys() if key not in rows]:
+                    schedule.remove(key)
+                next_reload = now + reload_seconds
+
+            due_keys = [key for key in schedule.pop_due(now) if key in rows]
+            if not due_keys:
+                next_due = schedule.next_due()
+                wake_at = next_reload if next_due is None else min(next_due, next_reload)
+                stop.wait(max(1.0, wake_at - time.time()))
+                continue
+
+            print(f'\n{bcolors.OKCYAN}Checking {len(due_keys)} of {len(schedule) + len(due_keys)} '
+                  f'titles{bcolors.ENDC}')
+            due_rows = [rows[key] for key in due_keys]
+            for job, future in scheduler.run(group_pages(due_rows), resilient_checker):
+                for outcome in future.result():
+                    print_outcome(outcome)
+                    new_ep = outcome.status == NEW
+                    if new_ep:
+                        rows[outcome.title, outcome.url][3] = str(outcome.latest_ep)
+                        storage.update_ep(outcome.title, outcome.url, outcome.latest_ep, outcome.fetch_ms)
+                        notifier.submit(Notification(outcome.title, outcome.url, float_to_str(outcome.current_ep),
+                                                     float_to_str(outcome.latest_ep)))
+                    schedule.record((outcome.title, outcome.url), new_ep, time.time())
+            storage.flush()
+            checker.save()
+            notifier.flush()
+            print_notification_results(notifier.take_results())
+            tracer.add_section('outcomes', resilient_checker.summary())
+            export_traces(config)
+    finally:
+        storage.close()
+        checker.close()
+        print_outcome_summary(resilient_checker.summary())
+        print_notification_results(notifier.close())
+
+
+if __name__ == '__main__':
+    run_daemon()
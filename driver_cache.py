@@ -0,0 +1,86 @@
+import json
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+from bcolors import bcolors
+
+
+class DriverResolutionException(Exception):
+    pass
+
+
+class DriverCache:
+    """Remembers the resolved chromedriver version and binary path between runs.
+
+    A cached binary that still exists is used straight away. Once the entry is
+    older than ``ttl`` seconds a background thread re-resolves it for the next
+    run, so only a missing or broken cache makes a run wait on the network.
+    """
+
+    def __init__(self, filename: str, resolver: Callable[[], tuple[str, str]], ttl: float = 86400):
+        self.filename = filename
+        self.ttl = ttl
+        self._resolver = resolver
+        self._lock = threading.Lock()
+        self._refresh_thread: Optional[threading.Thread] = None
+
+    def load(self) -> Optional[dict]:
+        try:
+            with open(self.filename, 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(entry, dict) or not all(key in entry for key in ('version', 'path', 'resolved_at')):
+            return None
+        return entry
+
+    def save(self, version: str, path: str):
+        # shard workers share the cache, so each process writes its own temporary file
+        tmp_name = f'{self.filename}.{os.getpid()}.tmp'
+        with open(tmp_name, 'w') as f:
+            json.dump({'version': version, 'path': path, 'resolved_at': time.time()}, f, indent=2)
+        os.replace(tmp_name, self.filename)
+
+    @staticmethod
+    def is_usable(entry: dict) -> bool:
+        return os.path.isfile(entry['path']) and os.access(entry['path'], os.X_OK)
+
+    def is_fresh(self, entry: dict) -> bool:
+        return time.time() - entry['resolved_at'] < self.ttl
+
+    def driver_path(self) -> str:
+        entry = self.load()
+        if entry and self.is_usable(entry):
+            if not self.is_fresh(entry):
+                self.refresh_in_background()
+            return entry['path']
+
+        print("Resolving Chrome driver...")
+        return self.refresh()
+
+    def refresh(self) -> str:
+        version, path = self._resolver()
+        with self._lock:
+            self.save(version, path)
+        print(f'Chrome driver {version} cached at {path}')
+        return path
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._refresh_thread and self._refresh_thread.is_alive():
+                return
+            self._refresh_thread = threading.Thread(target=self._refresh_quietly, daemon=True)
+            self._refresh_thread.start()
+
+    def join(self, timeout: Optional[float] = None):
+        thread = self._refresh_thread
+        if thread:
+            thread.join(timeout)
+
+    def _refresh_quietly(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f'{bcolors.WARNING}Background Chrome driver refresh failed: {e}{bcolors.ENDC}')
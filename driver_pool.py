@@ -0,0 +1,203 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional
+
+from bcolors import bcolors
+from memory import MemoryMonitor, driver_pid, kill_process_tree, reap_orphans
+from tracing import tracer
+
+
+@dataclass
+class PoolStats:
+    hits: int = 0
+    misses: int = 0
+    recycles: int = 0
+    memory_recycles: int = 0
+    orphans_killed: int = 0
+    startup_seconds: float = 0.0
+
+    @property
+    def launches(self) -> int:
+        return self.misses
+
+
+class DriverPool:
+    """Hands out warm Chrome drivers to worker threads.
+
+    At most ``limit`` drivers are handed out at any time; it starts at ``size``
+    and a ``memory`` monitor moves it between 1 and ``size`` as free memory
+    comes and goes. A driver is quit and replaced after ``max_pages``
+    navigations, straight away if the worker using it raised, or once the
+    monitor marks it for using too much memory. With ``reap`` set, chromedriver
+    and Chrome processes left behind by a crashed run are killed before the
+    first launch.
+    """
+
+    def __init__(self, factory: Callable, size: int = 4, max_pages: int = 20,
+                 memory: Optional[MemoryMonitor] = None, reap: bool = False):
+        if size < 1:
+            raise ValueError('Driver pool size must be at least 1')
+        self.size = size
+        self.limit = size
+        self.max_pages = max_pages
+        self.stats = PoolStats()
+        self.memory = memory
+        self.reap = reap
+        self._factory = factory
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._in_use = 0
+        self._drivers: dict[int, object] = {}
+        self._pages: dict[int, int] = {}
+        self._marked: set[int] = set()
+        self._started = False
+        self._closed = False
+        if memory:
+            memory.attach(self)
+
+    @contextmanager
+    def driver(self) -> Iterator:
+        with tracer.span('driver_acquire'):
+            with self._available:
+                while self._in_use >= self.limit:
+                    self._available.wait()
+                self._in_use += 1
+            try:
+                driver = self._take()
+            except BaseException:
+                self._release()
+                raise
+        try:
+            yield driver
+        except BaseException:
+            self._discard(driver)
+            raise
+        else:
+            self._give_back(driver)
+        finally:
+            self._release()
+
+    def set_limit(self, limit: int):
+        """Hands out at most ``limit`` drivers from now on, quitting idle ones above it."""
+        with self._available:
+            self.limit = max(1, min(self.size, limit))
+            self._available.notify_all()
+            surplus = self._idle.qsize() + self._in_use - self.limit
+        for _ in range(surplus):
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(driver)
+
+    def live_drivers(self) -> list:
+        with self._lock:
+            return list(self._drivers.values())
+
+    def mark_for_recycle(self, driver):
+        with self._lock:
+            if id(driver) in self._drivers:
+                self._marked.add(id(driver))
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        if self.memory:
+            self.memory.stop()
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit(driver)
+
+    def _release(self):
+        with self._available:
+            self._in_use -= 1
+            self._available.notify()
+
+    def _take(self):
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                marked = id(driver) in self._marked
+                if not marked:
+                    self.stats.hits += 1
+            if not marked:
+                return driver
+            self._discard(driver, memory=True)
+
+        self._start()
+        start = time.perf_counter()
+        driver = self._factory()
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.stats.misses += 1
+            self.stats.startup_seconds += elapsed
+            self._drivers[id(driver)] = driver
+            self._pages[id(driver)] = 0
+        return driver
+
+    def _start(self):
+        # once, right before the first Chrome: nothing is watched or reaped for runs that never need one
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        if self.reap:
+            killed = reap_orphans()
+            with self._lock:
+                self.stats.orphans_killed += killed
+        if self.memory:
+            self.memory.start()
+
+    def _give_back(self, driver):
+        with self._lock:
+            pages = self._pages.get(id(driver), 0) + 1
+            self._pages[id(driver)] = pages
+            closed = self._closed
+            marked = id(driver) in self._marked
+            over_limit = self._idle.qsize() + self._in_use > self.limit
+        if marked:
+            self._discard(driver, memory=True)
+        elif closed or over_limit or pages >= self.max_pages:
+            self._discard(driver)
+        else:
+            self._idle.put(driver)
+
+    def _discard(self, driver, memory: bool = False):
+        with self._lock:
+            self.stats.recycles += 1
+            if memory:
+                self.stats.memory_recycles += 1
+        self._quit(driver)
+
+    def _quit(self, driver):
+        with self._lock:
+            self._drivers.pop(id(driver), None)
+            self._pages.pop(id(driver), None)
+            self._marked.discard(id(driver))
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f'{bcolors.WARNING}Failed to quit Chrome driver: {e}{bcolors.ENDC}')
+            # a chromedriver that doesn't answer any more still holds its Chromes
+            pid = driver_pid(driver)
+            if pid is not None:
+                kill_process_tree(pid)
+
+
+def print_pool_stats(stats: PoolStats):
+    total = stats.hits + stats.misses
+    hit_rate = stats.hits / total * 100 if total else 0.0
+    average_startup = stats.startup_seconds / stats.launches if stats.launches else 0.0
+    print(f'\n{bcolors.OKCYAN}Driver pool{bcolors.ENDC}: {stats.hits} hits, {stats.misses} misses '
+          f'({hit_rate:.0f}% hit rate), {stats.recycles} recycled ({stats.memory_recycles} for memory), '
+          f'{stats.startup_seconds:.2f}s spent starting drivers (avg {average_startup:.2f}s)')
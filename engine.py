@@ -0,0 +1,256 @@
+import asyncio
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import AsyncIterator, Callable, Hashable, Iterable, Optional
+
+from adapters import AdapterRegistry
+from async_http import AiohttpClient, ThreadedHttpClient, create_http_client
+from main import RENDER, PageChecker, check_in_browser, create_driver_pool, create_resilient_checker, export_traces, \
+    float_to_str, get_bool_config, get_int_config, page_check_steps, print_outcome, read_host_policies
+from notifier import LINE_NOTIFY_URL, AsyncNotificationDispatcher, Notification, print_notification_results
+from render_wait import RenderTimings
+from resilience import NEW, AsyncResilientChecker, CheckOutcome, print_outcome_summary, untimed
+from resource_policy import ResourcePolicy
+from scheduler import HostPacer, HostPolicy, PageJob
+from snapshot import SnapshotStore
+from static_fetch import Fetch, SiteModes, get_host
+from steps import run_steps_async
+from tracing import print_trace_summary, tracer
+from validator_cache import ValidatorCache
+
+HttpClient = AiohttpClient | ThreadedHttpClient
+
+
+class BrowserSessions:
+    """Runs blocking Selenium work off the event loop, at most ``limit`` at a time.
+
+    Checks waiting for a browser wait on the loop rather than each holding a
+    thread, so thousands of them can be in flight, and the wait doesn't count
+    against their timeout. The work itself runs on ``limit`` threads of its
+    own, with the caller's tracer tags.
+
+    A thread can't be stopped, so work whose caller timed out runs on; a call
+    with the same ``key`` while it does waits for that work instead of
+    loading the page again.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit)
+        self._executor = ThreadPoolExecutor(limit, thread_name_prefix='browser')
+        self._running: dict[Hashable, asyncio.Future] = {}
+
+    async def run(self, key: Hashable, fn: Callable, *args, **kwargs):
+        future = self._running.get(key)
+        if future is None:
+            async with untimed():
+                await self._semaphore.acquire()
+            future = self._running.get(key)
+            if future is not None:
+                # the same work started while this call waited for a browser
+                self._semaphore.release()
+            else:
+                context = contextvars.copy_context()
+                future = self._running[key] = asyncio.get_running_loop().run_in_executor(
+                    self._executor, partial(context.run, fn, *args, **kwargs))
+                future.add_done_callback(partial(self._finished, key))
+        # shielded, so a caller that times out leaves the work to finish for whoever asks next
+        return await asyncio.shield(future)
+
+    def _finished(self, key: Hashable, future: asyncio.Future):
+        self._semaphore.release()
+        if self._running.get(key) is future:
+            del self._running[key]
+        if not future.cancelled():
+            # marks an error nobody awaited any more as seen
+            future.exception()
+
+    def close(self):
+        # a check that timed out may still be running; the driver pool quits its Chrome when it finishes
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class HostLimiter:
+    """HostScheduler's per-site politeness for tasks: the same HostPacer, with waiting done on the loop."""
+
+    def __init__(self, default_policy: HostPolicy, host_policies: Optional[dict[str, HostPolicy]] = None):
+        self.pacer = HostPacer(default_policy, host_policies)
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+
+    def policy_for(self, host: str) -> HostPolicy:
+        return self.pacer.policy_for(host)
+
+    @asynccontextmanager
+    async def slot(self, host: str) -> AsyncIterator[None]:
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._semaphores[host] = asyncio.Semaphore(self.policy_for(host).concurrency)
+        async with semaphore:
+            now = time.monotonic()
+            start = self.pacer.start(host, now)
+            try:
+                if start > now:
+                    await asyncio.sleep(start - now)
+                yield
+            finally:
+                self.pacer.finish(host)
+
+
+async def fetch(http: HttpClient, step: Fetch):
+    with tracer.span(step.span):
+        response = await http.get(step.url, headers=step.headers)
+        if step.raise_for_status:
+            response.raise_for_status()
+    return response
+
+
+async def check_page_async(manga_url: str, xpaths: list[str], http: HttpClient, browser: BrowserSessions,
+                           pool, site_modes: SiteModes, timings: Optional[RenderTimings] = None,
+                           validators: Optional[ValidatorCache] = None, resources: Optional[ResourcePolicy] = None,
+                           adapters: Optional[AdapterRegistry] = None,
+                           snapshots: Optional[SnapshotStore] = None) -> list[float]:
+    """check_page's steps with the HTTP on the event loop and the browser on BrowserSessions."""
+    async def perform(step):
+        if step is RENDER:
+            return await browser.run((manga_url, tuple(xpaths)), check_in_browser, manga_url, xpaths, pool,
+                                     timings=timings, resources=resources, snapshots=snapshots)
+        return await fetch(http, step)
+
+    return await run_steps_async(page_check_steps(manga_url, xpaths, site_modes, validators=validators,
+                                                  adapters=adapters, snapshots=snapshots), perform)
+
+
+class AsyncPageChecker:
+    """A PageChecker's per-site state with the page check itself on the event loop."""
+
+    def __init__(self, checker: PageChecker, http: HttpClient, browser: BrowserSessions):
+        self.checker = checker
+        self.http = http
+        self.browser = browser
+
+    async def check(self, job: PageJob) -> tuple[list[float], float]:
+        checker = self.checker
+        start = time.perf_counter()
+        with tracer.tags(title=', '.join(job.titles), host=job.host), tracer.span('check'):
+            latest_eps = await check_page_async(job.url, job.xpaths, self.http, self.browser, checker.pool,
+                                                checker.site_modes, timings=checker.timings,
+                                                validators=checker.validators, resources=checker.resources,
+                                                adapters=checker.adapters, snapshots=checker.snapshots)
+        return latest_eps, (time.perf_counter() - start) * 1000
+
+
+class AsyncEngine:
+    """Checks watchlist rows as asyncio tasks and yields every outcome as soon as its page is done.
+
+    Rows are read only while fewer than ``max_in_flight`` pages are in flight.
+    Rows sharing a URL that hasn't started yet join its check, so the page is
+    loaded once. Each site's checks go through ``limiter``.
+    """
+
+    def __init__(self, check: Callable, limiter: HostLimiter, max_in_flight: int = 1000):
+        self.check = check
+        self.limiter = limiter
+        self.max_in_flight = max_in_flight
+
+    async def run(self, rows: Iterable[list[str]]) -> AsyncIterator[CheckOutcome]:
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        # one item per page: its outcomes, or what it raised (the checker never should)
+        done: asyncio.Queue = asyncio.Queue()
+        waiting: dict[str, PageJob] = {}
+        tasks: set[asyncio.Task] = set()
+        pending = 0
+
+        async def check(job: PageJob):
+            try:
+                async with self.limiter.slot(job.host):
+                    # from here on rows for this url start a check of their own
+                    if waiting.get(job.url) is job:
+                        del waiting[job.url]
+                    # queued before the page's place is given up, so at most max_in_flight results wait here
+                    done.put_nowait(await self.check(job))
+            except Exception as e:
+                done.put_nowait(e)
+            finally:
+                in_flight.release()
+
+        def outcomes_of(item) -> list[CheckOutcome]:
+            if isinstance(item, Exception):
+                raise item
+            return item
+
+        try:
+            for row_index, row in enumerate(rows):
+                job = waiting.get(row[1])
+                if job is not None:
+                    job.add_row(row_index, row)
+                    continue
+                await in_flight.acquire()
+                job = waiting[row[1]] = PageJob(url=row[1], host=get_host(row[1]))
+                job.add_row(row_index, row)
+                task = asyncio.create_task(check(job))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                pending += 1
+                while not done.empty():
+                    pending -= 1
+                    for outcome in outcomes_of(done.get_nowait()):
+                        yield outcome
+
+            while pending:
+                item = await done.get()
+                pending -= 1
+                for outcome in outcomes_of(item):
+                    yield outcome
+        finally:
+            for task in list(tasks):
+                task.cancel()
+
+
+def create_host_limiter(config: dict[str, str | None]) -> HostLimiter:
+    return HostLimiter(*read_host_policies(config))
+
+
+def create_async_notifier(config: dict[str, str | None], http: HttpClient) -> AsyncNotificationDispatcher:
+    return AsyncNotificationDispatcher(config['LINE_TOKEN'], http,
+                                       url=config.get('NOTIFY_URL') or LINE_NOTIFY_URL,
+                                       workers=get_int_config(config, 'NOTIFY_WORKERS', 2),
+                                       max_retries=get_int_config(config, 'NOTIFY_RETRIES', 4),
+                                       digest=get_bool_config(config, 'NOTIFY_DIGEST', False))
+
+
+async def run_watchlist(config: dict[str, str | None], storage, rows: Iterable[list[str]]) -> list[CheckOutcome]:
+    """Checks every row, storing and notifying each new episode as its page is done. Returns the new ones."""
+    checker = PageChecker(config, create_driver_pool(config))
+    http = create_http_client(connections=get_int_config(config, 'HTTP_CONNECTIONS', 100), session=checker.session)
+    browser = BrowserSessions(checker.pool.size)
+    resilient_checker = create_resilient_checker(config, AsyncPageChecker(checker, http, browser),
+                                                 checker_class=AsyncResilientChecker)
+    engine = AsyncEngine(resilient_checker, create_host_limiter(config),
+                         max_in_flight=get_int_config(config, 'MAX_IN_FLIGHT', 1000))
+    notifier = create_async_notifier(config, http)
+    new_outcomes = []
+    try:
+        async for outcome in engine.run(rows):
+            print_outcome(outcome)
+            if outcome.status == NEW:
+                new_outcomes.append(outcome)
+                storage.update_ep(outcome.title, outcome.url, outcome.latest_ep, outcome.fetch_ms)
+                await notifier.submit(Notification(outcome.title, outcome.url, float_to_str(outcome.current_ep),
+                                                   float_to_str(outcome.latest_ep)))
+    finally:
+        # keep whatever was found even if the run is interrupted half way
+        storage.flush()
+        notification_results = await notifier.close()
+        await http.close()
+        browser.close()
+        checker.close()
+        outcome_summary = resilient_checker.summary()
+        print_outcome_summary(outcome_summary)
+        tracer.add_section('outcomes', outcome_summary)
+        print_notification_results(notification_results)
+        print_trace_summary(tracer)
+        export_traces(config)
+    return new_outcomes
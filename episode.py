@@ -0,0 +1,52 @@
+import re
+
+
+class NoNumberInLinkTextException(Exception):
+    pass
+
+
+class NoElementsException(Exception):
+    pass
+
+
+class InvalidXPathException(Exception):
+    pass
+
+
+NUMBER = r'\d+(?:\.\d+)?'
+# "12-13", "12–13" and "12 ~ 13.5" are ranges, but "12 - 2 Years Later" is an episode followed by its subtitle
+RANGE_END = r'(?:[-–~]|\s*~\s*)(' + NUMBER + ')'
+# "Ch. 12.5", "Chapter 12", "Ep.3", "Episode 3", "#12", "ตอนที่ 12", "第12話"
+KEYWORD = r'(?:\bch(?:apter)?|\bep(?:isode)?|#|ตอนที่|ตอน|第)'
+KEYWORD_NUMBER = re.compile(KEYWORD + r'\s*\.?\s*(' + NUMBER + ')(?:' + RANGE_END + ')?', re.IGNORECASE)
+ANY_NUMBER = re.compile('(' + NUMBER + ')(?:' + RANGE_END + ')?')
+
+
+def ep_of(match: re.Match) -> float:
+    # a range counts as its last episode; "2024-01" is a date, not a range
+    start = float(match.group(1))
+    end = float(match.group(2)) if match.group(2) else None
+    return end if end is not None and end > start else start
+
+
+def parse_ep(link_text: str) -> float | None:
+    if not link_text:
+        return None
+
+    # Prefer the number after a chapter keyword so "Vol. 3 Ch. 25" reads as 25, and a number in the subtitle that
+    # follows it is never read instead
+    match = KEYWORD_NUMBER.search(link_text) or ANY_NUMBER.search(link_text)
+    if match:
+        return ep_of(match)
+    return None
+
+
+def parse_latest_ep(link_texts: list[str]) -> float:
+    if len(link_texts) == 0:
+        raise NoElementsException
+
+    # Look at every match since pages can list episodes in any order
+    eps = [ep for ep in map(parse_ep, link_texts) if ep is not None]
+    if not eps:
+        raise NoNumberInLinkTextException
+    return max(eps)
@@ -1,27 +1,36 @@
 import sys
 import os
-import re
-import csv
+import time
+import asyncio
 import requests
+import threading
+from itertools import chain
 from dotenv import dotenv_values
-from requests import Response
-from selenium.webdriver import Chrome
-from selenium.common.exceptions import NoSuchElementException
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
-from typing import Optional
+from typing import Generator, Optional, TYPE_CHECKING
 from bcolors import bcolors
-from concurrent import futures
-
-
-class NoNumberInLinkTextException(Exception):
-    pass
-
-
-class NoElementsException(Exception):
-    pass
+from functools import partial
+from driver_cache import DriverCache, DriverResolutionException
+from driver_pool import DriverPool, print_pool_stats
+from memory import DRIVER_MARKER, MemoryMonitor, print_memory_stats
+from episode import NoNumberInLinkTextException, NoElementsException, parse_latest_ep
+from static_fetch import STATIC, BROWSER, Fetch, SiteModes, create_session, extract_latest_eps, get_host, perform_fetch
+from snapshot import SnapshotStore
+from validator_cache import ValidatorCache, print_validator_stats
+from adapters import AdapterRegistry, default_registry, parse_site_adapters
+from resource_policy import ResourcePolicy, parse_resource_types, parse_site_allowances, print_resource_stats
+from resilience import FAILED, NEW, ResilientChecker
+from render_wait import RenderTimings, print_render_summary, wait_for_link_texts
+from notifier import LINE_NOTIFY_URL, NotificationDispatcher, send_line_notification
+from storage import open_storage, read_csv, write_csv
+from tracing import tracer
+from scheduler import HostPolicy, HostScheduler, PageJob, parse_host_policies
+from steps import run_steps
+
+if TYPE_CHECKING:
+    # selenium and webdriver_manager are slow to import, so only load them once a Chrome is needed
+    from selenium.webdriver import Chrome
+    # the asyncio engine builds on this module
+    from engine import AsyncPageChecker
 
 
 def load_env(filename: str, config_keys: tuple) -> Optional[dict[str, str | None]]:
@@ -32,62 +41,362 @@ def load_env(filename: str, config_keys: tuple) -> Optional[dict[str, str | None
     return None
 
 
+def get_int_config(config: dict[str, str | None], key: str, default: int) -> int:
+    return int(get_float_config(config, key, default))
+
+
+def get_bool_config(config: dict[str, str | None], key: str, default: bool) -> bool:
+    value = config.get(key)
+    if not value:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def get_float_config(config: dict[str, str | None], key: str, default: float) -> float:
+    value = config.get(key)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        print(f'{bcolors.WARNING}{key}={value} is not a number. Using {default}.{bcolors.ENDC}')
+        return default
+
+
 # def get_latest_ep(manga_url: str, xpath: str, driver: Chrome, render_seconds: int = 3) -> \
 #         Optional[float]:
 def get_latest_ep(parameters_dict, render_seconds: int = 3) -> \
         Optional[float]:
     manga_url: str = parameters_dict["manga_url"]
     xpath: str = parameters_dict["xpath"]
-    driver: Chrome = parameters_dict["driver"]
-
-    driver.get(manga_url)
+    driver: 'Chrome' = parameters_dict["driver"]
+
+    return get_latest_eps(driver, manga_url, [xpath], render_seconds=render_seconds)[0]
+
+
+def get_latest_eps(driver: 'Chrome', manga_url: str, xpaths: list[str], render_seconds: float = 3,
+                   timings: Optional[RenderTimings] = None, resources: Optional[ResourcePolicy] = None) -> \
+        list[float]:
+    host = get_host(manga_url)
+    if timings:
+        render_seconds = timings.timeout_for(host)
+
+    # Render the page once and evaluate every row's XPath against it
+    load_page(driver, manga_url, resources=resources)
+    print(f'Waiting up to {render_seconds:.1f} seconds for the page to render.')
+    start = time.monotonic()
+    deadline = start + render_seconds
+
+    latest_eps = []
+    for xpath in xpaths:
+        with tracer.span('render_wait'):
+            link_texts = wait_for_link_texts(driver, xpath, timeout=max(0.0, deadline - time.monotonic()))
+        if timings and not latest_eps:
+            # a miss counts as the whole wait, so a site rendering slower than its timeout gets longer next time
+            timings.record(host, time.monotonic() - start if link_texts else render_seconds)
+        with tracer.span('parse'):
+            latest_eps.append(parse_latest_ep(link_texts))
+    return latest_eps
+
+
+def load_page(driver: 'Chrome', manga_url: str, resources: Optional[ResourcePolicy] = None):
+    blocked = resources.apply(driver, get_host(manga_url)) if resources else False
+    with tracer.span('page_load'):
+        driver.get(manga_url)
+    if resources:
+        resources.measure(driver, blocked)
 
     title = driver.title
     print(f"{bcolors.HEADER}{title}{bcolors.ENDC}")
 
-    # Wait for page to render
-    print(f'Waiting for {render_seconds} seconds to render the page.')
-    driver.implicitly_wait(render_seconds)
 
-    try:
-        elements = driver.find_elements(By.XPATH, xpath)
-        if len(elements) == 0:
-            driver.close()
-            raise NoElementsException
-    except NoSuchElementException:
-        driver.close()
-        raise
+# the step that has the caller render the page in Chrome and send back what check_in_browser found
+RENDER = object()
+
+
+def page_check_steps(manga_url: str, xpaths: list[str], site_modes: SiteModes,
+                     validators: Optional[ValidatorCache] = None, adapters: Optional[AdapterRegistry] = None,
+                     snapshots: Optional[SnapshotStore] = None) -> Generator[object, object, list[float]]:
+    """The page check without its I/O: yields a Fetch or RENDER and is sent the response or rendered episodes.
+
+    check_page runs it on this thread and engine.check_page_async on the event
+    loop, so both take the same adapter, validator, static and browser steps.
+    """
+    host = get_host(manga_url)
+
+    # A site's API or embedded data gives the episode without parsing or rendering the page
+    adapter = adapters.get(host) if adapters else None
+    if adapter:
+        try:
+            with tracer.span(f'adapter_{adapter.kind}'):
+                response = yield Fetch(adapter.source_url(manga_url))
+                with tracer.span('parse'):
+                    latest_ep = adapter.parse(response.content)
+            return [latest_ep] * len(xpaths)
+        except (NoElementsException, NoNumberInLinkTextException, requests.RequestException, ValueError) as e:
+            print(f'{bcolors.OKCYAN}{adapter.kind} adapter for {host} found nothing ({type(e).__name__}), '
+                  f'falling back to XPath{bcolors.ENDC}')
+
+    # A 304 or an unchanged page region means the episodes from the last full check still stand
+    response = None
+    if validators:
+        entry, headers = validators.conditional_request(manga_url, xpaths)
+        try:
+            response = yield Fetch(manga_url, headers, span='conditional_fetch', raise_for_status=False)
+        except requests.RequestException:
+            response = None
+        cached_eps, response = validators.judge(host, xpaths, entry, response)
+        if cached_eps is not None:
+            print(f'{bcolors.OKBLUE}{manga_url} is unchanged since the last check{bcolors.ENDC}')
+            return cached_eps
+
+    # Try plain HTTP first unless this host is known to need a JavaScript engine
+    if site_modes.get(host) != BROWSER:
+        try:
+            if response is None:
+                response = yield Fetch(manga_url)
+            latest_eps = extract_latest_eps(response.content, xpaths)
+            if snapshots is not None:
+                snapshots.put(manga_url, response.content, STATIC, xpaths, latest_eps)
+            site_modes.remember(host, STATIC)
+            if validators:
+                validators.store(manga_url, host, xpaths, latest_eps, response)
+            return latest_eps
+        except (NoElementsException, NoNumberInLinkTextException, requests.RequestException) as e:
+            print(f'{bcolors.OKCYAN}Static fetch of {manga_url} found nothing ({type(e).__name__}), '
+                  f'falling back to Chrome{bcolors.ENDC}')
+
+    latest_eps = yield RENDER
+    site_modes.remember(host, BROWSER)
+    if validators:
+        validators.store(manga_url, host, xpaths, latest_eps, response)
+    return latest_eps
+
+
+def check_page(manga_url: str, xpaths: list[str], pool: DriverPool, session: requests.Session,
+               site_modes: SiteModes, timings: Optional[RenderTimings] = None,
+               validators: Optional[ValidatorCache] = None, resources: Optional[ResourcePolicy] = None,
+               adapters: Optional[AdapterRegistry] = None, snapshots: Optional[SnapshotStore] = None) -> list[float]:
+    def perform(step):
+        if step is RENDER:
+            return check_in_browser(manga_url, xpaths, pool, timings=timings, resources=resources,
+                                    snapshots=snapshots)
+        return perform_fetch(session, step)
+
+    return run_steps(page_check_steps(manga_url, xpaths, site_modes, validators=validators, adapters=adapters,
+                                      snapshots=snapshots), perform)
+
+
+def check_in_browser(manga_url: str, xpaths: list[str], pool: DriverPool, timings: Optional[RenderTimings] = None,
+                     resources: Optional[ResourcePolicy] = None, snapshots: Optional[SnapshotStore] = None) -> \
+        list[float]:
+    # The pool quits the driver if get_latest_eps raises, so a broken browser is never reused
+    with pool.driver() as driver:
+        try:
+            latest_eps = get_latest_eps(driver, manga_url, xpaths, timings=timings, resources=resources)
+        except (NoElementsException, NoNumberInLinkTextException):
+            # a page the XPath finds nothing on is the one worth having offline to work on the XPath
+            if snapshots is not None:
+                snapshots.put(manga_url, driver.page_source, BROWSER, xpaths)
+            raise
+        if snapshots is not None:
+            snapshots.put(manga_url, driver.page_source, BROWSER, xpaths, latest_eps)
+    return latest_eps
+
+
+def check_manga(row: list[str], pool: DriverPool, session: requests.Session, site_modes: SiteModes) -> \
+        Optional[float]:
+    return check_page(row[1], [row[2]], pool, session, site_modes)[0]
 
-    # need to find both first and last because the order is either ASC or DSC depends on website
-    link_text1 = elements[0].get_attribute('innerText')
-    link_text2 = elements[-1].get_attribute('innerText')
-    driver.close()
 
-    # Use a regular expression to extract only the number
-    match1 = re.search(r'\d+(\.\d+)?', link_text1)
-    match2 = re.search(r'\d+(\.\d+)?', link_text2)
-    if match1 and match2:
-        return max(float(match1.group()), float(match2.group()))
-    if match1:
-        return float(match1.group())
-    if match2:
-        return float(match2.group())
-    else:
-        raise NoNumberInLinkTextException
+def resolve_driver(latest_release_url: str) -> tuple[str, str]:
+    from webdriver_manager.chrome import ChromeDriverManager
 
+    print("Fetching latest Chrome driver version...")
+    driver_version = fetch_driver_version(latest_release_url)
+    if not driver_version:
+        raise DriverResolutionException('Cannot find Chrome Driver version')
+
+    print("Initialising Chrome Service...")
+    driver_path = ChromeDriverManager(latest_release_url=latest_release_url, driver_version=driver_version).install()
+    return driver_version, driver_path
 
-def read_csv(csv_name: str) -> list[list[str]]:
-    # Open the CSV file for reading
-    with open(os.path.join(sys.path[0], csv_name), 'r', newline='') as csv_file:
-        csv_reader = csv.reader(csv_file, delimiter=',')
-        data = [row for row in csv_reader]
-    return data
 
+class ChromeFactory:
+    """Starts headless Chromes, resolving the driver binary on the first launch only.
 
-def write_csv(csv_name: str, data):
-    with open(os.path.join(sys.path[0], csv_name), 'w', newline='') as csv_file:
-        writer = csv.writer(csv_file)
-        writer.writerows(data)
+    A cached driver stops matching Chrome when Chrome updates itself, so a session that fails to start resolves the
+    driver again and retries once instead of failing every page until the cache expires.
+    """
+
+    def __init__(self, driver_cache: DriverCache, page_load_timeout: float = 60):
+        self.driver_cache = driver_cache
+        self.page_load_timeout = page_load_timeout
+        self._driver_path = None
+        self._lock = threading.Lock()
+
+    def __call__(self) -> 'Chrome':
+        from selenium.common.exceptions import SessionNotCreatedException
+
+        with self._lock:
+            if self._driver_path is None:
+                self._driver_path = self.driver_cache.driver_path()
+                print("Chrome Service Driver ready.")
+            driver_path = self._driver_path
+
+        try:
+            driver = self.start(driver_path)
+        except SessionNotCreatedException as e:
+            with self._lock:
+                # another Chrome may have failed the same way and resolved the driver already
+                if self._driver_path == driver_path:
+                    reason = str(e).strip().splitlines()[0] if str(e).strip() else type(e).__name__
+                    print(f'{bcolors.WARNING}Chrome driver at {driver_path} no longer starts Chrome ({reason}), '
+                          f'resolving it again.{bcolors.ENDC}')
+                    self._driver_path = self.driver_cache.refresh()
+                driver_path = self._driver_path
+            driver = self.start(driver_path)
+        # a page that never finishes loading raises instead of holding the driver forever
+        driver.set_page_load_timeout(self.page_load_timeout)
+        return driver
+
+    @staticmethod
+    def start(driver_path: str) -> 'Chrome':
+        from selenium.webdriver import Chrome
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.chrome.service import Service as ChromeService
+
+        options = Options()
+        options.add_argument("--no-sandbox")
+        options.add_argument('--headless=new')
+        options.add_argument("--disable-gpu")
+        # a Service per driver: quitting a driver stops its service, which would take every other driver down with it
+        # the marker lets a later run tell this driver and its Chrome apart from other programs' if they are orphaned
+        service = ChromeService(driver_path, env={**os.environ, DRIVER_MARKER: '1'})
+        return Chrome(service=service, options=options)
+
+
+def create_driver_pool(config: dict[str, str | None]) -> DriverPool:
+    driver_cache = DriverCache(os.path.join(sys.path[0], config.get('DRIVER_CACHE') or 'driver_cache.json'),
+                               resolver=partial(resolve_driver, config['LATEST_RELEASE_URL']),
+                               ttl=get_float_config(config, 'DRIVER_CACHE_TTL', 86400))
+    # Chromes are only started when a page actually needs one
+    return DriverPool(ChromeFactory(driver_cache, page_load_timeout=get_float_config(config, 'PAGE_LOAD_TIMEOUT', 60)),
+                      size=get_int_config(config, 'DRIVER_POOL_SIZE', 4),
+                      max_pages=get_int_config(config, 'DRIVER_MAX_PAGES', 20),
+                      memory=MemoryMonitor(low_mb=get_float_config(config, 'MEMORY_LOW_MB', 512),
+                                           high_mb=get_float_config(config, 'MEMORY_HIGH_MB', 1024),
+                                           driver_max_mb=get_float_config(config, 'DRIVER_MAX_RSS_MB', 1024),
+                                           interval=get_float_config(config, 'MEMORY_POLL_INTERVAL', 2.0)),
+                      reap=get_bool_config(config, 'REAP_ORPHANS', True))
+
+
+def read_host_policies(config: dict[str, str | None]) -> tuple[HostPolicy, dict[str, HostPolicy]]:
+    default_policy = HostPolicy(concurrency=get_int_config(config, 'HOST_CONCURRENCY', 2),
+                                min_interval=get_float_config(config, 'HOST_MIN_INTERVAL', 1.0))
+    return default_policy, parse_host_policies(config.get('HOST_POLICIES'), default_policy)
+
+
+def create_scheduler(config: dict[str, str | None]) -> HostScheduler:
+    default_policy, host_policies = read_host_policies(config)
+    return HostScheduler(max_workers=get_int_config(config, 'MAX_WORKERS', 8),
+                         default_policy=default_policy,
+                         host_policies=host_policies,
+                         max_pending=get_int_config(config, 'MAX_QUEUED_PAGES', 1000))
+
+
+class PageChecker:
+    """The driver pool, HTTP session and per-site state shared by every page check."""
+
+    def __init__(self, config: dict[str, str | None], pool: DriverPool, snapshots: Optional[SnapshotStore] = None):
+        self.pool = pool
+        self.snapshots = snapshots
+        self.session = create_session(pool_size=get_int_config(config, 'MAX_WORKERS', 8))
+        self.site_modes = SiteModes(os.path.join(sys.path[0], config.get('SITE_MODES') or 'site_modes.json'),
+                                    browser_ttl=get_float_config(config, 'SITE_MODE_TTL', 86400))
+        self.timings = RenderTimings(
+            os.path.join(sys.path[0], config.get('RENDER_TIMINGS') or 'render_timings.json'),
+            default_timeout=get_float_config(config, 'RENDER_TIMEOUT', 10.0),
+            min_timeout=get_float_config(config, 'RENDER_TIMEOUT_MIN', 2.0),
+            max_timeout=get_float_config(config, 'RENDER_TIMEOUT_MAX', 30.0))
+        self.validators = None
+        # a recording needs every page itself, not a cached or API answer about it
+        if get_bool_config(config, 'VALIDATOR_CACHE_ENABLED', True) and snapshots is None:
+            self.validators = ValidatorCache(
+                os.path.join(sys.path[0], config.get('VALIDATOR_CACHE') or 'validator_cache.json'),
+                ttl=get_float_config(config, 'VALIDATOR_CACHE_TTL', 21600))
+        self.adapters = None
+        if snapshots is None:
+            self.adapters = parse_site_adapters(config.get('SITE_ADAPTERS'), default_registry())
+        self.resources = ResourcePolicy(blocked=parse_resource_types(config.get('RESOURCE_BLOCK')),
+                                        site_allowances=parse_site_allowances(config.get('RESOURCE_ALLOW')),
+                                        baseline_every=get_int_config(config, 'RESOURCE_BASELINE_EVERY', 10))
+
+    def check(self, job: PageJob) -> tuple[list[float], float]:
+        start = time.perf_counter()
+        with tracer.tags(title=', '.join(job.titles), host=job.host), tracer.span('check'):
+            latest_eps = check_page(job.url, job.xpaths, pool=self.pool, session=self.session,
+                                    site_modes=self.site_modes, timings=self.timings, validators=self.validators,
+                                    resources=self.resources, adapters=self.adapters, snapshots=self.snapshots)
+        return latest_eps, (time.perf_counter() - start) * 1000
+
+    def save(self):
+        self.site_modes.save()
+        self.timings.save()
+        if self.validators:
+            self.validators.save()
+        tracer.add_section('resources', self.resources.report())
+        if self.pool.memory:
+            tracer.add_section('memory', {**self.pool.memory.report(),
+                                          'memory_recycles': self.pool.stats.memory_recycles,
+                                          'orphans_killed': self.pool.stats.orphans_killed})
+
+    def close(self):
+        self.pool.close()
+        self.session.close()
+        self.save()
+        print_pool_stats(self.pool.stats)
+        if self.pool.memory:
+            print_memory_stats(self.pool.memory)
+        print_render_summary(self.timings)
+        if self.validators:
+            print_validator_stats(self.validators)
+        print_resource_stats(self.resources)
+
+
+def create_resilient_checker(config: dict[str, str | None], checker: 'PageChecker | AsyncPageChecker',
+                             checker_class: type[ResilientChecker] = ResilientChecker) -> ResilientChecker:
+    return checker_class(checker.check,
+                         retries=get_int_config(config, 'CHECK_RETRIES', 2),
+                         timeout=get_float_config(config, 'CHECK_TIMEOUT', 120),
+                         backoff=get_float_config(config, 'CHECK_RETRY_BACKOFF', 2.0),
+                         breaker_threshold=get_int_config(config, 'BREAKER_THRESHOLD', 5),
+                         breaker_cooldown=get_float_config(config, 'BREAKER_COOLDOWN', 300))
+
+
+def print_outcome(outcome):
+    if outcome.status == FAILED:
+        print(f'{bcolors.WARNING}{outcome.title} failed after {outcome.attempts} attempts '
+              f'({outcome.reason}): {outcome.error}{bcolors.ENDC}')
+    elif outcome.status == NEW:
+        print(f'{bcolors.OKGREEN}New ep!{bcolors.ENDC} {outcome.title} Ep.{float_to_str(outcome.latest_ep)}')
+
+
+def create_notifier(config: dict[str, str | None]) -> NotificationDispatcher:
+    return NotificationDispatcher(config['LINE_TOKEN'],
+                                  url=config.get('NOTIFY_URL') or LINE_NOTIFY_URL,
+                                  workers=get_int_config(config, 'NOTIFY_WORKERS', 2),
+                                  max_retries=get_int_config(config, 'NOTIFY_RETRIES', 4),
+                                  digest=get_bool_config(config, 'NOTIFY_DIGEST', False))
+
+
+def export_traces(config: dict[str, str | None]):
+    try:
+        tracer.write_json(os.path.join(sys.path[0], config.get('TRACE_REPORT') or 'run_report.json'))
+        if config.get('PROMETHEUS_TEXTFILE'):
+            tracer.write_prometheus(config['PROMETHEUS_TEXTFILE'])
+    except OSError as e:
+        print(f'{bcolors.WARNING}Cannot write run report: {e}{bcolors.ENDC}')
 
 
 def float_to_str(num: float) -> str:
@@ -97,17 +406,6 @@ def float_to_str(num: float) -> str:
     return str(num)
 
 
-def send_line_notification(token: str, current_ep: str, latest_ep: str, manga_name: str, manga_url: str) -> Response:
-    print("Sending Line notification")
-    payload = {
-        'message': f'{manga_name} newer ep.{latest_ep} is out! '
-                   f'Last read Ep.{current_ep} at {manga_url}'}
-    response = requests.post('https://notify-api.line.me/api/notify',
-                             headers={f'Authorization': f'Bearer {token}'}, params=payload)
-
-    return response
-
-
 def fetch_driver_version(latest_release_url: str) -> Optional[str]:
     response = requests.get(latest_release_url)
     if response.status_code == 200:
@@ -127,63 +425,23 @@ def main():
         print(f'{bcolors.WARNING}.env file is invalid. Aborted!{bcolors.ENDC}')
         exit()
 
-    print("Fetching latest Chrome driver version...")
-    driver_version = fetch_driver_version(config['LATEST_RELEASE_URL'])
-    if not driver_version:
-        print(f'{bcolors.WARNING}Cannot find Chrome Driver version. Aborted!{bcolors.ENDC}')
-        exit()
-
     csv_name = config['CSV']
-    new_ep_list = []
 
     try:
-        data = read_csv(csv_name)
-        if not data:
+        # CSV is either a .csv file or an SQLite database (.db/.sqlite)
+        storage = open_storage(csv_name)
+        rows = storage.iter_rows()
+        first_row = next(rows, None)
+        if first_row is None:
             print(f'\n{bcolors.WARNING}No Data In CSV. Abort.{bcolors.ENDC}')
             exit()
     except Exception as e:
         print(f"An error occurred while reading to the CSV file: {e}")
         raise
 
-    options = Options()
-    options.add_argument("--no-sandbox")
-    options.add_argument('--headless=new')
-    options.add_argument("--disable-gpu")
-
-    print("Initialising Chrome Service...")
-    service = ChromeService(ChromeDriverManager(
-        latest_release_url=config['LATEST_RELEASE_URL'],
-        driver_version=driver_version).install())
-    print("Chrome Service Driver ready.")
-
-    #     manga_name = data[i][0]
-    #     manga_url = data[i][1]
-    #     xpath = data[i][2]
-    #     current_ep = float(data[i][3])
-
-    get_latest_ep_params_list = []
-    # start from 1 to skip CSV header
-    for i in range(1, len(data)):
-        # create separate Chrome driver instance
-        driver = Chrome(service=service, options=options)
-        get_latest_ep_params_list.append(
-            {"manga_url": data[i][1], "xpath": data[i][2], "driver": driver})
-
-    with futures.ThreadPoolExecutor() as executor:
-        latest_ep_list = list(executor.map(get_latest_ep, get_latest_ep_params_list))
-
-    send_line_notification_params_list = []
-    for i in range(0, len(latest_ep_list)):
-        if latest_ep_list[i] > float(data[i+1][3]):
-            new_ep_list.append((data[i+1][0], data[i+1][1], float(data[i+1][3]), latest_ep_list[i]))
-            data[i+1][3] = str(latest_ep_list[i])
-            send_line_notification_params_list.append(
-                {"config": config["LINE_TOKEN"], "current_ep": data[i+1][3], "latest_ep": str(latest_ep_list[i]),
-                 "manga_name": data[i+1][0], "manga_url": data[i+1][1]})
-
-    if len(send_line_notification_params_list) > 0:
-        with futures.ThreadPoolExecutor() as executor:
-            executor.map(send_line_notification, send_line_notification_params_list)
+    # the checks run on the asyncio engine, which builds on this module, so it is only imported here
+    from engine import run_watchlist
+    new_outcomes = asyncio.run(run_watchlist(config, storage, chain([first_row], rows)))
 
     # for i in range(1, len(data)):
     #     manga_name = data[i][0]
@@ -217,26 +475,22 @@ def main():
     #     else:
     #         print(f'{bcolors.OKBLUE}No new ep{bcolors.ENDC}')
 
-    if len(new_ep_list) == 0:
+    if not new_outcomes:
+        storage.close()
         print(f'\n{bcolors.OKBLUE}No update to DB.{bcolors.ENDC}')
         exit()
 
-    # Open the same CSV file for writing if there is a new ep
+    # A CSV watchlist is written once here, an SQLite one has already been committed row by row
     try:
-        write_csv(csv_name, data)
+        storage.close()
         print(f"\n{bcolors.OKGREEN}DB updated{bcolors.ENDC}")
     except Exception as e:
         print(f"An error occurred while writing the CSV file: {e}")
         raise
 
-    for i in range(0, len(new_ep_list)):
-        manga_name = new_ep_list[i][0]
-        manga_url = new_ep_list[i][1]
-        current_ep = float_to_str(new_ep_list[i][2])
-        latest_ep = float_to_str(new_ep_list[i][3])
-
-        print(
-            f'{bcolors.OKBLUE}{manga_name}{bcolors.ENDC} is at {manga_url}, last read at Ep.{current_ep}, latest at Ep.{latest_ep}')
+    for outcome in new_outcomes:
+        print(f'{bcolors.OKBLUE}{outcome.title}{bcolors.ENDC} is at {outcome.url}, '
+              f'last read at Ep.{float_to_str(outcome.current_ep)}, latest at Ep.{float_to_str(outcome.latest_ep)}')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,262 @@
+import os
+import signal
+import threading
+from typing import Optional
+
+from bcolors import bcolors
+
+PROC = '/proc'
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+# set in the environment of every chromedriver this tool starts, and inherited by the Chrome processes under it, so
+# orphans of another Selenium user or a desktop Chrome are never taken for ours
+DRIVER_MARKER = 'MANGA_CHECKER_DRIVER'
+
+
+def available_memory_mb(proc: str = PROC) -> Optional[float]:
+    # MemAvailable counts reclaimable page cache, unlike MemFree; None where there is no /proc
+    try:
+        with open(os.path.join(proc, 'meminfo'), 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def process_table(proc: str = PROC) -> dict[int, int]:
+    """pid -> parent pid of every process that can be seen."""
+    table = {}
+    try:
+        names = os.listdir(proc)
+    except OSError:
+        return table
+    for name in names:
+        if not name.isdigit():
+            continue
+        try:
+            with open(os.path.join(proc, name, 'stat'), 'r') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # the command name is in brackets and may itself contain spaces or brackets
+        fields = stat.rsplit(')', 1)[-1].split()
+        if len(fields) > 1:
+            table[int(name)] = int(fields[1])
+    return table
+
+
+def descendants(pid: int, table: dict[int, int]) -> list[int]:
+    children: dict[int, list[int]] = {}
+    for child, parent in table.items():
+        children.setdefault(parent, []).append(child)
+    found = []
+    stack = list(children.get(pid, []))
+    while stack:
+        child = stack.pop()
+        found.append(child)
+        stack += children.get(child, [])
+    return found
+
+
+def rss_mb(pid: int, proc: str = PROC) -> float:
+    try:
+        with open(os.path.join(proc, str(pid), 'statm'), 'r') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE / (1024 * 1024)
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+
+def pss_mb(pid: int, proc: str = PROC) -> float:
+    # PSS splits each shared page between the processes mapping it, so Chrome processes sharing libraries and
+    # shared memory add up to what they really use, where RSS counts those pages once per process
+    try:
+        with open(os.path.join(proc, str(pid), 'smaps_rollup'), 'r') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, IndexError, ValueError):
+        pass
+    # smaps_rollup needs Linux 4.14 and access to the process, RSS is the overestimate left without it
+    return rss_mb(pid, proc)
+
+
+def tree_pss_mb(pid: int, table: dict[int, int], proc: str = PROC) -> float:
+    # chromedriver and every Chrome process under it: browser, renderers, GPU and utility processes
+    return sum(pss_mb(process, proc) for process in [pid] + descendants(pid, table))
+
+
+def command_line(pid: int, proc: str = PROC) -> list[str]:
+    try:
+        with open(os.path.join(proc, str(pid), 'cmdline'), 'rb') as f:
+            return [part.decode(errors='replace') for part in f.read().split(b'\0') if part]
+    except OSError:
+        return []
+
+
+def environment(pid: int, proc: str = PROC) -> dict[str, str]:
+    # only readable for processes of the same user
+    try:
+        with open(os.path.join(proc, str(pid), 'environ'), 'rb') as f:
+            variables = [part.decode(errors='replace') for part in f.read().split(b'\0') if part]
+    except OSError:
+        return {}
+    return dict(variable.split('=', 1) for variable in variables if '=' in variable)
+
+
+def owner_uid(pid: int, proc: str = PROC) -> Optional[int]:
+    try:
+        with open(os.path.join(proc, str(pid), 'status'), 'r') as f:
+            for line in f:
+                if line.startswith('Uid:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def find_orphans(table: dict[int, int], proc: str = PROC, uid: Optional[int] = None) -> list[int]:
+    """chromedriver and Chrome processes this tool started whose parent has died.
+
+    Orphans are adopted by init or by a subreaper such as ``systemd --user``.
+    Only processes carrying ``DRIVER_MARKER`` count, so drivers left behind by
+    other programs of the same user are not touched. Drivers of a running
+    checker (another shard, the daemon) still have their parent and are left
+    alone, as are the renderers under an orphaned Chrome, which go when its
+    tree is killed.
+    """
+    uid = os.getuid() if uid is None else uid
+    orphans = []
+    for pid, parent in table.items():
+        if not is_adopted(parent, proc) or owner_uid(pid, proc) != uid:
+            continue
+        arguments = command_line(pid, proc)
+        if not arguments:
+            continue
+        program = os.path.basename(arguments[0])
+        is_driver_or_browser = program.startswith('chromedriver') or 'chrom' in program.lower()
+        if is_driver_or_browser and DRIVER_MARKER in environment(pid, proc):
+            orphans.append(pid)
+    return orphans
+
+
+def is_adopted(parent: int, proc: str = PROC) -> bool:
+    if parent == 1:
+        return True
+    arguments = command_line(parent, proc)
+    return bool(arguments) and os.path.basename(arguments[0]) == 'systemd'
+
+
+def kill_process_tree(pid: int, table: Optional[dict[int, int]] = None) -> int:
+    table = process_table() if table is None else table
+    killed = 0
+    # children first, so nothing gets re-parented half way through
+    for process in reversed([pid] + descendants(pid, table)):
+        try:
+            os.kill(process, signal.SIGKILL)
+            killed += 1
+        except (ProcessLookupError, PermissionError):
+            pass
+    return killed
+
+
+def reap_orphans() -> int:
+    table = process_table()
+    killed = sum(kill_process_tree(pid, table) for pid in find_orphans(table))
+    if killed:
+        print(f'{bcolors.WARNING}Killed {killed} leftover chromedriver/Chrome processes{bcolors.ENDC}')
+    return killed
+
+
+def driver_pid(driver) -> Optional[int]:
+    # the chromedriver process; Chrome runs under it
+    pid = getattr(getattr(getattr(driver, 'service', None), 'process', None), 'pid', None)
+    return pid if isinstance(pid, int) else None
+
+
+class MemoryMonitor:
+    """Keeps the driver pool inside the memory the machine has.
+
+    Every ``interval`` seconds it reads the available memory and the PSS of each
+    driver's process tree. Below ``low_mb`` available the pool hands out one
+    driver fewer at a time, above ``high_mb`` one more, never over the pool size.
+    A driver whose processes use more than ``driver_max_mb`` is replaced the
+    next time it is given back.
+    """
+
+    def __init__(self, low_mb: float = 512, high_mb: float = 1024, driver_max_mb: float = 1024,
+                 interval: float = 2.0, proc: str = PROC):
+        self.low_mb = low_mb
+        self.high_mb = high_mb
+        self.driver_max_mb = driver_max_mb
+        self.interval = interval
+        self.proc = proc
+        self.peak_pss_mb = 0.0
+        self.min_available_mb: Optional[float] = None
+        self.lowest_limit: Optional[int] = None
+        self.limit_changes = 0
+        self.pool = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def attach(self, pool):
+        self.pool = pool
+
+    def start(self):
+        with self._lock:
+            if self._thread is None and self.interval > 0:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        table = process_table(self.proc)
+        total_pss = pss_mb(os.getpid(), self.proc)
+        for driver in self.pool.live_drivers():
+            pid = driver_pid(driver)
+            if pid is None:
+                continue
+            driver_pss = tree_pss_mb(pid, table, self.proc)
+            total_pss += driver_pss
+            if driver_pss > self.driver_max_mb:
+                self.pool.mark_for_recycle(driver)
+        self.peak_pss_mb = max(self.peak_pss_mb, total_pss)
+
+        available = available_memory_mb(self.proc)
+        if available is None:
+            return
+        self.min_available_mb = available if self.min_available_mb is None else min(self.min_available_mb, available)
+        limit = self.pool.limit
+        if available < self.low_mb and limit > 1:
+            limit -= 1
+        elif available > self.high_mb and limit < self.pool.size:
+            limit += 1
+        if limit != self.pool.limit:
+            self.pool.set_limit(limit)
+            self.limit_changes += 1
+            self.lowest_limit = limit if self.lowest_limit is None else min(self.lowest_limit, limit)
+
+    def report(self) -> dict:
+        return {'peak_pss_mb': round(self.peak_pss_mb, 1),
+                'min_available_mb': None if self.min_available_mb is None else round(self.min_available_mb, 1),
+                'limit_changes': self.limit_changes,
+                'lowest_limit': self.lowest_limit}
+
+
+def print_memory_stats(monitor: MemoryMonitor):
+    report = monitor.report()
+    if not report['peak_pss_mb']:
+        return
+    available = f", lowest available {report['min_available_mb']:.0f}MB" if report['min_available_mb'] else ''
+    throttled = f", drivers throttled to {report['lowest_limit']} at most" if report['lowest_limit'] else ''
+    print(f"{bcolors.OKCYAN}Memory{bcolors.ENDC}: peak PSS {report['peak_pss_mb']:.0f}MB{available}{throttled}")
@@ -0,0 +1,301 @@
+import asyncio
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from functools import partial
+from typing import Generator, Optional
+
+import requests
+from requests import Response
+
+from bcolors import bcolors
+from stats import percentile
+from steps import run_steps, run_steps_async
+from tracing import tracer
+
+LINE_NOTIFY_URL = 'https://notify-api.line.me/api/notify'
+
+SENT = 'sent'
+FAILED = 'failed'
+
+
+@dataclass
+class Notification:
+    manga_name: str
+    manga_url: str
+    current_ep: str
+    latest_ep: str
+
+
+@dataclass
+class NotificationResult:
+    message: str
+    outcome: str
+    status_code: Optional[int]
+    attempts: int
+    latency_ms: float
+    error: Optional[str] = None
+
+
+def format_message(notification: Notification) -> str:
+    return (f'{notification.manga_name} newer ep.{notification.latest_ep} is out! '
+            f'Last read Ep.{notification.current_ep} at {notification.manga_url}')
+
+
+def format_digest(notifications: list[Notification]) -> str:
+    lines = [f'{len(notifications)} new episodes:']
+    lines += [f'- {n.manga_name} ep.{n.latest_ep} (last read Ep.{n.current_ep}) {n.manga_url}' for n in notifications]
+    return '\n'.join(lines)
+
+
+def send_line_notification(token: str, current_ep: str, latest_ep: str, manga_name: str, manga_url: str,
+                           session: Optional[requests.Session] = None, url: str = LINE_NOTIFY_URL) -> Response:
+    print("Sending Line notification")
+    message = format_message(Notification(manga_name, manga_url, current_ep, latest_ep))
+    return post_message(token, message, session=session, url=url)
+
+
+def post_message(token: str, message: str, session: Optional[requests.Session] = None, url: str = LINE_NOTIFY_URL,
+                 timeout: float = 10) -> Response:
+    http = session if session is not None else requests
+    return http.post(url, headers={f'Authorization': f'Bearer {token}'}, params={'message': message},
+                     timeout=timeout)
+
+
+def retry_after_seconds(response: Response) -> Optional[float]:
+    value = response.headers.get('Retry-After')
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return None
+    # LINE Notify reports its hourly budget instead of Retry-After
+    if response.headers.get('X-RateLimit-Remaining') == '0' and response.headers.get('X-RateLimit-Reset'):
+        try:
+            return max(0.0, float(response.headers['X-RateLimit-Reset']) - time.time())
+        except ValueError:
+            return None
+    return None
+
+
+# the step that has the dispatcher post the message and send back the response
+POST = object()
+
+
+@dataclass(frozen=True)
+class Sleep:
+    seconds: float
+
+
+class RateLimit:
+    """The pause a 429 puts on every sender of one dispatcher, until the server says it is fine to go on."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+
+    def remaining(self) -> float:
+        with self._lock:
+            return self._paused_until - time.monotonic()
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def send_steps(message: str, rate_limit: RateLimit, max_retries: int, backoff: float, max_backoff: float) -> \
+        Generator[object, object, NotificationResult]:
+    """One message's send with its retries, as steps: yields POST for the response or a Sleep to wait.
+
+    Both dispatchers run it, one on worker threads and one on the event loop.
+    """
+    start = time.perf_counter()
+    status_code = None
+    error = None
+    for attempt in range(1, max_retries + 2):
+        while (paused := rate_limit.remaining()) > 0:
+            yield Sleep(paused)
+        delay = min(max_backoff, backoff * 2 ** (attempt - 1))
+        try:
+            with tracer.span('notify'):
+                response = yield POST
+        except requests.RequestException as e:
+            error = f'{type(e).__name__}: {e}'
+        else:
+            status_code = response.status_code
+            if response.ok:
+                return NotificationResult(message, SENT, status_code, attempt, (time.perf_counter() - start) * 1000)
+            error = f'{status_code}: {response.text[:200]}'
+            if status_code == 429:
+                retry_after = retry_after_seconds(response)
+                rate_limit.pause(delay if retry_after is None else min(retry_after, max_backoff))
+                continue
+            if status_code < 500:
+                # the request itself is wrong (bad token etc.), retrying won't help
+                break
+        if attempt <= max_retries:
+            yield Sleep(delay)
+    return NotificationResult(message, FAILED, status_code, attempt, (time.perf_counter() - start) * 1000, error)
+
+
+class NotificationDispatcher:
+    """Sends notifications from a bounded queue on a few worker threads sharing one HTTP session.
+
+    Failed sends are retried with exponential backoff. A 429 or an exhausted
+    rate limit pauses every worker until the server says it is fine to go on.
+    With ``digest`` everything submitted is sent as one message on close().
+    """
+
+    def __init__(self, token: str, url: str = LINE_NOTIFY_URL, workers: int = 2, queue_size: int = 100,
+                 max_retries: int = 4, backoff: float = 1.0, max_backoff: float = 60.0, digest: bool = False,
+                 timeout: float = 10):
+        self.token = token
+        self.url = url
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.digest = digest
+        self.timeout = timeout
+        self.results: list[NotificationResult] = []
+        self._session = requests.Session()
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._digest: list[Notification] = []
+        self._lock = threading.Lock()
+        self._rate_limit = RateLimit()
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(0 if digest else workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, notification: Notification):
+        if self.digest:
+            with self._lock:
+                self._digest.append(notification)
+        else:
+            # blocks when the queue is full so a flood of new episodes can't grow memory without bound
+            self._queue.put(format_message(notification))
+
+    def flush(self):
+        if self.digest:
+            with self._lock:
+                pending, self._digest = self._digest, []
+            if pending:
+                self._record(self._send(format_digest(pending)))
+
+    def take_results(self) -> list[NotificationResult]:
+        with self._lock:
+            results, self.results = self.results, []
+        return results
+
+    def close(self) -> list[NotificationResult]:
+        self.flush()
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._session.close()
+        return self.results
+
+    def _work(self):
+        while True:
+            message = self._queue.get()
+            if message is None:
+                return
+            self._record(self._send(message))
+
+    def _record(self, result: NotificationResult):
+        with self._lock:
+            self.results.append(result)
+
+    def _perform(self, message: str, step) -> Optional[Response]:
+        if isinstance(step, Sleep):
+            time.sleep(step.seconds)
+            return None
+        return post_message(self.token, message, session=self._session, url=self.url, timeout=self.timeout)
+
+    def _send(self, message: str) -> NotificationResult:
+        return run_steps(send_steps(message, self._rate_limit, self.max_retries, self.backoff, self.max_backoff),
+                         partial(self._perform, message))
+
+
+class AsyncNotificationDispatcher:
+    """NotificationDispatcher for the asyncio engine: worker tasks on the loop sharing its async HTTP client.
+
+    ``submit`` waits while the queue is full. Retries, backoff and rate limit
+    pauses work as in NotificationDispatcher.
+    """
+
+    def __init__(self, token: str, http, url: str = LINE_NOTIFY_URL, workers: int = 2, queue_size: int = 100,
+                 max_retries: int = 4, backoff: float = 1.0, max_backoff: float = 60.0, digest: bool = False):
+        self.token = token
+        self.http = http
+        self.url = url
+        self.workers = 0 if digest else workers
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.digest = digest
+        self.results: list[NotificationResult] = []
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+        self._digest: list[Notification] = []
+        self._rate_limit = RateLimit()
+
+    async def submit(self, notification: Notification):
+        if self.digest:
+            self._digest.append(notification)
+            return
+        if self._queue is None:
+            # the workers start with the first notification, on the loop that sends it
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        await self._queue.put(format_message(notification))
+
+    async def flush(self):
+        if self.digest and self._digest:
+            pending, self._digest = self._digest, []
+            self.results.append(await self._send(format_digest(pending)))
+
+    async def close(self) -> list[NotificationResult]:
+        await self.flush()
+        if self._queue is not None:
+            for _ in self._tasks:
+                await self._queue.put(None)
+            await asyncio.gather(*self._tasks)
+        return self.results
+
+    async def _work(self):
+        while True:
+            message = await self._queue.get()
+            if message is None:
+                return
+            self.results.append(await self._send(message))
+
+    async def _perform(self, message: str, step):
+        if isinstance(step, Sleep):
+            await asyncio.sleep(step.seconds)
+            return None
+        return await self.http.post(self.url, headers={'Authorization': f'Bearer {self.token}'},
+                                    params={'message': message})
+
+    async def _send(self, message: str) -> NotificationResult:
+        return await run_steps_async(send_steps(message, self._rate_limit, self.max_retries, self.backoff,
+                                                self.max_backoff), partial(self._perform, message))
+
+
+def print_notification_results(results: list[NotificationResult]):
+    if not results:
+        return
+    sent = [result for result in results if result.outcome == SENT]
+    latencies = [result.latency_ms for result in results]
+    print(f'\n{bcolors.OKCYAN}Notifications{bcolors.ENDC}: {len(sent)}/{len(results)} sent, '
+          f'p50 {percentile(latencies, 50):.0f}ms, p95 {percentile(latencies, 95):.0f}ms')
+    for result in results:
+        if result.outcome != SENT:
+            print(f'{bcolors.FAIL}Notification failed after {result.attempts} attempts ({result.error}): '
+                  f'{result.message}{bcolors.ENDC}')
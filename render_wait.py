@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+import time
+
+from bcolors import bcolors
+from episode import InvalidXPathException
+from stats import percentile
+from tracing import tracer
+
+
+# Evaluates the XPath inside the page and returns the text of every match in one WebDriver round trip
+LINK_TEXTS_SCRIPT = """
+const xpath = arguments[0];
+let result;
+try {
+    result = document.evaluate(xpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+} catch (e) {
+    // xpath functions such as string() do not return nodes
+    const value = document.evaluate(xpath, document, null, XPathResult.STRING_TYPE, null).stringValue;
+    return value ? [value] : [];
+}
+const texts = [];
+for (let i = 0; i < result.snapshotLength; i++) {
+    const node = result.snapshotItem(i);
+    texts.push(node.nodeType === Node.ELEMENT_NODE ? node.innerText : node.textContent);
+}
+return texts;
+"""
+
+
+def find_link_texts(driver, xpath: str) -> list[str]:
+    with tracer.span('xpath'):
+        try:
+            return driver.execute_script(LINK_TEXTS_SCRIPT, xpath) or []
+        except Exception as e:
+            # the script only throws when document.evaluate can't parse the XPath, which is the row's fault, not
+            # the browser's; selenium isn't imported here just to compare classes
+            if type(e).__name__ == 'JavascriptException':
+                raise InvalidXPathException(xpath) from e
+            raise
+
+
+def wait_for_link_texts(driver, xpath: str, timeout: float, poll_interval: float = 0.25) -> list[str]:
+    """Poll until ``xpath`` matches and the matched text is the same on two polls in a row.
+
+    Returns the text of every match, or an empty list if nothing matched
+    before ``timeout`` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    previous = None
+    while True:
+        link_texts = find_link_texts(driver, xpath)
+        if link_texts and link_texts == previous:
+            return link_texts
+        previous = link_texts
+        if time.monotonic() >= deadline:
+            return link_texts
+        time.sleep(poll_interval)
+
+
+class RenderTimings:
+    """Rolling per-host render latencies, used to pick the next run's wait timeout."""
+
+    def __init__(self, filename: str | None, default_timeout: float = 10.0, min_timeout: float = 2.0,
+                 max_timeout: float = 30.0, window: int = 50, min_samples: int = 5):
+        self.filename = filename
+        self.default_timeout = default_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: dict[str, list[float]] = {}
+        self._run_samples: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+        if filename and os.path.exists(filename):
+            try:
+                with open(filename, 'r') as f:
+                    self._samples = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f'{bcolors.WARNING}Ignoring unreadable {filename}: {e}{bcolors.ENDC}')
+
+    def timeout_for(self, host: str) -> float:
+        with self._lock:
+            samples = list(self._samples.get(host, []))
+        if len(samples) < self.min_samples:
+            return self.default_timeout
+        # leave twice the usual slow render before giving up on the page
+        return min(self.max_timeout, max(self.min_timeout, percentile(samples, 95) * 2))
+
+    def record(self, host: str, seconds: float):
+        with self._lock:
+            samples = self._samples.setdefault(host, [])
+            samples.append(round(seconds, 3))
+            del samples[:-self.window]
+            self._run_samples.setdefault(host, []).append(seconds)
+
+    def run_summary(self) -> dict[str, tuple[float, float]]:
+        with self._lock:
+            return {host: (percentile(samples, 50), percentile(samples, 95))
+                    for host, samples in sorted(self._run_samples.items())}
+
+    def save(self):
+        if not self.filename:
+            return
+        with self._lock:
+            tmp_name = f'{self.filename}.tmp'
+            with open(tmp_name, 'w') as f:
+                json.dump(self._samples, f, indent=2, sort_keys=True)
+            os.replace(tmp_name, self.filename)
+
+
+def print_render_summary(timings: RenderTimings):
+    summary = timings.run_summary()
+    if not summary:
+        return
+    print(f'\n{bcolors.OKCYAN}Render time per site{bcolors.ENDC}')
+    for host, (p50, p95) in summary.items():
+        print(f'{host}: p50 {p50:.2f}s, p95 {p95:.2f}s, next timeout {timings.timeout_for(host):.1f}s')
@@ -0,0 +1,353 @@
+import asyncio
+import contextvars
+import threading
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Optional
+
+import requests
+from lxml import etree
+
+from bcolors import bcolors
+from episode import InvalidXPathException, NoElementsException, NoNumberInLinkTextException
+from scheduler import PageJob
+
+NEW = 'new'
+UNCHANGED = 'unchanged'
+FAILED = 'failed'
+
+# why a check failed; only the first three say something about the site rather than the title
+TIMEOUT = 'timeout'
+NETWORK = 'network'
+BROWSER_ERROR = 'browser'
+NO_ELEMENTS = 'no_elements'
+NO_NUMBER = 'no_number'
+INVALID_XPATH = 'invalid_xpath'
+CIRCUIT_OPEN = 'circuit_open'
+ERROR = 'error'
+
+HOST_FAILURES = (TIMEOUT, NETWORK, BROWSER_ERROR)
+# the site answered, but this title's page or XPath has no episode in it
+TITLE_FAILURES = (NO_ELEMENTS, NO_NUMBER, INVALID_XPATH)
+
+
+class CheckTimeoutException(Exception):
+    pass
+
+
+@dataclass
+class CheckOutcome:
+    title: str
+    url: str
+    status: str
+    current_ep: float
+    latest_ep: Optional[float] = None
+    reason: Optional[str] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    fetch_ms: Optional[float] = None
+
+
+def failure_reason(error: BaseException) -> str:
+    if isinstance(error, CheckTimeoutException):
+        return TIMEOUT
+    if isinstance(error, NoElementsException):
+        return NO_ELEMENTS
+    if isinstance(error, NoNumberInLinkTextException):
+        return NO_NUMBER
+    if isinstance(error, (InvalidXPathException, etree.XPathError)):
+        return INVALID_XPATH
+    if isinstance(error, requests.RequestException):
+        return NETWORK
+    # selenium is only imported once a Chrome is needed, so don't import it just to compare classes
+    if type(error).__module__.startswith('selenium'):
+        return TIMEOUT if type(error).__name__ == 'TimeoutException' else BROWSER_ERROR
+    return ERROR
+
+
+def call_with_timeout(fn: Callable, timeout: float, *args):
+    """Runs ``fn`` on its own thread and gives up on it after ``timeout`` seconds.
+
+    A Python thread can't be killed, so a check that overruns is left to finish
+    in the background. Page load and HTTP timeouts make sure it eventually does.
+    """
+    result = {}
+
+    def target():
+        try:
+            result['value'] = fn(*args)
+        except BaseException as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise CheckTimeoutException(f'Check did not finish within {timeout:.0f} seconds')
+    if 'error' in result:
+        raise result['error']
+    return result['value']
+
+
+class AttemptTimer:
+    """The timeout of one async attempt: cancels ``task`` once it has run ``timeout`` seconds.
+
+    Time spent inside untimed() is not counted, so an attempt that queued for a
+    browser still gets its whole timeout once it has one.
+    """
+
+    def __init__(self, timeout: float):
+        self.task: Optional[asyncio.Task] = None
+        self.expired = False
+        self._remaining = timeout
+        self._started = 0.0
+        self._handle: Optional[asyncio.TimerHandle] = None
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        self._started = loop.time()
+        self._handle = loop.call_later(self._remaining, self._expire)
+
+    def pause(self) -> bool:
+        if self._handle is None:
+            return False
+        self._handle.cancel()
+        self._handle = None
+        self._remaining -= asyncio.get_running_loop().time() - self._started
+        return True
+
+    def cancel(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _expire(self):
+        self._handle = None
+        self.expired = True
+        self.task.cancel()
+
+
+_attempt_timer: contextvars.ContextVar[Optional[AttemptTimer]] = contextvars.ContextVar('attempt_timer', default=None)
+
+
+@asynccontextmanager
+async def untimed() -> AsyncIterator[None]:
+    """Waiting inside this block doesn't count against the running attempt's timeout."""
+    timer = _attempt_timer.get()
+    paused = timer is not None and timer.task is asyncio.current_task() and timer.pause()
+    try:
+        yield
+    finally:
+        if paused:
+            timer.start()
+
+
+class CircuitBreaker:
+    """Stops sending work to a host after ``threshold`` failures in a row.
+
+    Once ``cooldown`` seconds have passed one check is let through; if it
+    succeeds the host is closed again, otherwise it stays open for another
+    cooldown.
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 300, clock: Callable[[], float] = time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.trips = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_running or self._clock() - self._opened_at < self.cooldown:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_inconclusive(self):
+        # neither closes nor opens the host, but lets the next check be the trial
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or (self._opened_at is None and self.failures >= self.threshold):
+                if self._opened_at is None:
+                    self.trips += 1
+                self._opened_at = self._clock()
+            self._trial_running = False
+
+
+class ResilientChecker:
+    """Wraps a page check so it never raises: every row gets a CheckOutcome.
+
+    Each attempt gets ``timeout`` seconds. Failures that may go away (timeouts,
+    network and browser errors) are retried up to ``retries`` times with
+    exponential backoff, and count against the host's circuit breaker.
+    """
+
+    def __init__(self, check: Callable[[PageJob], tuple[list[float], float]], retries: int = 2,
+                 timeout: float = 120, backoff: float = 2.0, breaker_threshold: int = 5,
+                 breaker_cooldown: float = 300):
+        self.check = check
+        self.retries = retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self.counts: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def breaker_for(self, host: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self.breakers.get(host)
+            if breaker is None:
+                breaker = self.breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+            return breaker
+
+    def __call__(self, job: PageJob) -> list[CheckOutcome]:
+        outcomes = self._attempt(job)
+        self._count(outcomes)
+        return outcomes
+
+    def _attempt(self, job: PageJob) -> list[CheckOutcome]:
+        breaker = self.breaker_for(job.host)
+        attempts = 0
+        while True:
+            if not breaker.allow():
+                return self._failed(job, CIRCUIT_OPEN, f'{job.host} is failing, skipped', attempts)
+            attempts += 1
+            try:
+                latest_eps, fetch_ms = call_with_timeout(self.check, self.timeout, job)
+            except Exception as e:
+                outcomes = self._give_up(job, breaker, e, attempts)
+                if outcomes:
+                    return outcomes
+                time.sleep(self.backoff * 2 ** (attempts - 1))
+                continue
+            return self._succeeded(job, breaker, latest_eps, fetch_ms, attempts)
+
+    def _give_up(self, job: PageJob, breaker: CircuitBreaker, error: Exception, attempts: int) -> \
+            Optional[list[CheckOutcome]]:
+        # the failed outcomes if this error is final, None if the check should be retried
+        reason = failure_reason(error)
+        if reason in TITLE_FAILURES:
+            breaker.record_success()
+            return self._failed(job, reason, f'{type(error).__name__} {error}', attempts)
+        if reason not in HOST_FAILURES:
+            # an unexpected error says nothing about whether the site is up
+            breaker.record_inconclusive()
+            return self._failed(job, reason, f'{type(error).__name__} {error}', attempts)
+        breaker.record_failure()
+        if attempts > self.retries:
+            return self._failed(job, reason, f'{type(error).__name__} {error}', attempts)
+        return None
+
+    @staticmethod
+    def _succeeded(job: PageJob, breaker: CircuitBreaker, latest_eps: list[float], fetch_ms: float,
+                   attempts: int) -> list[CheckOutcome]:
+        breaker.record_success()
+        return [CheckOutcome(title, job.url, NEW if latest_ep > current_ep else UNCHANGED, current_ep,
+                             latest_ep=latest_ep, attempts=attempts, fetch_ms=fetch_ms)
+                for title, current_ep, latest_ep in zip(job.titles, job.current_eps, latest_eps)]
+
+    def _count(self, outcomes: list[CheckOutcome]):
+        with self._lock:
+            for outcome in outcomes:
+                key = outcome.status if outcome.status != FAILED else f'{FAILED}:{outcome.reason}'
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            counts = dict(sorted(self.counts.items()))
+            breakers = sorted(self.breakers.items())
+        return {'counts': counts,
+                'open_circuits': [host for host, breaker in breakers if breaker.is_open],
+                'circuit_trips': {host: breaker.trips for host, breaker in breakers if breaker.trips}}
+
+    @staticmethod
+    def _failed(job: PageJob, reason: str, error: str, attempts: int) -> list[CheckOutcome]:
+        return [CheckOutcome(title, job.url, FAILED, current_ep, reason=reason, error=error, attempts=attempts)
+                for title, current_ep in zip(job.titles, job.current_eps)]
+
+
+class AsyncResilientChecker(ResilientChecker):
+    """ResilientChecker for a coroutine ``check``, used by the asyncio engine.
+
+    An attempt that overruns ``timeout`` is cancelled instead of being left to
+    run on a thread, and backoff waits don't hold a thread either. Waits the
+    check marks as untimed(), such as for a free browser, don't count.
+    """
+
+    async def __call__(self, job: PageJob) -> list[CheckOutcome]:
+        outcomes = await self._attempt_async(job)
+        self._count(outcomes)
+        return outcomes
+
+    async def _attempt_async(self, job: PageJob) -> list[CheckOutcome]:
+        breaker = self.breaker_for(job.host)
+        attempts = 0
+        while True:
+            if not breaker.allow():
+                return self._failed(job, CIRCUIT_OPEN, f'{job.host} is failing, skipped', attempts)
+            attempts += 1
+            try:
+                latest_eps, fetch_ms = await self._timed(job)
+            except Exception as e:
+                outcomes = self._give_up(job, breaker, e, attempts)
+                if outcomes:
+                    return outcomes
+                await asyncio.sleep(self.backoff * 2 ** (attempts - 1))
+                continue
+            return self._succeeded(job, breaker, latest_eps, fetch_ms, attempts)
+
+    async def _timed(self, job: PageJob) -> tuple[list[float], float]:
+        # the check runs as a task of its own so the timer can cancel it without cancelling this one
+        timer = AttemptTimer(self.timeout)
+        token = _attempt_timer.set(timer)
+        try:
+            task = timer.task = asyncio.ensure_future(self.check(job))
+        finally:
+            _attempt_timer.reset(token)
+        timer.start()
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if not timer.expired:
+                raise
+            raise CheckTimeoutException(f'Check did not finish within {self.timeout:.0f} seconds')
+        finally:
+            timer.cancel()
+            task.cancel()
+
+
+def print_outcome_summary(summary: dict):
+    counts = summary['counts']
+    if not counts:
+        return
+    failed = {key.split(':', 1)[1]: count for key, count in counts.items() if key.startswith(f'{FAILED}:')}
+    print(f'\n{bcolors.OKCYAN}Titles checked{bcolors.ENDC}: {counts.get(NEW, 0)} new, '
+          f'{counts.get(UNCHANGED, 0)} unchanged, {sum(failed.values())} failed')
+    if failed:
+        print('Failures: ' + ', '.join(f'{count} {reason}' for reason, count in sorted(failed.items())))
+    if summary['open_circuits']:
+        print(f'{bcolors.WARNING}Skipped while failing: {", ".join(summary["open_circuits"])}{bcolors.ENDC}')
+
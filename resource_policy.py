@@ -0,0 +1,171 @@
+import threading
+from typing import Optional
+
+from bcolors import bcolors
+from stats import percentile
+
+IMAGE = 'image'
+MEDIA = 'media'
+FONT = 'font'
+THIRD_PARTY_SCRIPT = 'third_party_script'
+
+DEFAULT_BLOCKED = frozenset((IMAGE, MEDIA, FONT, THIRD_PARTY_SCRIPT))
+
+
+def _extensions(*extensions: str) -> tuple[str, ...]:
+    # Network.setBlockedURLs only knows '*' wildcards, so match with and without a query string
+    return tuple(pattern for extension in extensions for pattern in (f'*.{extension}', f'*.{extension}?*'))
+
+
+# Chrome's blocked URL patterns can't say "any host but the page's own", so third-party scripts
+# are the ad, analytics and tracking networks manga sites actually load.
+RESOURCE_PATTERNS = {
+    IMAGE: _extensions('jpg', 'jpeg', 'png', 'gif', 'webp', 'avif', 'bmp', 'svg', 'ico'),
+    MEDIA: _extensions('mp4', 'webm', 'ogg', 'mp3', 'm4a', 'm3u8', 'ts'),
+    FONT: _extensions('woff', 'woff2', 'ttf', 'otf', 'eot'),
+    THIRD_PARTY_SCRIPT: ('*googletagmanager.com/*', '*google-analytics.com/*', '*googlesyndication.com/*',
+                         '*doubleclick.net/*', '*adservice.google.com/*', '*connect.facebook.net/*',
+                         '*amazon-adsystem.com/*', '*criteo.com/*', '*criteo.net/*', '*taboola.com/*',
+                         '*outbrain.com/*', '*hotjar.com/*', '*scorecardresearch.com/*', '*popads.net/*',
+                         '*propellerads.com/*', '*adsterra.com/*', '*histats.com/*', '*disqus.com/*'),
+}
+
+# Bytes and load time of the last navigation. Cross-origin resources without Timing-Allow-Origin
+# report a transferSize of 0, so the bytes are a lower bound for both the blocked and full loads.
+PAGE_WEIGHT_SCRIPT = """
+const navigation = performance.getEntriesByType('navigation')[0];
+const resources = performance.getEntriesByType('resource');
+let bytes = navigation ? navigation.transferSize : 0;
+for (const entry of resources) {
+    bytes += entry.transferSize;
+}
+const loadMs = navigation ? (navigation.loadEventEnd || navigation.duration) : 0;
+return {bytes: bytes, load_ms: loadMs, requests: resources.length + 1};
+"""
+
+BLOCKED = 'blocked'
+FULL = 'full'
+
+
+def parse_resource_types(value: Optional[str], default: frozenset = DEFAULT_BLOCKED) -> frozenset:
+    # e.g. "image,font" (comma separated) or "image+font" (inside a site override); "none" blocks nothing
+    if not value:
+        return default
+    types = set()
+    for resource_type in value.replace('+', ',').split(','):
+        resource_type = resource_type.strip().lower()
+        if not resource_type or resource_type == 'none':
+            continue
+        if resource_type not in RESOURCE_PATTERNS:
+            print(f'{bcolors.WARNING}Unknown resource type "{resource_type}". Ignored.{bcolors.ENDC}')
+            continue
+        types.add(resource_type)
+    return frozenset(types)
+
+
+def parse_site_allowances(value: Optional[str]) -> dict[str, frozenset]:
+    # e.g. "mangaplus.shueisha.co.jp:third_party_script,comic-walker.com:image+font" (host:types it needs)
+    allowances = {}
+    if not value:
+        return allowances
+    for entry in value.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        host, _, types = entry.partition(':')
+        if not types:
+            print(f'{bcolors.WARNING}Invalid resource allowance "{entry}". Ignored.{bcolors.ENDC}')
+            continue
+        allowances[host] = parse_resource_types(types, frozenset())
+    return allowances
+
+
+class ResourcePolicy:
+    """Blocks images, media, fonts and ad scripts in Chrome, except what a site is allowed to load.
+
+    The blocked URL patterns are set over the DevTools protocol before every
+    navigation, so pooled drivers can move between sites with different
+    allowances. Every ``baseline_every``-th load of a host is done without
+    blocking, so the report can compare bytes and load time with and without
+    the policy.
+    """
+
+    def __init__(self, blocked: frozenset = DEFAULT_BLOCKED, site_allowances: Optional[dict[str, frozenset]] = None,
+                 baseline_every: int = 10):
+        self.blocked = blocked
+        self.site_allowances = site_allowances or {}
+        self.baseline_every = baseline_every
+        self.samples: dict[str, list[dict]] = {BLOCKED: [], FULL: []}
+        self._loads: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._warned = False
+
+    def blocked_types(self, host: str) -> frozenset:
+        return self.blocked - self.site_allowances.get(host, frozenset())
+
+    def patterns(self, host: str) -> list[str]:
+        return [pattern for resource_type in sorted(self.blocked_types(host))
+                for pattern in RESOURCE_PATTERNS[resource_type]]
+
+    def apply(self, driver, host: str) -> bool:
+        """Sets the patterns for the next navigation and returns whether anything is blocked."""
+        with self._lock:
+            loads = self._loads.get(host, 0) + 1
+            self._loads[host] = loads
+        baseline = self.baseline_every > 0 and loads % self.baseline_every == 0
+        patterns = [] if baseline else self.patterns(host)
+        try:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+        except Exception as e:
+            if not self._warned:
+                self._warned = True
+                print(f'{bcolors.WARNING}Cannot block page resources: {e}{bcolors.ENDC}')
+            return False
+        return bool(patterns)
+
+    def measure(self, driver, blocked: bool):
+        try:
+            weight = driver.execute_script(PAGE_WEIGHT_SCRIPT)
+        except Exception:
+            return
+        if not isinstance(weight, dict):
+            return
+        with self._lock:
+            self.samples[BLOCKED if blocked else FULL].append(
+                {'bytes': int(weight.get('bytes') or 0), 'load_ms': float(weight.get('load_ms') or 0),
+                 'requests': int(weight.get('requests') or 0)})
+
+    def report(self) -> dict:
+        with self._lock:
+            samples = {mode: list(mode_samples) for mode, mode_samples in self.samples.items()}
+        report = {'blocked_types': sorted(self.blocked),
+                  'site_allowances': {host: sorted(types) for host, types in sorted(self.site_allowances.items())}}
+        for mode, mode_samples in samples.items():
+            load_ms = [sample['load_ms'] for sample in mode_samples]
+            report[mode] = {
+                'pages': len(mode_samples),
+                'avg_bytes': round(sum(sample['bytes'] for sample in mode_samples) / len(mode_samples))
+                if mode_samples else 0,
+                'avg_requests': round(sum(sample['requests'] for sample in mode_samples) / len(mode_samples), 1)
+                if mode_samples else 0.0,
+                'p50_load_ms': round(percentile(load_ms, 50), 1),
+                'p95_load_ms': round(percentile(load_ms, 95), 1),
+            }
+        return report
+
+
+def print_resource_stats(policy: ResourcePolicy):
+    report = policy.report()
+    if not report[BLOCKED]['pages'] and not report[FULL]['pages']:
+        return
+    print(f'\n{bcolors.OKCYAN}Page weight{bcolors.ENDC}')
+    for mode, label in ((BLOCKED, 'with blocking'), (FULL, 'without blocking')):
+        stats = report[mode]
+        if stats['pages']:
+            print(f'{label}: {stats["pages"]} pages, avg {stats["avg_bytes"] / 1024:.0f}KiB in '
+                  f'{stats["avg_requests"]} requests, load p50 {stats["p50_load_ms"]:.0f}ms '
+                  f'p95 {stats["p95_load_ms"]:.0f}ms')
+    if report[BLOCKED]['pages'] and report[FULL]['avg_bytes']:
+        saved = 1 - report[BLOCKED]['avg_bytes'] / report[FULL]['avg_bytes']
+        print(f'Blocking saves {saved * 100:.0f}% of the bytes per page')
@@ -0,0 +1,187 @@
+import time
+from collections import deque
+from concurrent import futures
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator
+
+from bcolors import bcolors
+from static_fetch import get_host
+
+
+@dataclass
+class HostPolicy:
+    concurrency: int = 2
+    min_interval: float = 1.0
+
+
+@dataclass
+class PageJob:
+    url: str
+    host: str
+    # every CSV row that points at this url, with the XPath to evaluate for it
+    row_indexes: list[int] = field(default_factory=list)
+    xpaths: list[str] = field(default_factory=list)
+    titles: list[str] = field(default_factory=list)
+    current_eps: list[float] = field(default_factory=list)
+
+    def add_row(self, row_index: int, row: list[str]):
+        self.row_indexes.append(row_index)
+        self.xpaths.append(row[2])
+        self.titles.append(row[0])
+        self.current_eps.append(float(row[3]))
+
+    def merge(self, other: 'PageJob'):
+        self.row_indexes += other.row_indexes
+        self.xpaths += other.xpaths
+        self.titles += other.titles
+        self.current_eps += other.current_eps
+
+
+def group_pages(rows: Iterable[list[str]]) -> list[PageJob]:
+    jobs: dict[str, PageJob] = {}
+    for row_index, row in enumerate(rows):
+        manga_url = row[1]
+        job = jobs.get(manga_url)
+        if job is None:
+            job = jobs[manga_url] = PageJob(url=manga_url, host=get_host(manga_url))
+        job.add_row(row_index, row)
+    return list(jobs.values())
+
+
+def iter_pages(rows: Iterable[list[str]]) -> Iterator[PageJob]:
+    # one job per row without reading ahead; HostScheduler merges rows that share a url while they wait
+    for row_index, row in enumerate(rows):
+        job = PageJob(url=row[1], host=get_host(row[1]))
+        job.add_row(row_index, row)
+        yield job
+
+
+def parse_host_policies(value: str | None, default: HostPolicy) -> dict[str, HostPolicy]:
+    # e.g. "mangaplus.shueisha.co.jp:1:2.5,www.nekopost.net:3:0.5" (host:concurrency:min_interval)
+    policies = {}
+    if not value:
+        return policies
+    for entry in value.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        parts = entry.split(':')
+        try:
+            concurrency = int(parts[1]) if len(parts) > 1 and parts[1] else default.concurrency
+            min_interval = float(parts[2]) if len(parts) > 2 and parts[2] else default.min_interval
+        except ValueError:
+            print(f'{bcolors.WARNING}Invalid host policy "{entry}". Ignored.{bcolors.ENDC}')
+            continue
+        policies[parts[0]] = HostPolicy(concurrency=max(1, concurrency), min_interval=max(0.0, min_interval))
+    return policies
+
+
+class HostPacer:
+    """The per-host politeness HostScheduler and the asyncio engine's HostLimiter both keep.
+
+    A host may have ``concurrency`` requests in flight, each started at least
+    ``min_interval`` seconds after the one before it.
+    """
+
+    def __init__(self, default_policy: HostPolicy, host_policies: dict[str, HostPolicy] | None = None):
+        self.default_policy = default_policy
+        self.host_policies = host_policies or {}
+        self._in_flight: dict[str, int] = {}
+        self._next_start: dict[str, float] = {}
+
+    def policy_for(self, host: str) -> HostPolicy:
+        return self.host_policies.get(host, self.default_policy)
+
+    def ready_at(self, host: str) -> float | None:
+        """When the next request to ``host`` may start, or None while it has all the requests it may have."""
+        if self._in_flight.get(host, 0) >= self.policy_for(host).concurrency:
+            return None
+        return self._next_start.get(host, 0.0)
+
+    def start(self, host: str, now: float) -> float:
+        # the start time is claimed up front, so requests queued behind this one space out after it
+        start = max(now, self._next_start.get(host, 0.0))
+        self._next_start[host] = start + self.policy_for(host).min_interval
+        self._in_flight[host] = self._in_flight.get(host, 0) + 1
+        return start
+
+    def finish(self, host: str):
+        self._in_flight[host] -= 1
+
+
+class HostScheduler:
+    """Runs page jobs on a thread pool while being polite to each host.
+
+    Hosts are served round-robin so one big site does not hold up the rest, but
+    no host gets more than its ``concurrency`` requests in flight or two requests
+    started less than ``min_interval`` seconds apart.
+
+    Jobs are pulled from the iterable as workers free up, so with ``max_pending``
+    set at most that many wait in memory however long the watchlist is. A job
+    whose url is already waiting is merged into it, so the page loads once.
+    """
+
+    def __init__(self, max_workers: int, default_policy: HostPolicy,
+                 host_policies: dict[str, HostPolicy] | None = None, max_pending: int | None = None):
+        self.max_workers = max_workers
+        self.default_policy = default_policy
+        self.host_policies = host_policies or {}
+        self.max_pending = max_pending
+
+    def run(self, jobs: Iterable[PageJob], worker: Callable[[PageJob], object]) -> \
+            Iterator[tuple[PageJob, futures.Future]]:
+        jobs = iter(jobs)
+        exhausted = False
+        pending: dict[str, deque[PageJob]] = {}
+        waiting: dict[str, PageJob] = {}
+        pacer = HostPacer(self.default_policy, self.host_policies)
+        running: dict[futures.Future, PageJob] = {}
+
+        executor = futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while True:
+                while not exhausted and (self.max_pending is None or len(waiting) < self.max_pending):
+                    job = next(jobs, None)
+                    if job is None:
+                        exhausted = True
+                    elif job.url in waiting:
+                        waiting[job.url].merge(job)
+                    else:
+                        waiting[job.url] = job
+                        pending.setdefault(job.host, deque()).append(job)
+                if not pending and not running:
+                    break
+
+                now = time.monotonic()
+                wake_at = None
+                for host in list(pending):
+                    if len(running) >= self.max_workers:
+                        break
+                    ready_at = pacer.ready_at(host)
+                    if ready_at is None:
+                        continue
+                    if now < ready_at:
+                        wake_at = ready_at if wake_at is None else min(wake_at, ready_at)
+                        continue
+
+                    job = pending[host].popleft()
+                    del waiting[job.url]
+                    # move the host to the back of the line so the next free worker goes elsewhere
+                    queue = pending.pop(host)
+                    if queue:
+                        pending[host] = queue
+                    pacer.start(host, now)
+                    running[executor.submit(worker, job)] = job
+
+                timeout = None if wake_at is None else max(0.0, wake_at - time.monotonic())
+                if not running:
+                    time.sleep(timeout or 0.0)
+                    continue
+
+                done, _ = futures.wait(running, timeout=timeout, return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    pacer.finish(job.host)
+                    yield job, future
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,216 @@
+import argparse
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Iterable, Iterator, Optional
+
+from bcolors import bcolors
+from main import PageChecker, create_driver_pool, create_notifier, create_resilient_checker, create_scheduler, \
+    export_traces, float_to_str, get_int_config, load_env, print_outcome
+from notifier import Notification, print_notification_results
+from resilience import FAILED, CheckOutcome, print_outcome_summary
+from scheduler import iter_pages
+from storage import RowKey, open_storage, row_key
+
+# state files each worker writes for itself, so processes never replace each other's
+SHARD_STATE_KEYS = {'SITE_MODES': 'site_modes.json', 'RENDER_TIMINGS': 'render_timings.json',
+                    'VALIDATOR_CACHE': 'validator_cache.json', 'TRACE_REPORT': 'run_report.json'}
+
+
+def shard_of(manga_url: str, shards: int) -> int:
+    # hash the url rather than the title so rows sharing a page stay together and it still loads once;
+    # hashlib because str hashes change between processes
+    digest = hashlib.sha256(manga_url.encode()).digest()
+    return int.from_bytes(digest[:8], 'big') % shards
+
+
+def shard_rows(rows: Iterable[list[str]], shard: int, shards: int) -> Iterator[list[str]]:
+    return (row for row in rows if shard_of(row[1], shards) == shard)
+
+
+def shard_filename(filename: str, shard: int) -> str:
+    root, extension = os.path.splitext(filename)
+    return f'{root}.shard-{shard}{extension}'
+
+
+def shard_config(config: dict[str, str | None], shard: int) -> dict[str, str | None]:
+    config = dict(config)
+    for key, default in SHARD_STATE_KEYS.items():
+        config[key] = shard_filename(config.get(key) or default, shard)
+    return config
+
+
+@dataclass
+class JournalEntry:
+    title: str
+    url: str
+    status: str
+    current_ep: float
+    latest_ep: Optional[float]
+    fetch_ms: Optional[float]
+    checked_at: float
+    shard: int
+    worker: str
+
+
+class ShardJournal:
+    """Append-only JSON lines with every outcome of one worker.
+
+    Each line is flushed as it is written, so a worker that dies only loses the
+    check it was in the middle of. A half written last line is skipped on read.
+    """
+
+    def __init__(self, journal_dir: str, shard: int, shards: int):
+        os.makedirs(journal_dir, exist_ok=True)
+        self.worker = f'{socket.gethostname()}.{os.getpid()}'
+        self.shard = shard
+        self.filename = os.path.join(journal_dir, f'shard-{shard}-of-{shards}.{self.worker}.jsonl')
+        self._file = open(self.filename, 'a')
+
+    def write(self, outcome: CheckOutcome):
+        entry = JournalEntry(outcome.title, outcome.url, outcome.status, outcome.current_ep, outcome.latest_ep,
+                             outcome.fetch_ms, time.time(), self.shard, self.worker)
+        self._file.write(json.dumps(asdict(entry)) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def read_journal(filename: str) -> Iterator[JournalEntry]:
+    with open(filename, 'r') as f:
+        for line in f:
+            try:
+                yield JournalEntry(**json.loads(line))
+            except (ValueError, TypeError):
+                print(f'{bcolors.WARNING}Skipping a broken line in {filename}{bcolors.ENDC}')
+
+
+def journal_files(journal_dir: str) -> list[str]:
+    return sorted(glob.glob(os.path.join(journal_dir, 'shard-*.jsonl')))
+
+
+def run_shard(config: dict[str, str | None], shard: int, shards: int, journal_dir: str) -> int:
+    """Checks this shard's part of the watchlist and journals every outcome. Storage is left to merge()."""
+    config = shard_config(config, shard)
+    storage = open_storage(config['CSV'])
+    checker = PageChecker(config, create_driver_pool(config))
+    resilient_checker = create_resilient_checker(config, checker)
+    scheduler = create_scheduler(config)
+    journal = ShardJournal(journal_dir, shard, shards)
+    checked = 0
+    try:
+        for job, future in scheduler.run(iter_pages(shard_rows(storage.iter_rows(), shard, shards)),
+                                         resilient_checker):
+            for outcome in future.result():
+                print_outcome(outcome)
+                journal.write(outcome)
+                checked += 1
+    finally:
+        journal.close()
+        storage.close()
+        checker.close()
+        print_outcome_summary(resilient_checker.summary())
+        export_traces(config)
+    return checked
+
+
+def merge(storage, journal_dir: str) -> list[Notification]:
+    """Applies every journal in ``journal_dir`` to storage and returns the notifications to send.
+
+    Per row the most recently checked successful result wins, whichever
+    worker or machine wrote it. As in a normal run the stored episode only ever
+    goes up. Merged journals are deleted once storage has them, so only merge
+    after every worker has finished.
+    """
+    filenames = journal_files(journal_dir)
+    winners: dict[RowKey, JournalEntry] = {}
+    for filename in filenames:
+        for entry in read_journal(filename):
+            if entry.status == FAILED or entry.latest_ep is None:
+                continue
+            winner = winners.get((entry.title, entry.url))
+            if winner is None or entry.checked_at >= winner.checked_at:
+                winners[entry.title, entry.url] = entry
+
+    current_eps = {row_key(row): float(row[3]) for row in storage.iter_rows()}
+    notifications = []
+    for key, entry in sorted(winners.items()):
+        current_ep = current_eps.get(key)
+        if current_ep is None or entry.latest_ep <= current_ep:
+            continue
+        storage.update_ep(entry.title, entry.url, entry.latest_ep, entry.fetch_ms)
+        notifications.append(Notification(entry.title, entry.url, float_to_str(current_ep),
+                                          float_to_str(entry.latest_ep)))
+    storage.flush()
+
+    for filename in filenames:
+        os.remove(filename)
+    return notifications
+
+
+def run_workers(config: dict[str, str | None], shards: int, journal_dir: str) -> list[int]:
+    # spawn, not fork: a forked child would inherit the parent's threads and HTTP connections
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=run_shard, args=(config, shard, shards, journal_dir),
+                                 name=f'shard-{shard}') for shard in range(shards)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return [process.exitcode for process in processes]
+
+
+def merge_and_notify(config: dict[str, str | None], journal_dir: str):
+    storage = open_storage(config['CSV'])
+    notifier = create_notifier(config)
+    try:
+        notifications = merge(storage, journal_dir)
+        for notification in notifications:
+            print(f'{bcolors.OKGREEN}New ep!{bcolors.ENDC} {notification.manga_name} Ep.{notification.latest_ep}')
+            notifier.submit(notification)
+    finally:
+        storage.close()
+        print_notification_results(notifier.close())
+    print(f'\n{bcolors.OKGREEN}Merged {len(notifications)} new episodes{bcolors.ENDC}' if notifications else
+          f'\n{bcolors.OKBLUE}No update to DB.{bcolors.ENDC}')
+
+
+def cli():
+    CONFIG_KEYS = ('CSV', 'LATEST_RELEASE_URL', 'LINE_TOKEN')
+
+    parser = argparse.ArgumentParser(description='Check the watchlist in several processes or on several machines.')
+    parser.add_argument('command', choices=('run', 'worker', 'merge'),
+                        help='run: start every shard here and merge; worker: check one shard; merge: apply journals')
+    parser.add_argument('--shards', type=int, help='number of shards [SHARDS or one per CPU]')
+    parser.add_argument('--shard', type=int, help='which shard a worker checks, from 0')
+    args = parser.parse_args()
+
+    config = load_env(filename=os.path.join(sys.path[0], '.env'), config_keys=CONFIG_KEYS)
+    if not config:
+        print(f'{bcolors.WARNING}.env file is invalid. Aborted!{bcolors.ENDC}')
+        exit()
+    shards = args.shards or get_int_config(config, 'SHARDS', os.cpu_count() or 1)
+    journal_dir = os.path.join(sys.path[0], config.get('JOURNAL_DIR') or 'journal')
+
+    if args.command == 'worker':
+        if args.shard is None or not 0 <= args.shard < shards:
+            parser.error(f'worker needs --shard between 0 and {shards - 1}')
+        run_shard(config, args.shard, shards, journal_dir)
+        return
+    if args.command == 'run':
+        failed = [shard for shard, exitcode in enumerate(run_workers(config, shards, journal_dir)) if exitcode]
+        if failed:
+            # whatever they journalled before failing is still merged
+            print(f'{bcolors.WARNING}Shards {failed} exited with an error{bcolors.ENDC}')
+    merge_and_notify(config, journal_dir)
+
+
+if __name__ == '__main__':
+    cli()
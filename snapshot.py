@@ -0,0 +1,230 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sys
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional
+
+from lxml import etree, html
+
+from bcolors import bcolors
+from resilience import failure_reason
+from scheduler import PageJob, group_pages, iter_pages
+from static_fetch import extract_latest_eps
+from storage import open_storage
+
+NO_SNAPSHOT = 'no_snapshot'
+
+
+class SnapshotStore:
+    """Pages as a check saw them, to run extraction against later without a browser or network.
+
+    Each page is gzipped under the sha256 of its content in ``objects/``, so a
+    page that hasn't changed between recordings, or is shared by several URLs,
+    is stored once. ``index.json`` maps every URL to its latest snapshot, how
+    it was fetched and the episode each XPath gave when it was recorded.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.index_filename = os.path.join(directory, 'index.json')
+        self._index: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        if os.path.exists(self.index_filename):
+            try:
+                with open(self.index_filename, 'r') as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f'{bcolors.WARNING}Ignoring unreadable {self.index_filename}: {e}{bcolors.ENDC}')
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.directory, 'objects', digest[:2], f'{digest[2:]}.html.gz')
+
+    def put(self, url: str, content: str | bytes, source: str, xpaths: list[str],
+            latest_eps: Optional[list[float]] = None) -> str:
+        if isinstance(content, str):
+            content = content.encode()
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_name = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with gzip.open(tmp_name, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_name, path)
+        eps = dict(zip(xpaths, latest_eps)) if latest_eps is not None else {}
+        with self._lock:
+            self._index[url] = {'digest': digest, 'source': source, 'recorded_at': time.time(), 'latest_eps': eps}
+            self._dirty = True
+        return digest
+
+    def entry(self, url: str) -> Optional[dict]:
+        with self._lock:
+            return self._index.get(url)
+
+    def read(self, digest: str) -> bytes:
+        with gzip.open(self.object_path(digest), 'rb') as f:
+            return f.read()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_name = f'{self.index_filename}.tmp'
+            with open(tmp_name, 'w') as f:
+                json.dump(self._index, f, indent=2, sort_keys=True)
+            os.replace(tmp_name, self.index_filename)
+            self._dirty = False
+
+    def prune(self) -> int:
+        """Deletes the pages no URL points at any more."""
+        with self._lock:
+            referenced = {entry['digest'] for entry in self._index.values()}
+        removed = 0
+        for root, _, filenames in os.walk(os.path.join(self.directory, 'objects')):
+            for filename in filenames:
+                digest = os.path.basename(root) + filename.split('.')[0]
+                if digest not in referenced:
+                    os.remove(os.path.join(root, filename))
+                    removed += 1
+        return removed
+
+
+@dataclass
+class ReplayResult:
+    title: str
+    url: str
+    recorded_ep: Optional[float]
+    latest_ep: Optional[float]
+    reason: Optional[str] = None
+
+    @property
+    def changed(self) -> bool:
+        return self.latest_ep != self.recorded_ep
+
+
+def replay_page(filename: str, entry: dict, job: PageJob) -> list[ReplayResult]:
+    """Runs each row's XPath of one page against its recorded copy, parsing the page once."""
+    try:
+        with gzip.open(filename, 'rb') as f:
+            tree = html.fromstring(f.read())
+    except (OSError, etree.ParserError) as e:
+        return [ReplayResult(title, job.url, entry['latest_eps'].get(xpath), None, failure_reason(e))
+                for title, xpath in zip(job.titles, job.xpaths)]
+    results = []
+    # one XPath at a time, so a row that finds nothing doesn't hide the others on the page
+    for title, xpath in zip(job.titles, job.xpaths):
+        recorded_ep = entry['latest_eps'].get(xpath)
+        try:
+            results.append(ReplayResult(title, job.url, recorded_ep, extract_latest_eps(tree, [xpath])[0]))
+        except Exception as e:
+            results.append(ReplayResult(title, job.url, recorded_ep, None, failure_reason(e)))
+    return results
+
+
+def replay(store: SnapshotStore, rows: Iterable[list[str]], workers: int = 1) -> Iterator[ReplayResult]:
+    """Extraction for every row against the recorded pages, with ``workers`` processes sharing the pages."""
+    pages = []
+    for job in group_pages(rows):
+        entry = store.entry(job.url)
+        if entry is None:
+            for title in job.titles:
+                yield ReplayResult(title, job.url, None, None, NO_SNAPSHOT)
+        else:
+            pages.append((store.object_path(entry['digest']), entry, job))
+
+    if workers <= 1 or not pages:
+        for page in pages:
+            yield from replay_page(*page)
+        return
+    # parsing is CPU bound, so only processes make it faster; spawn for the same reason as shard mode
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        for results in executor.map(replay_page, *zip(*pages), chunksize=max(1, len(pages) // (workers * 8))):
+            yield from results
+
+
+def print_replay_result(result: ReplayResult):
+    if result.reason == NO_SNAPSHOT:
+        print(f'{bcolors.WARNING}{result.title}: no snapshot of {result.url}{bcolors.ENDC}')
+    elif result.reason:
+        print(f'{bcolors.FAIL}{result.title}: {result.reason}{bcolors.ENDC} (recorded Ep.{result.recorded_ep})')
+    elif result.changed:
+        print(f'{bcolors.WARNING}{result.title}: Ep.{result.latest_ep}, recorded Ep.{result.recorded_ep}'
+              f'{bcolors.ENDC}')
+
+
+def record(config: dict[str, str | None], store: SnapshotStore) -> int:
+    # main imports this module, so its pipeline is only imported once a recording starts
+    from main import PageChecker, create_driver_pool, create_resilient_checker, create_scheduler, print_outcome
+
+    storage = open_storage(config['CSV'])
+    checker = PageChecker(config, create_driver_pool(config), snapshots=store)
+    resilient_checker = create_resilient_checker(config, checker)
+    checked = 0
+    try:
+        for job, future in create_scheduler(config).run(iter_pages(storage.iter_rows()), resilient_checker):
+            for outcome in future.result():
+                print_outcome(outcome)
+                checked += 1
+    finally:
+        storage.close()
+        checker.close()
+        store.save()
+    return checked
+
+
+def cli():
+    CONFIG_KEYS = ('CSV', 'LATEST_RELEASE_URL', 'LINE_TOKEN')
+
+    parser = argparse.ArgumentParser(description='Record watchlist pages, then run extraction against them offline.')
+    parser.add_argument('command', choices=('record', 'replay', 'prune'),
+                        help='record: check every page and keep it; replay: extract from the kept pages; '
+                             'prune: delete pages no URL uses')
+    parser.add_argument('--csv', help='watchlist to replay, e.g. one with edited XPaths [CSV]')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='processes replaying pages [one per CPU]')
+    args = parser.parse_args()
+
+    from main import load_env
+
+    config = load_env(filename=os.path.join(sys.path[0], '.env'), config_keys=CONFIG_KEYS)
+    if not config:
+        print(f'{bcolors.WARNING}.env file is invalid. Aborted!{bcolors.ENDC}')
+        exit()
+    store = SnapshotStore(os.path.join(sys.path[0], config.get('SNAPSHOT_DIR') or 'snapshots'))
+
+    if args.command == 'record':
+        checked = record(config, store)
+        print(f'\n{bcolors.OKGREEN}Recorded {len(store)} pages for {checked} titles{bcolors.ENDC}')
+    elif args.command == 'prune':
+        print(f'Removed {store.prune()} unused pages')
+    else:
+        storage = open_storage(args.csv or config['CSV'])
+        start = time.perf_counter()
+        try:
+            results = list(replay(store, storage.iter_rows(), workers=args.workers))
+        finally:
+            storage.close()
+        elapsed = time.perf_counter() - start
+        for result in results:
+            print_replay_result(result)
+        changed = sum(result.changed for result in results)
+        print(f'\n{bcolors.OKCYAN}Replay{bcolors.ENDC}: {len(results)} titles in {elapsed:.2f}s '
+              f'({len(results) / elapsed if elapsed else 0:.0f}/s), {changed} differ from the recording')
+        if changed:
+            exit(1)
+
+
+if __name__ == '__main__':
+    cli()
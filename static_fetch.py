@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlparse
+
+import requests
+from lxml import html
+from requests.adapters import HTTPAdapter
+
+from bcolors import bcolors
+from episode import parse_latest_ep
+from tracing import tracer
+
+STATIC = 'static'
+BROWSER = 'browser'
+
+USER_AGENT = ('Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) '
+              'Chrome/120.0.0.0 Safari/537.36')
+
+
+def create_session(pool_size: int = 10) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = USER_AGENT
+    return session
+
+
+def get_host(url: str) -> str:
+    return urlparse(url).hostname or ''
+
+
+def evaluate_xpath(page: str | bytes | html.HtmlElement, xpath: str) -> list[str]:
+    tree = page if isinstance(page, html.HtmlElement) else html.fromstring(page)
+    result = tree.xpath(xpath)
+    if not isinstance(result, list):
+        # xpath functions such as string() or count() return a single value
+        result = [result]
+
+    link_texts = []
+    for node in result:
+        if isinstance(node, html.HtmlElement):
+            link_texts.append(node.text_content().strip())
+        else:
+            link_texts.append(str(node).strip())
+    return link_texts
+
+
+@dataclass(frozen=True)
+class Fetch:
+    """A GET a page check asks for, done by whichever HTTP client runs the check."""
+    url: str
+    headers: Optional[dict] = None
+    span: str = 'http_fetch'
+    raise_for_status: bool = True
+
+
+def perform_fetch(session: requests.Session, fetch: Fetch, timeout: int = 10) -> requests.Response:
+    with tracer.span(fetch.span):
+        response = session.get(fetch.url, headers=fetch.headers, timeout=timeout)
+        if fetch.raise_for_status:
+            response.raise_for_status()
+    return response
+
+
+def fetch_page(session: requests.Session, manga_url: str, timeout: int = 10) -> requests.Response:
+    return perform_fetch(session, Fetch(manga_url), timeout=timeout)
+
+
+def extract_latest_eps(page: str | bytes | html.HtmlElement, xpaths: list[str]) -> list[float]:
+    """Runs every XPath against one page and parses each result, as the static fetch and snapshot replay do."""
+    latest_eps = []
+    with tracer.span('xpath'):
+        tree = page if isinstance(page, html.HtmlElement) else html.fromstring(page)
+        link_texts_list = [evaluate_xpath(tree, xpath) for xpath in xpaths]
+    for link_texts in link_texts_list:
+        with tracer.span('parse'):
+            latest_eps.append(parse_latest_ep(link_texts))
+    return latest_eps
+
+
+def get_latest_eps_static(session: requests.Session, manga_url: str, xpaths: list[str], timeout: int = 10,
+                          response: Optional[requests.Response] = None) -> list[float]:
+    # a response that was already fetched (e.g. by the validator cache) is reused instead of fetching again
+    if response is None:
+        response = fetch_page(session, manga_url, timeout=timeout)
+    return extract_latest_eps(response.content, xpaths)
+
+
+def get_latest_ep_static(session: requests.Session, manga_url: str, xpath: str, timeout: int = 10) -> float:
+    return get_latest_eps_static(session, manga_url, [xpath], timeout=timeout)[0]
+
+
+class SiteModes:
+    """Remembers per host whether the static fetch or the browser found the episode.
+
+    A host is only sent straight to the browser for ``browser_ttl`` seconds;
+    after that the static fetch is tried again, since one title's page may
+    have needed Chrome while the rest of the site doesn't.
+    """
+
+    def __init__(self, filename: str, browser_ttl: float = 86400):
+        self.filename = filename
+        self.browser_ttl = browser_ttl
+        self._modes: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        if os.path.exists(filename):
+            try:
+                with open(filename, 'r') as f:
+                    # files from before the modes expired hold the bare mode, which counts as long expired
+                    self._modes = {host: entry if isinstance(entry, dict) else {'mode': entry, 'since': 0.0}
+                                   for host, entry in json.load(f).items()}
+            except (OSError, ValueError, AttributeError) as e:
+                print(f'{bcolors.WARNING}Ignoring unreadable {filename}: {e}{bcolors.ENDC}')
+
+    def _expired(self, entry: dict) -> bool:
+        return entry['mode'] == BROWSER and time.time() - entry['since'] >= self.browser_ttl
+
+    def get(self, host: str) -> Optional[str]:
+        with self._lock:
+            entry = self._modes.get(host)
+        if entry is None or self._expired(entry):
+            return None
+        return entry['mode']
+
+    def remember(self, host: str, mode: str):
+        with self._lock:
+            entry = self._modes.get(host)
+            # confirming a mode keeps its age, so a browser host is still re-probed once its ttl is up
+            if entry is None or entry['mode'] != mode or self._expired(entry):
+                self._modes[host] = {'mode': mode, 'since': time.time()}
+                self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp_name = f'{self.filename}.tmp'
+            with open(tmp_name, 'w') as f:
+                json.dump(self._modes, f, indent=2, sort_keys=True)
+            os.replace(tmp_name, self.filename)
+            self._dirty = False
@@ -0,0 +1,10 @@
+import math
+
+
+def percentile(values: list[float], pct: float) -> float:
+    # nearest-rank percentile, good enough for latency summaries
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
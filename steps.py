@@ -0,0 +1,42 @@
+from typing import Awaitable, Callable, Generator, TypeVar
+
+Result = TypeVar('Result')
+
+
+def run_steps(steps: Generator[object, object, Result], perform: Callable[[object], object]) -> Result:
+    """Runs logic written as a generator of I/O steps: each step it yields is done by ``perform``.
+
+    The step's result is sent back in, or what it raised is thrown in, so the
+    same generator runs on threads here and on the event loop in
+    run_steps_async.
+    """
+    try:
+        step = next(steps)
+        while True:
+            try:
+                result = perform(step)
+            except Exception as e:
+                step = steps.throw(e)
+            else:
+                step = steps.send(result)
+    except StopIteration as stop:
+        return stop.value
+    finally:
+        steps.close()
+
+
+async def run_steps_async(steps: Generator[object, object, Result],
+                          perform: Callable[[object], Awaitable[object]]) -> Result:
+    try:
+        step = next(steps)
+        while True:
+            try:
+                result = await perform(step)
+            except Exception as e:
+                step = steps.throw(e)
+            else:
+                step = steps.send(result)
+    except StopIteration as stop:
+        return stop.value
+    finally:
+        steps.close()
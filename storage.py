@@ -0,0 +1,228 @@
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+from tracing import tracer
+
+HEADER = ['name', 'url', 'xpath', 'latest_ep']
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+# a title can be on the watchlist once per site, so a row is known by both
+RowKey = tuple[str, str]
+
+
+def row_key(row: list[str]) -> RowKey:
+    return row[0], row[1]
+
+
+def read_csv(csv_name: str) -> list[list[str]]:
+    # Open the CSV file for reading
+    with open(os.path.join(sys.path[0], csv_name), 'r', newline='') as csv_file:
+        csv_reader = csv.reader(csv_file, delimiter=',')
+        data = [row for row in csv_reader]
+    return data
+
+
+def write_csv(csv_name: str, data):
+    # Write to a temporary file first so a crash never leaves a half written watchlist
+    path = os.path.join(sys.path[0], csv_name)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerows(data)
+    os.replace(tmp_path, path)
+
+
+def utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+class CsvStorage:
+    """The original CSV watchlist. Results are kept in memory and written once by flush()."""
+
+    def __init__(self, csv_name: str):
+        self.csv_name = csv_name
+        self._header = HEADER
+        self._rows: list[list[str]] = []
+        self._positions: dict[RowKey, list[int]] = {}
+        self._dirty = False
+
+    def read_rows(self) -> list[list[str]]:
+        return list(self.iter_rows())
+
+    def iter_rows(self) -> Iterator[list[str]]:
+        # the whole file is rewritten by flush(), so the rows are kept, but each one is handed out as soon as it's read
+        self._rows = []
+        self._positions = {}
+        with open(os.path.join(sys.path[0], self.csv_name), 'r', newline='') as csv_file:
+            csv_reader = csv.reader(csv_file, delimiter=',')
+            self._header = next(csv_reader, self._header)
+            for row in csv_reader:
+                if row:
+                    self._positions.setdefault(row_key(row), []).append(len(self._rows))
+                self._rows.append(row)
+                yield list(row)
+
+    def update_ep(self, name: str, url: str, latest_ep: float, fetch_ms: Optional[float] = None):
+        for position in self._positions.get((name, url), []):
+            self._rows[position][3] = str(latest_ep)
+            self._dirty = True
+
+    def history(self, name: str, url: str) -> list[tuple[float, str, Optional[float]]]:
+        # a CSV watchlist only knows the latest episode
+        return []
+
+    def flush(self):
+        if self._dirty:
+            with tracer.span('storage_write'):
+                write_csv(self.csv_name, [self._header] + self._rows)
+            self._dirty = False
+
+    def close(self):
+        self.flush()
+
+
+class SqliteStorage:
+    """Watchlist in SQLite. Every update is committed straight away and logged in the history table."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS watchlist (
+        name TEXT NOT NULL,
+        url TEXT NOT NULL,
+        xpath TEXT NOT NULL,
+        latest_ep REAL NOT NULL,
+        updated_at TEXT,
+        PRIMARY KEY (name, url)
+    );
+    CREATE INDEX IF NOT EXISTS watchlist_url ON watchlist (url);
+    CREATE TABLE IF NOT EXISTS history (
+        id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL,
+        episode REAL NOT NULL,
+        detected_at TEXT NOT NULL,
+        fetch_ms REAL,
+        url TEXT
+    );
+    CREATE INDEX IF NOT EXISTS history_title ON history (title, detected_at);
+    """
+
+    # databases from before a title could be on several sites were keyed by name alone
+    MIGRATE_WATCHLIST = """
+    BEGIN;
+    DROP INDEX IF EXISTS watchlist_url;
+    ALTER TABLE watchlist RENAME TO watchlist_by_name;
+    {schema}
+    INSERT INTO watchlist (name, url, xpath, latest_ep, updated_at)
+        SELECT name, url, xpath, latest_ep, updated_at FROM watchlist_by_name ORDER BY rowid;
+    DROP TABLE watchlist_by_name;
+    COMMIT;
+    """
+
+    def __init__(self, filename: str):
+        self.filename = os.path.join(sys.path[0], filename)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.filename, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._migrate()
+        self._connection.executescript(self.SCHEMA)
+
+    def _migrate(self):
+        watchlist_keys = {name for _, name, _, _, _, pk in self._connection.execute('PRAGMA table_info(watchlist)')
+                          if pk}
+        if watchlist_keys == {'name'}:
+            self._connection.executescript(self.MIGRATE_WATCHLIST.format(schema=self.SCHEMA))
+        history_columns = {name for _, name, *_ in self._connection.execute('PRAGMA table_info(history)')}
+        if history_columns and 'url' not in history_columns:
+            # older detections keep no url and are counted for the title on any site
+            self._connection.execute('ALTER TABLE history ADD COLUMN url TEXT')
+            self._connection.commit()
+
+    def read_rows(self) -> list[list[str]]:
+        with self._lock:
+            cursor = self._connection.execute('SELECT name, url, xpath, latest_ep FROM watchlist ORDER BY rowid')
+            return [[name, url, xpath, str(latest_ep)] for name, url, xpath, latest_ep in cursor]
+
+    def iter_rows(self, batch_size: int = 500) -> Iterator[list[str]]:
+        # one short query per batch, so updates committed in between neither block nor get blocked by the scan
+        last_rowid = 0
+        while True:
+            with self._lock:
+                batch = self._connection.execute(
+                    'SELECT rowid, name, url, xpath, latest_ep FROM watchlist WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                    (last_rowid, batch_size)).fetchall()
+            if not batch:
+                return
+            for rowid, name, url, xpath, latest_ep in batch:
+                yield [name, url, xpath, str(latest_ep)]
+            last_rowid = batch[-1][0]
+
+    def update_ep(self, name: str, url: str, latest_ep: float, fetch_ms: Optional[float] = None):
+        now = utc_now()
+        with tracer.span('storage_write'), self._lock, self._connection:
+            self._connection.execute('UPDATE watchlist SET latest_ep = ?, updated_at = ? WHERE name = ? AND url = ?',
+                                     (latest_ep, now, name, url))
+            self._connection.execute(
+                'INSERT INTO history (title, url, episode, detected_at, fetch_ms) VALUES (?, ?, ?, ?, ?)',
+                (name, url, latest_ep, now, fetch_ms))
+
+    def history(self, name: str, url: str) -> list[tuple[float, str, Optional[float]]]:
+        with self._lock:
+            cursor = self._connection.execute(
+                'SELECT episode, detected_at, fetch_ms FROM history WHERE title = ? AND (url = ? OR url IS NULL) '
+                'ORDER BY detected_at, id', (name, url))
+            return cursor.fetchall()
+
+    def import_csv(self, csv_name: str) -> int:
+        data = read_csv(csv_name)
+        rows = [(row[0], row[1], row[2], float(row[3])) for row in data[1:] if row]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT INTO watchlist (name, url, xpath, latest_ep) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (name, url) DO UPDATE SET xpath = excluded.xpath, '
+                'latest_ep = MAX(watchlist.latest_ep, excluded.latest_ep)', rows)
+        return len(rows)
+
+    def export_csv(self, csv_name: str) -> int:
+        rows = self.read_rows()
+        write_csv(csv_name, [HEADER] + rows)
+        return len(rows)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def open_storage(name: str) -> CsvStorage | SqliteStorage:
+    if name.lower().endswith(SQLITE_EXTENSIONS):
+        return SqliteStorage(name)
+    return CsvStorage(name)
+
+
+def cli():
+    parser = argparse.ArgumentParser(description='Copy a watchlist between CSV and SQLite.')
+    parser.add_argument('command', choices=('import', 'export'))
+    parser.add_argument('csv', help='CSV file to import from or export to')
+    parser.add_argument('db', help='SQLite database file')
+    args = parser.parse_args()
+
+    storage = SqliteStorage(args.db)
+    try:
+        if args.command == 'import':
+            print(f'Imported {storage.import_csv(args.csv)} titles into {args.db}')
+        else:
+            print(f'Exported {storage.export_csv(args.csv)} titles to {args.csv}')
+    finally:
+        storage.close()
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,19 @@
+import unittest
+from http.server import BaseHTTPRequestHandler
+
+from bench.site_server import LocalServer
+
+
+class LocalServerTestCase(unittest.TestCase):
+    """Serves ``handler`` on a loopback port at ``base_url`` while the class's tests run."""
+
+    handler: type[BaseHTTPRequestHandler]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(cls.handler).start()
+        cls.base_url = cls.server.base_url
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
@@ -1,17 +1,23 @@
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, ANY
+import io
 import os
 import csv
+import tempfile
+from contextlib import redirect_stdout
 from selenium.common import NoSuchElementException
 from selenium.webdriver import Chrome
-from selenium.webdriver.remote.webelement import WebElement
 from selenium.webdriver.chrome.service import Service as ChromeService
 from selenium.webdriver.chrome.options import Options
 from webdriver_manager.chrome import ChromeDriverManager
 
 from bcolors import bcolors
+from bench.site_server import StandInConfig, StandInSites, latest_ep
 from main import load_env, fetch_driver_version, get_latest_ep, read_csv, write_csv, send_line_notification,  main, \
-    NoNumberInLinkTextException, NoElementsException
+    check_manga, get_latest_eps, NoNumberInLinkTextException, NoElementsException
+from driver_pool import DriverPool
+from render_wait import RenderTimings
+from static_fetch import STATIC, BROWSER
 
 
 class MyTest(unittest.TestCase):
@@ -125,11 +131,7 @@ class MyTest(unittest.TestCase):
         # Mocking the driver and its methods
         mock_driver = MagicMock(spec=Chrome)
         mock_driver.title = "Manga Title"
-        mock_element1 = MagicMock(spec=WebElement)
-        mock_element1.get_attribute.return_value = "Chapter 1.5"
-        mock_element2 = MagicMock(spec=WebElement)
-        mock_element2.get_attribute.return_value = "Chapter 2.0"
-        mock_driver.find_elements.return_value = [mock_element1, mock_element2]
+        mock_driver.execute_script.return_value = ["Chapter 1.5", "Chapter 2.0"]
 
         get_latest_ep_parameters = {"manga_url": "https://example.com", "xpath": "//xpath", "driver": mock_driver}
 
@@ -140,11 +142,7 @@ class MyTest(unittest.TestCase):
         # Mocking the driver and its methods
         mock_driver = MagicMock(spec=Chrome)
         mock_driver.title = "Manga Title"
-        mock_element1 = MagicMock(spec=WebElement)
-        mock_element1.get_attribute.return_value = "Chapter 2.0"
-        mock_element2 = MagicMock(spec=WebElement)
-        mock_element2.get_attribute.return_value = "Chapter 1.5"
-        mock_driver.find_elements.return_value = [mock_element1, mock_element2]
+        mock_driver.execute_script.return_value = ["Chapter 2.0", "Chapter 1.5"]
 
         get_latest_ep_parameters = {"manga_url": "https://example.com", "xpath": "//xpath", "driver": mock_driver}
 
@@ -153,7 +151,7 @@ class MyTest(unittest.TestCase):
 
     def test_no_elements(self):
         mock_driver = MagicMock(spec=Chrome)
-        mock_driver.find_elements.return_value = []
+        mock_driver.execute_script.return_value = []
 
         get_latest_ep_parameters = {"manga_url": "https://example.com", "xpath": "//xpath", "driver": mock_driver}
 
@@ -162,24 +160,89 @@ class MyTest(unittest.TestCase):
 
     def test_no_number_in_link_text(self):
         mock_driver = MagicMock(spec=Chrome)
-        mock_element = MagicMock(spec=WebElement)
-        mock_element.get_attribute.return_value = "Chapter No Number"
-        mock_driver.find_elements.return_value = [mock_element]
+        mock_driver.execute_script.return_value = ["Chapter No Number"]
 
         get_latest_ep_parameters = {"manga_url": "https://example.com", "xpath": "//xpath", "driver": mock_driver}
 
         with self.assertRaises(NoNumberInLinkTextException):
             get_latest_ep(parameters_dict=get_latest_ep_parameters)
 
+    def test_unsorted_elements(self):
+        mock_driver = MagicMock(spec=Chrome)
+        mock_driver.execute_script.return_value = ["Ch. 11", "Ch. 12.5", "Ch. 10", "Ch. 3-4"]
+
+        get_latest_ep_parameters = {"manga_url": "https://example.com", "xpath": "//xpath", "driver": mock_driver}
+
+        result = get_latest_ep(parameters_dict=get_latest_ep_parameters)
+        self.assertEqual(result, 12.5)
+        mock_driver.execute_script.assert_called_with(ANY, "//xpath")
+
     def test_selenium_no_such_element_exception(self):
         mock_driver = MagicMock(spec=Chrome)
-        mock_driver.find_elements.side_effect = NoSuchElementException
+        mock_driver.execute_script.side_effect = NoSuchElementException
 
         get_latest_ep_parameters = {"manga_url": "https://example.com", "xpath": "//xpath", "driver": mock_driver}
 
         with self.assertRaises(NoSuchElementException):
             get_latest_ep(parameters_dict=get_latest_ep_parameters)
 
+    @patch('main.get_latest_eps')
+    @patch('main.extract_latest_eps')
+    def test_check_manga_static_hit(self, mock_static, mock_get_latest_ep):
+        mock_static.return_value = [3.0]
+        pool = DriverPool(MagicMock(), size=1)
+        site_modes = MagicMock(get=MagicMock(return_value=None))
+
+        result = check_manga(['Manga', 'http://manga.com/1', '//a', '1'], pool, MagicMock(), site_modes)
+
+        self.assertEqual(result, 3.0)
+        mock_get_latest_ep.assert_not_called()
+        site_modes.remember.assert_called_once_with('manga.com', STATIC)
+
+    @patch('main.get_latest_eps')
+    @patch('main.extract_latest_eps')
+    def test_check_manga_falls_back_to_browser(self, mock_static, mock_get_latest_ep):
+        mock_static.side_effect = NoElementsException
+        mock_get_latest_ep.return_value = [4.0]
+        pool = DriverPool(MagicMock(), size=1)
+        site_modes = MagicMock(get=MagicMock(return_value=None))
+
+        result = check_manga(['Manga', 'http://manga.com/1', '//a', '1'], pool, MagicMock(), site_modes)
+
+        self.assertEqual(result, 4.0)
+        site_modes.remember.assert_called_once_with('manga.com', BROWSER)
+
+    @patch('main.get_latest_eps')
+    @patch('main.extract_latest_eps')
+    def test_check_manga_skips_static_for_browser_hosts(self, mock_static, mock_get_latest_ep):
+        mock_get_latest_ep.return_value = [4.0]
+        pool = DriverPool(MagicMock(), size=1)
+        site_modes = MagicMock(get=MagicMock(return_value=BROWSER))
+
+        check_manga(['Manga', 'http://manga.com/1', '//a', '1'], pool, MagicMock(), site_modes)
+
+        mock_static.assert_not_called()
+
+    def test_get_latest_eps_renders_once(self):
+        mock_driver = MagicMock(spec=Chrome)
+        mock_driver.execute_script.side_effect = lambda script, xpath: ["Chapter 7"] if xpath == "//a" else ["Vol. 2"]
+
+        result = get_latest_eps(mock_driver, "https://example.com", ["//a", "//span"])
+
+        self.assertEqual(result, [7.0, 2.0])
+        mock_driver.get.assert_called_once_with("https://example.com")
+
+    @patch('main.wait_for_link_texts')
+    def test_get_latest_eps_render_miss_raises_the_timeout(self, mock_wait):
+        mock_wait.return_value = []
+        timings = RenderTimings(None, default_timeout=4, max_timeout=30, min_samples=1)
+
+        for _ in range(2):
+            with self.assertRaises(NoElementsException):
+                get_latest_eps(MagicMock(spec=Chrome), "https://example.com", ["//a"], timings=timings)
+
+        self.assertEqual(timings.timeout_for('example.com'), 16)
+
     @unittest.skip("skip test no new ep")
     @patch('main.write_csv')
     @patch('main.send_line_notification')
@@ -264,5 +327,29 @@ class MyTest(unittest.TestCase):
             self.assertEqual(printed_line, expected_line)
 
 
+class MainTest(unittest.TestCase):
+    def test_main_stores_and_reports_new_eps(self):
+        with StandInSites(StandInConfig()) as sites, tempfile.TemporaryDirectory() as tmp_dir:
+            csv_name = os.path.join(tmp_dir, 'watchlist.csv')
+            write_csv(csv_name, [['name', 'url', 'xpath', 'latest_ep'],
+                                 ['New', sites.url('nekopost', 1), '//a/h2', '30'],
+                                 ['Same', sites.url('nekopost', 2), '//a/h2', str(latest_ep(2))]])
+            config = {'CSV': csv_name, 'LATEST_RELEASE_URL': 'http://127.0.0.1:9/unused', 'LINE_TOKEN': 'TOKEN',
+                      'NOTIFY_URL': f"{sites.base_urls['nekopost']}/notify", 'NOTIFY_RETRIES': '0',
+                      'HOST_MIN_INTERVAL': '0', 'VALIDATOR_CACHE_ENABLED': 'false', 'MEMORY_POLL_INTERVAL': '0',
+                      'REAP_ORPHANS': 'false',
+                      **{key: os.path.join(tmp_dir, filename) for key, filename in (
+                          ('SITE_MODES', 'site_modes.json'), ('RENDER_TIMINGS', 'render_timings.json'),
+                          ('DRIVER_CACHE', 'driver_cache.json'), ('TRACE_REPORT', 'run_report.json'))}}
+            output = io.StringIO()
+
+            with patch('main.load_env', return_value=config), redirect_stdout(output):
+                main()
+
+            self.assertEqual([row[3] for row in read_csv(csv_name)[1:]], [f'{latest_ep(1)}.0', str(latest_ep(2))])
+            self.assertIn(f'New{bcolors.ENDC} is at {sites.url("nekopost", 1)}, last read at Ep.30, '
+                          f'latest at Ep.{latest_ep(1)}', output.getvalue())
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,132 @@
+import os
+import unittest
+from functools import partial
+from http.server import BaseHTTPRequestHandler
+from unittest.mock import MagicMock
+
+from adapters import AdapterRegistry, EmbeddedDataAdapter, JsonApiAdapter, RssAdapter, SiteAdapter, \
+    default_registry, mangaplus_endpoint, nekopost_endpoint, parse_site_adapters
+from local_server import LocalServerTestCase
+from main import check_page
+from static_fetch import SiteModes, create_session
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# path on the stand-in server -> (fixture, content type)
+ROUTES = {
+    '/api/title_detailV3': ('mangaplus_title_detail.json', 'application/json'),
+    '/frontAPI/getProjectInfo/9133': ('nekopost_project_info.json', 'application/json'),
+    '/series/next': ('next_data.html', 'text/html'),
+    '/series/json-ld': ('json_ld.html', 'text/html'),
+    '/series/feed': ('feed.rss', 'application/rss+xml'),
+}
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == '/plain' or path.startswith('/plain/'):
+            body, content_type = b'<html><body><a>Ep. 3</a></body></html>', 'text/html'
+        elif path in ROUTES:
+            fixture, content_type = ROUTES[path]
+            with open(os.path.join(FIXTURES, fixture), 'rb') as f:
+                body = f.read()
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class AdaptersTest(LocalServerTestCase):
+    handler = FixtureHandler
+
+    def setUp(self):
+        self.session = create_session()
+
+    def tearDown(self):
+        self.session.close()
+
+    def latest_ep(self, adapter, manga_url: str) -> float:
+        # an adapter that finds nothing falls back to the XPath, which only finds "Ep. 3" on the /plain pages
+        pool = MagicMock()
+        latest_eps = check_page(manga_url, ['//a'], pool, self.session,
+                                SiteModes(os.path.join(FIXTURES, 'site_modes.json')),
+                                adapters=AdapterRegistry((adapter,)))
+        pool.driver.assert_not_called()
+        return latest_eps[0]
+
+    def test_mangaplus_api(self):
+        adapter = JsonApiAdapter(('127.0.0.1',), partial(mangaplus_endpoint, api_base=self.base_url),
+                                 keys=('name',), within='chapterId')
+
+        self.assertEqual(self.latest_ep(adapter, f'{self.base_url}/plain/titles/100020'), 1125)
+
+    def test_nekopost_api(self):
+        adapter = JsonApiAdapter(('127.0.0.1',), partial(nekopost_endpoint, api_base=self.base_url),
+                                 keys=('chapterNo',))
+
+        self.assertEqual(self.latest_ep(adapter, f'{self.base_url}/plain/manga/9133'), 201)
+
+    def test_next_data_and_json_ld(self):
+        adapter = EmbeddedDataAdapter(('127.0.0.1',))
+
+        self.assertEqual(self.latest_ep(adapter, f'{self.base_url}/series/next'), 57)
+        self.assertEqual(self.latest_ep(adapter, f'{self.base_url}/series/json-ld'), 12)
+        self.assertEqual(self.latest_ep(adapter, f'{self.base_url}/plain'), 3.0)
+
+    def test_rss(self):
+        adapter = RssAdapter(('127.0.0.1',))
+        not_a_feed = RssAdapter(('127.0.0.1',), feed=lambda manga_url: f'{self.base_url}/series/next')
+
+        self.assertEqual(self.latest_ep(adapter, f'{self.base_url}/series/feed'), 88)
+        self.assertEqual(self.latest_ep(not_a_feed, f'{self.base_url}/plain'), 3.0)
+
+    def test_adapter_must_parse(self):
+        with self.assertRaises(TypeError):
+            SiteAdapter(('127.0.0.1',))
+
+    def test_endpoint_needs_a_title_url(self):
+        self.assertIsNone(mangaplus_endpoint('https://mangaplus.shueisha.co.jp/updates'))
+        self.assertEqual(nekopost_endpoint('https://www.nekopost.net/manga/9133'),
+                         'https://api.osemocphoto.com/frontAPI/getProjectInfo/9133')
+
+    def test_parse_site_adapters(self):
+        registry = parse_site_adapters('a.com:embedded, b.com:rss, mangaplus.shueisha.co.jp:xpath, c.com:bad',
+                                       default_registry())
+
+        self.assertIsInstance(registry.get('a.com'), EmbeddedDataAdapter)
+        self.assertIsInstance(registry.get('b.com'), RssAdapter)
+        self.assertIsNone(registry.get('mangaplus.shueisha.co.jp'))
+        self.assertIsInstance(registry.get('www.nekopost.net'), JsonApiAdapter)
+        self.assertIsNone(registry.get('c.com'))
+
+    def test_check_page_uses_adapter_before_the_page(self):
+        pool = MagicMock()
+        registry = AdapterRegistry((EmbeddedDataAdapter(('127.0.0.1',)),))
+
+        latest_eps = check_page(f'{self.base_url}/series/next', ['//a', '//b'], pool, self.session,
+                                SiteModes(os.path.join(FIXTURES, 'site_modes.json')), adapters=registry)
+
+        self.assertEqual(latest_eps, [57, 57])
+        pool.driver.assert_not_called()
+
+    def test_check_page_falls_back_to_xpath(self):
+        pool = MagicMock()
+        registry = AdapterRegistry((RssAdapter(('127.0.0.1',)),))
+
+        latest_eps = check_page(f'{self.base_url}/plain', ['//a'], pool, self.session, SiteModes(os.path.join(FIXTURES, 'site_modes.json')),
+                                adapters=registry)
+
+        self.assertEqual(latest_eps, [3.0])
+        pool.driver.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import subprocess
+import sys
+import unittest
+from unittest.mock import patch
+
+from bench.run_bench import PeakMemory, run_mode
+from main import PageChecker
+from bench.site_server import StandInConfig, StandInSites, generate_watchlist, latest_ep
+from static_fetch import create_session, get_latest_ep_static
+
+
+class BenchTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.sites = StandInSites(StandInConfig(episodes=5)).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.sites.stop()
+
+    def test_static_shapes_match_their_xpath(self):
+        rows = generate_watchlist(self.sites, 3, shapes=('nekopost', 'comicwalker'))
+        with create_session() as session:
+            for title_id, row in enumerate(rows):
+                self.assertEqual(get_latest_ep_static(session, row[1], row[2]), latest_ep(title_id))
+
+    def test_run_mode_reports_latency_and_errors(self):
+        # the SPA shape has no episodes without a browser, so it counts as an error in static mode
+        rows = generate_watchlist(self.sites, 6)
+        result = run_mode('static', rows, workers=4)
+
+        self.assertEqual(result['titles'], 6)
+        self.assertEqual(result['ok'], 4)
+        self.assertEqual(result['errors'], 2)
+        self.assertGreater(result['titles_per_second'], 0)
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertGreater(result['peak_pss_mb'], 0)
+
+    def test_peak_memory_counts_running_child_processes(self):
+        with PeakMemory(interval=0.05) as before:
+            pass
+        # a child holding 100MB, like a Chrome would, while the benchmark is still running
+        child = subprocess.Popen([sys.executable, '-c', 'import sys, time; b = bytearray(100 * 2 ** 20); '
+                                  'b[::4096] = b"x" * len(b[::4096]); print(flush=True); time.sleep(5)'],
+                                 stdout=subprocess.PIPE)
+        try:
+            child.stdout.readline()
+            with PeakMemory(interval=0.05) as during:
+                pass
+        finally:
+            child.kill()
+            child.wait()
+
+        self.assertGreater(during.peak_mb - before.peak_mb, 80)
+
+    def test_checker_modes_close_their_checker(self):
+        rows = generate_watchlist(self.sites, 4, shapes=('nekopost', 'comicwalker'))
+        with patch.object(PageChecker, 'close', autospec=True, side_effect=PageChecker.close) as close:
+            result = run_mode('auto', rows, workers=2)
+
+        self.assertEqual(result['ok'], 4)
+        close.assert_called_once()
+
+    def test_engine_mode_runs_the_async_engine(self):
+        # plain HTML shapes only, so no page falls back to Chrome
+        rows = generate_watchlist(self.sites, 6, shapes=('nekopost', 'comicwalker'))
+        result = run_mode('engine', rows, workers=4)
+
+        self.assertEqual((result['titles'], result['ok'], result['errors']), (6, 6, 0))
+        self.assertGreater(result['p50_ms'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+
+from daemon import TitleSchedule, release_times
+
+DAY = 86400
+
+
+class TitleScheduleTest(unittest.TestCase):
+    def test_pop_due_in_order(self):
+        schedule = TitleSchedule(min_interval=60, max_interval=DAY)
+        schedule.add('B', [], due=20)
+        schedule.add('A', [], due=10)
+        schedule.add('C', [], due=99)
+
+        self.assertEqual(schedule.pop_due(50), ['A', 'B'])
+        self.assertEqual(schedule.next_due(), 99)
+        self.assertNotIn('A', schedule)
+
+    def test_backoff_after_misses(self):
+        schedule = TitleSchedule(min_interval=60, max_interval=200, backoff=2)
+        schedule.add('A', [], due=0)
+        schedule.pop_due(0)
+
+        schedule.record('A', new_ep=False, now=0)
+        self.assertEqual(schedule.next_due(), 120)
+        schedule.pop_due(120)
+        schedule.record('A', new_ep=False, now=120)
+        self.assertEqual(schedule.next_due(), 320)
+
+        schedule.pop_due(320)
+        schedule.record('A', new_ep=True, now=320)
+        self.assertEqual(schedule.next_due(), 380)
+
+    def test_waits_for_usual_release_gap(self):
+        schedule = TitleSchedule(min_interval=3600, max_interval=DAY)
+        # weekly releases, the last one a day ago
+        schedule.add('Weekly', [0, 7 * DAY, 14 * DAY], due=0)
+
+        self.assertAlmostEqual(schedule.next_delay('Weekly', now=15 * DAY), 14 * DAY + 6.3 * DAY - 15 * DAY)
+        # overdue titles go back to the normal polling interval
+        self.assertEqual(schedule.next_delay('Weekly', now=30 * DAY), 3600)
+
+    def test_removed_titles_are_skipped(self):
+        schedule = TitleSchedule(min_interval=60, max_interval=DAY)
+        schedule.add('A', [], due=0)
+        schedule.remove('A')
+
+        self.assertEqual(schedule.pop_due(100), [])
+        self.assertIsNone(schedule.next_due())
+
+    def test_release_times(self):
+        history = [(1.0, '1970-01-01T00:00:10+00:00', None), (2.0, '1970-01-02T00:00:00+00:00', 5.0)]
+        self.assertEqual(release_times(history), [10.0, DAY])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import json
+import os
+import stat
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from selenium.common.exceptions import SessionNotCreatedException
+
+from driver_cache import DriverCache
+from main import ChromeFactory
+
+
+class CachedDriverTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp_dir.name, 'driver_cache.json')
+        self.driver_path = os.path.join(self.tmp_dir.name, 'chromedriver')
+        with open(self.driver_path, 'w') as f:
+            f.write('#!/bin/sh\n')
+        os.chmod(self.driver_path, os.stat(self.driver_path).st_mode | stat.S_IXUSR)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_entry(self, path: str, age: float):
+        with open(self.filename, 'w') as f:
+            json.dump({'version': '1.0', 'path': path, 'resolved_at': time.time() - age}, f)
+
+
+class DriverCacheTest(CachedDriverTestCase):
+    def test_resolves_and_caches_when_missing(self):
+        resolver = MagicMock(return_value=('2.0', self.driver_path))
+        cache = DriverCache(self.filename, resolver, ttl=60)
+
+        self.assertEqual(cache.driver_path(), self.driver_path)
+        self.assertEqual(cache.load()['version'], '2.0')
+        resolver.assert_called_once_with()
+
+    def test_fresh_entry_skips_network(self):
+        self.write_entry(self.driver_path, age=10)
+        resolver = MagicMock()
+        cache = DriverCache(self.filename, resolver, ttl=60)
+
+        self.assertEqual(cache.driver_path(), self.driver_path)
+        resolver.assert_not_called()
+
+    def test_stale_entry_is_used_and_refreshed_in_background(self):
+        self.write_entry(self.driver_path, age=120)
+        resolver = MagicMock(return_value=('2.0', self.driver_path))
+        cache = DriverCache(self.filename, resolver, ttl=60)
+
+        self.assertEqual(cache.driver_path(), self.driver_path)
+        cache.join(timeout=5)
+        resolver.assert_called_once_with()
+        self.assertEqual(cache.load()['version'], '2.0')
+
+    def test_missing_binary_is_resolved_again(self):
+        self.write_entry(os.path.join(self.tmp_dir.name, 'gone'), age=10)
+        resolver = MagicMock(return_value=('2.0', self.driver_path))
+        cache = DriverCache(self.filename, resolver, ttl=60)
+
+        self.assertEqual(cache.driver_path(), self.driver_path)
+        resolver.assert_called_once_with()
+
+
+class ChromeFactoryTest(CachedDriverTestCase):
+    def setUp(self):
+        super().setUp()
+        self.new_driver_path = os.path.join(self.tmp_dir.name, 'chromedriver-2')
+
+    def test_driver_chrome_outgrew_is_resolved_again(self):
+        self.write_entry(self.driver_path, age=10)
+        resolver = MagicMock(return_value=('2.0', self.new_driver_path))
+        factory = ChromeFactory(DriverCache(self.filename, resolver, ttl=60))
+        driver = MagicMock()
+
+        def start(driver_path):
+            if driver_path == self.driver_path:
+                raise SessionNotCreatedException('This version of ChromeDriver only supports Chrome version 1')
+            return driver
+
+        with patch.object(ChromeFactory, 'start', side_effect=start) as started:
+            self.assertIs(factory(), driver)
+            self.assertIs(factory(), driver)
+
+        resolver.assert_called_once_with()
+        self.assertEqual([c.args for c in started.call_args_list],
+                         [(self.driver_path,), (self.new_driver_path,), (self.new_driver_path,)])
+        self.assertEqual(factory.driver_cache.load()['path'], self.new_driver_path)
+
+    def test_session_is_retried_only_once(self):
+        self.write_entry(self.driver_path, age=10)
+        resolver = MagicMock(return_value=('2.0', self.new_driver_path))
+        factory = ChromeFactory(DriverCache(self.filename, resolver, ttl=60))
+
+        with patch.object(ChromeFactory, 'start', side_effect=SessionNotCreatedException('no Chrome')) as started:
+            with self.assertRaises(SessionNotCreatedException):
+                factory()
+
+        self.assertEqual(started.call_count, 2)
+        resolver.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()
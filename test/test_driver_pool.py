@@ -0,0 +1,63 @@
+import unittest
+from unittest.mock import MagicMock
+
+from driver_pool import DriverPool
+
+
+class DriverPoolTest(unittest.TestCase):
+    def test_reuses_warm_driver(self):
+        factory = MagicMock(side_effect=lambda: MagicMock())
+        pool = DriverPool(factory, size=2, max_pages=10)
+
+        with pool.driver() as first:
+            pass
+        with pool.driver() as second:
+            pass
+
+        self.assertIs(first, second)
+        self.assertEqual(factory.call_count, 1)
+        self.assertEqual(pool.stats.hits, 1)
+        self.assertEqual(pool.stats.misses, 1)
+
+    def test_recycles_after_max_pages(self):
+        factory = MagicMock(side_effect=lambda: MagicMock())
+        pool = DriverPool(factory, size=1, max_pages=2)
+
+        drivers = []
+        for _ in range(3):
+            with pool.driver() as driver:
+                drivers.append(driver)
+
+        self.assertIs(drivers[0], drivers[1])
+        self.assertIsNot(drivers[1], drivers[2])
+        drivers[0].quit.assert_called_once_with()
+        self.assertEqual(pool.stats.recycles, 1)
+
+    def test_recycles_on_error(self):
+        factory = MagicMock(side_effect=lambda: MagicMock())
+        pool = DriverPool(factory, size=1, max_pages=10)
+
+        with self.assertRaises(RuntimeError):
+            with pool.driver() as broken:
+                raise RuntimeError
+        with pool.driver() as driver:
+            pass
+
+        broken.quit.assert_called_once_with()
+        self.assertIsNot(broken, driver)
+        self.assertEqual(pool.stats.recycles, 1)
+
+    def test_close_quits_idle_drivers(self):
+        factory = MagicMock(side_effect=lambda: MagicMock())
+        pool = DriverPool(factory, size=1, max_pages=10)
+
+        with pool.driver() as driver:
+            pass
+        pool.close()
+
+        driver.quit.assert_called_once_with()
+        self.assertEqual(pool.stats.recycles, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
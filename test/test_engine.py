@@ -0,0 +1,266 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from async_http import AiohttpClient, ThreadedHttpClient
+from engine import AsyncEngine, BrowserSessions, HostLimiter, run_watchlist
+from local_server import LocalServerTestCase
+from resilience import NEW, AsyncResilientChecker
+from scheduler import HostPolicy, PageJob
+from static_fetch import create_session
+from storage import open_storage
+from tracing import tracer
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class SiteStandIn(BaseHTTPRequestHandler):
+    """/manga/<n> lists episodes 1..n; /api/notify takes LINE notifications."""
+    hits: dict[str, int] = {}
+    messages: list[str] = []
+
+    def do_GET(self):
+        SiteStandIn.hits[self.path] = SiteStandIn.hits.get(self.path, 0) + 1
+        if not self.path.startswith('/manga/'):
+            self.send_error(404)
+            return
+        latest = int(self.path.rsplit('/', 1)[-1])
+        body = ('<html><body><ul>' + ''.join(f'<li><a>Ep. {ep}</a></li>' for ep in range(latest, 0, -1)) +
+                '</ul><p>Vol. 2</p></body></html>').encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        SiteStandIn.messages.append(parse_qs(urlparse(self.path).query)['message'][0])
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class EngineTest(LocalServerTestCase):
+    handler = SiteStandIn
+
+    def setUp(self):
+        SiteStandIn.hits = {}
+        SiteStandIn.messages = []
+
+    def test_run_watchlist_stores_and_notifies(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_name = os.path.join(tmp_dir, 'watchlist.csv')
+            with open(csv_name, 'w') as f:
+                f.write('name,url,xpath,latest_ep\n'
+                        f'A,{self.base_url}/manga/12,//li/a,10\n'
+                        f'B,{self.base_url}/manga/12,//p,2\n'
+                        f'C,{self.base_url}/manga/3,//li/a,3\n')
+            config = {'CSV': csv_name, 'LATEST_RELEASE_URL': 'http://127.0.0.1:9/unused', 'LINE_TOKEN': 'TOKEN',
+                      'NOTIFY_URL': f'{self.base_url}/api/notify', 'HOST_MIN_INTERVAL': '0',
+                      'VALIDATOR_CACHE_ENABLED': 'false', 'MEMORY_POLL_INTERVAL': '0', 'REAP_ORPHANS': 'false',
+                      **{key: os.path.join(tmp_dir, filename) for key, filename in (
+                          ('SITE_MODES', 'site_modes.json'), ('RENDER_TIMINGS', 'render_timings.json'),
+                          ('DRIVER_CACHE', 'driver_cache.json'), ('TRACE_REPORT', 'run_report.json'))}}
+            storage = open_storage(csv_name)
+
+            new_outcomes = asyncio.run(run_watchlist(config, storage, storage.iter_rows()))
+            storage.close()
+
+            self.assertEqual([(outcome.title, outcome.latest_ep) for outcome in new_outcomes], [('A', 12.0)])
+            self.assertEqual(SiteStandIn.hits['/manga/12'], 1)
+            self.assertEqual(len(SiteStandIn.messages), 1)
+            self.assertIn('A newer ep.12', SiteStandIn.messages[0])
+            self.assertEqual([row[3] for row in open_storage(csv_name).iter_rows()], ['12.0', '2', '3'])
+
+    def test_in_flight_pages_are_bounded(self):
+        running = []
+        peak = []
+
+        async def check(job):
+            running.append(job)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(job)
+            return list(job.titles)
+
+        rows = [[f'T{i}', f'https://host{i}.com/1', '//a', str(i)] for i in range(20)]
+        engine = AsyncEngine(check, HostLimiter(HostPolicy(concurrency=5, min_interval=0)),
+                             max_in_flight=3)
+
+        async def collect():
+            return [outcome async for outcome in engine.run(rows)]
+
+        results = asyncio.run(collect())
+
+        self.assertEqual(len(results), 20)
+        self.assertEqual(max(peak), 3)
+
+    def test_rows_sharing_a_url_join_its_waiting_check(self):
+        jobs = []
+
+        async def check(job):
+            jobs.append(list(job.titles))
+            await asyncio.sleep(0.01)
+            return [(title, len(job.titles)) for title in job.titles]
+
+        rows = [['A', 'https://a.com/1', '//a', '1'], ['B', 'https://a.com/2', '//a', '1'],
+                ['C', 'https://a.com/2', '//b', '1'], ['D', 'https://a.com/1', '//c', '1']]
+        engine = AsyncEngine(check, HostLimiter(HostPolicy(concurrency=1, min_interval=0)))
+
+        async def collect():
+            return [outcome async for outcome in engine.run(rows)]
+
+        results = asyncio.run(collect())
+
+        self.assertEqual(jobs, [['A', 'D'], ['B', 'C']])
+        self.assertEqual(len(results), 4)
+
+
+class HostLimiterTest(unittest.TestCase):
+    def test_spaces_starts_on_one_host(self):
+        limiter = HostLimiter(HostPolicy(concurrency=2, min_interval=0.05))
+        starts = []
+
+        async def visit():
+            async with limiter.slot('a.com'):
+                starts.append(time.monotonic())
+
+        async def run():
+            await asyncio.gather(*(visit() for _ in range(3)))
+
+        asyncio.run(run())
+
+        self.assertGreaterEqual(starts[2] - starts[0], 0.09)
+
+
+def job_for(index: int) -> PageJob:
+    job = PageJob(url=f'https://browser.test/{index}', host='browser.test')
+    job.add_row(index, [f'T{index}', job.url, '//a', '1'])
+    return job
+
+
+class BrowserSessionsTest(unittest.TestCase):
+    def test_bounded_threads_with_the_callers_tags(self):
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def render(index):
+            with lock:
+                running.append(index)
+                peak.append(len(running))
+            time.sleep(0.02)
+            with tracer.span('render_wait'):
+                pass
+            with lock:
+                running.remove(index)
+            return index
+
+        async def run():
+            browser = BrowserSessions(2)
+
+            async def check(index):
+                with tracer.tags(title=f'T{index}', host='browser.test'):
+                    return await browser.run(index, render, index)
+
+            try:
+                return await asyncio.gather(*(check(index) for index in range(6)))
+            finally:
+                browser.close()
+
+        self.assertEqual(asyncio.run(run()), list(range(6)))
+        self.assertEqual(max(peak), 2)
+        titles = {span['title'] for span in tracer.spans if span['host'] == 'browser.test'}
+        self.assertEqual(titles, {f'T{index}' for index in range(6)})
+
+    def test_waiting_for_a_browser_is_not_timed(self):
+        def render():
+            time.sleep(0.2)
+            return [2.0]
+
+        async def run():
+            browser = BrowserSessions(1)
+
+            async def check(job):
+                return await browser.run(job.url, render), 200.0
+
+            checker = AsyncResilientChecker(check, retries=0, timeout=0.5)
+            try:
+                return await asyncio.gather(*(checker(job_for(index)) for index in range(6)))
+            finally:
+                browser.close()
+
+        # the last of these waits a second for the one browser, but each renders well within its timeout
+        outcomes = [outcome for outcomes in asyncio.run(run()) for outcome in outcomes]
+        self.assertEqual({outcome.reason for outcome in outcomes}, {None})
+
+    def test_retry_after_a_timeout_waits_for_the_running_render(self):
+        renders = []
+
+        def render():
+            renders.append(time.monotonic())
+            time.sleep(0.3)
+            return [2.0]
+
+        async def run():
+            browser = BrowserSessions(1)
+
+            async def check(job):
+                return await browser.run(job.url, render), 300.0
+
+            checker = AsyncResilientChecker(check, retries=1, backoff=0, timeout=0.2)
+            try:
+                return await checker(job_for(1))
+            finally:
+                browser.close()
+
+        outcome = asyncio.run(run())[0]
+        self.assertEqual((outcome.status, outcome.attempts), (NEW, 2))
+        self.assertEqual(len(renders), 1)
+
+
+class HttpClientTest(LocalServerTestCase):
+    handler = SiteStandIn
+
+    def fetch_both(self, http):
+        async def run():
+            try:
+                page = await http.get(f'{self.base_url}/manga/2')
+                missing = await http.get(f'{self.base_url}/nothing')
+                with self.assertRaises(requests.HTTPError):
+                    missing.raise_for_status()
+                with self.assertRaises(requests.ConnectionError):
+                    await http.get('http://127.0.0.1:9/')
+                return page
+            finally:
+                await http.close()
+
+        page = asyncio.run(run())
+        self.assertTrue(page.ok)
+        self.assertIn(b'Ep. 2', page.content)
+        self.assertEqual(page.headers['content-type'], 'text/html')
+
+    def test_threaded_client(self):
+        self.fetch_both(ThreadedHttpClient(create_session()))
+
+    @unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+    def test_aiohttp_client(self):
+        self.fetch_both(AiohttpClient())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+from episode import NoElementsException, NoNumberInLinkTextException, parse_ep, parse_latest_ep
+
+
+class ParseEpTest(unittest.TestCase):
+    def test_formats(self):
+        cases = {
+            'Ch. 12.5': 12.5,
+            'Chapter 12': 12.0,
+            'Ep.3': 3.0,
+            'Vol. 3 Ch. 25': 25.0,
+            '#101': 101.0,
+            'ตอนที่ 55': 55.0,
+            '12-13': 13.0,
+            'Ep. 10 ~ 11.5': 11.5,
+            'Ch. 12-13': 13.0,
+            'Ch. 12–13': 13.0,
+            '1100': 1100.0,
+            'Chapter No Number': None,
+            '': None,
+        }
+        for link_text, expected in cases.items():
+            with self.subTest(link_text=link_text):
+                self.assertEqual(parse_ep(link_text), expected)
+
+    def test_number_in_the_subtitle_is_not_the_episode(self):
+        cases = {
+            'Chapter 45 - 100 Days': 45.0,
+            'Ch. 12 - 2 Years Later': 12.0,
+            'Ep.3 - 10 Rules': 3.0,
+            'ตอนที่ 12 - 2024/01/05': 12.0,
+            'Ch. 7: 3 Wishes': 7.0,
+        }
+        for link_text, expected in cases.items():
+            with self.subTest(link_text=link_text):
+                self.assertEqual(parse_ep(link_text), expected)
+
+    def test_latest_ep_is_max_of_all_matches(self):
+        self.assertEqual(parse_latest_ep(['Ch. 3', 'Ch. 10', 'Extra', 'Ch. 9.5']), 10.0)
+
+    def test_no_elements(self):
+        with self.assertRaises(NoElementsException):
+            parse_latest_ep([])
+
+    def test_no_number(self):
+        with self.assertRaises(NoNumberInLinkTextException):
+            parse_latest_ep(['Extra', 'Bonus'])
+
+
+if __name__ == '__main__':
+    unittest.main()
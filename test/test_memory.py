@@ -0,0 +1,202 @@
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from driver_pool import DriverPool
+from memory import DRIVER_MARKER, PAGE_SIZE, MemoryMonitor, available_memory_mb, command_line, descendants, \
+    find_orphans, kill_process_tree, process_table, tree_pss_mb
+
+MB = 1024 * 1024
+
+
+def fake_process(proc, pid, parent, rss_mb=0, cmdline=('sleep',), uid=1000, pss_mb=None, environ=('HOME=/home/a',)):
+    directory = os.path.join(proc, str(pid))
+    os.makedirs(directory)
+    if pss_mb is not None:
+        with open(os.path.join(directory, 'smaps_rollup'), 'w') as f:
+            f.write(f'00400000-7fff00000000 ---p 00000000 00:00 0  [rollup]\nRss:  {int(rss_mb * 1024)} kB\n'
+                    f'Pss:  {int(pss_mb * 1024)} kB\n')
+    with open(os.path.join(directory, 'stat'), 'w') as f:
+        f.write(f'{pid} ({cmdline[0]} x) S {parent} 0 0')
+    with open(os.path.join(directory, 'statm'), 'w') as f:
+        f.write(f'0 {int(rss_mb * MB / PAGE_SIZE)} 0')
+    with open(os.path.join(directory, 'cmdline'), 'wb') as f:
+        f.write(b'\0'.join(part.encode() for part in cmdline) + b'\0')
+    with open(os.path.join(directory, 'environ'), 'wb') as f:
+        f.write(b'\0'.join(variable.encode() for variable in environ) + b'\0')
+    with open(os.path.join(directory, 'status'), 'w') as f:
+        f.write(f'Name:\t{cmdline[0]}\nUid:\t{uid}\t{uid}\t{uid}\t{uid}\n')
+
+
+def fake_meminfo(proc, available_mb):
+    with open(os.path.join(proc, 'meminfo'), 'w') as f:
+        f.write(f'MemTotal:       8000000 kB\nMemAvailable:   {int(available_mb * 1024)} kB\n')
+
+
+class FakeDriver:
+    def __init__(self, pid):
+        self.service = MagicMock()
+        self.service.process.pid = pid
+
+    def quit(self):
+        pass
+
+
+class ProcTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.proc = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_tree_pss(self):
+        # the Chrome processes share most of their pages; the driver's smaps can't be read, so its RSS counts
+        fake_process(self.proc, 100, 1, 10, ('chromedriver',))
+        fake_process(self.proc, 101, 100, 200, ('chrome', '--enable-automation', '--headless=new'), pss_mb=120)
+        fake_process(self.proc, 102, 101, 300, ('chrome', '--type=renderer'), pss_mb=180)
+        fake_process(self.proc, 200, 1, 999)
+        fake_meminfo(self.proc, 2048)
+        table = process_table(self.proc)
+
+        self.assertEqual(table[102], 101)
+        self.assertEqual(sorted(descendants(100, table)), [101, 102])
+        self.assertAlmostEqual(tree_pss_mb(100, table, self.proc), 310, delta=1)
+        self.assertAlmostEqual(available_memory_mb(self.proc), 2048)
+
+    def test_orphans_are_adopted_processes_this_tool_started(self):
+        ours = ('HOME=/home/a', f'{DRIVER_MARKER}=1')
+        fake_process(self.proc, 1, 0, cmdline=('init',))
+        fake_process(self.proc, 10, 1, cmdline=('python', 'main.py'))
+        fake_process(self.proc, 11, 10, cmdline=('/usr/bin/chromedriver', '--port=1'), environ=ours)
+        fake_process(self.proc, 20, 1, cmdline=('/usr/bin/chromedriver', '--port=2'), environ=ours)
+        fake_process(self.proc, 30, 1, cmdline=('/opt/chrome/chrome', '--enable-automation', '--headless=new'),
+                     environ=ours)
+        fake_process(self.proc, 31, 30, cmdline=('/opt/chrome/chrome', '--type=renderer'), environ=ours)
+        fake_process(self.proc, 40, 1, cmdline=('/opt/chrome/chrome', '--no-first-run'))
+        fake_process(self.proc, 50, 1, cmdline=('/usr/bin/chromedriver',), uid=0, environ=ours)
+        fake_process(self.proc, 60, 1, cmdline=('/usr/bin/python3', 'chromedriver'), environ=ours)
+
+        orphans = find_orphans(process_table(self.proc), self.proc, uid=1000)
+
+        self.assertEqual(sorted(orphans), [20, 30])
+
+    def test_orphans_of_other_programs_are_left_alone(self):
+        # another Selenium suite of the same user that crashed, and its Chrome
+        fake_process(self.proc, 1, 0, cmdline=('init',))
+        fake_process(self.proc, 20, 1, cmdline=('/usr/bin/chromedriver', '--port=2'))
+        fake_process(self.proc, 30, 1, cmdline=('/opt/chrome/chrome', '--enable-automation', '--headless=new'))
+
+        self.assertEqual(find_orphans(process_table(self.proc), self.proc, uid=1000), [])
+
+
+class MemoryMonitorTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.proc = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_throttles_and_recovers(self):
+        pool = DriverPool(lambda: MagicMock(), size=3, memory=MemoryMonitor(low_mb=500, high_mb=1000,
+                                                                            interval=0, proc=self.proc))
+        monitor = pool.memory
+
+        fake_meminfo(self.proc, 300)
+        monitor.sample()
+        monitor.sample()
+        monitor.sample()
+        self.assertEqual(pool.limit, 1)
+
+        fake_meminfo(self.proc, 700)
+        monitor.sample()
+        self.assertEqual(pool.limit, 1)
+
+        fake_meminfo(self.proc, 4000)
+        monitor.sample()
+        monitor.sample()
+        monitor.sample()
+        self.assertEqual(pool.limit, 3)
+        self.assertEqual(monitor.report()['lowest_limit'], 1)
+        self.assertEqual(monitor.report()['min_available_mb'], 300)
+        self.assertEqual(monitor.limit_changes, 4)
+
+    def test_recycles_a_driver_over_its_memory_limit(self):
+        fake_meminfo(self.proc, 4000)
+        fake_process(self.proc, 100, 1, 100, ('chromedriver',))
+        fake_process(self.proc, 101, 100, 1500, ('chrome', '--type=renderer'))
+        fake_process(self.proc, 200, 1, 100, ('chromedriver',))
+        # over the limit by RSS, but most of it is shared with other Chromes
+        fake_process(self.proc, 201, 200, 1500, ('chrome', '--type=renderer'), pss_mb=300)
+        drivers = iter([FakeDriver(100), FakeDriver(200), FakeDriver(300)])
+        pool = DriverPool(lambda: next(drivers), size=2,
+                          memory=MemoryMonitor(driver_max_mb=1024, interval=0, proc=self.proc))
+
+        with pool.driver() as big, pool.driver() as small:
+            pool.memory.sample()
+        with pool.driver() as first, pool.driver() as second:
+            pass
+
+        self.assertIs(first, small)
+        self.assertEqual(second.service.process.pid, 300)
+        self.assertNotIn(big, (first, second))
+        self.assertEqual(pool.stats.memory_recycles, 1)
+        self.assertGreater(pool.memory.report()['peak_pss_mb'], 1600)
+
+
+class PoolLimitTest(unittest.TestCase):
+    def test_lowered_limit_blocks_and_quits_idle_drivers(self):
+        pool = DriverPool(lambda: MagicMock(), size=2)
+        with pool.driver() as first, pool.driver() as second:
+            pass
+
+        pool.set_limit(1)
+
+        self.assertEqual(pool._idle.qsize(), 1)
+        self.assertEqual(pool.stats.recycles, 1)
+
+        entered = threading.Event()
+
+        def second_worker():
+            with pool.driver():
+                entered.set()
+
+        with pool.driver():
+            worker = threading.Thread(target=second_worker)
+            worker.start()
+            self.assertFalse(entered.wait(0.1))
+            pool.set_limit(2)
+            self.assertTrue(entered.wait(1))
+        worker.join()
+
+
+class KillProcessTreeTest(unittest.TestCase):
+    def test_kills_children_too(self):
+        shell = subprocess.Popen(['sh', '-c', 'sleep 30 & wait'])
+        try:
+            for _ in range(50):
+                children = descendants(shell.pid, process_table())
+                if children:
+                    break
+                time.sleep(0.02)
+            self.assertTrue(children)
+
+            self.assertEqual(kill_process_tree(shell.pid), 2)
+            shell.wait(5)
+            for _ in range(50):
+                if not any(command_line(child) for child in children):
+                    break
+                time.sleep(0.02)
+            else:
+                self.fail('sleep survived')
+        finally:
+            shell.kill()
+
+
+if __name__ == '__main__':
+    unittest.main()
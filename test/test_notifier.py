@@ -0,0 +1,140 @@
+import asyncio
+import unittest
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+from async_http import ThreadedHttpClient
+from local_server import LocalServerTestCase
+from notifier import FAILED, SENT, AsyncNotificationDispatcher, Notification, NotificationDispatcher
+from static_fetch import create_session
+
+
+class LineStandIn(BaseHTTPRequestHandler):
+    """Plays back the queued (status, headers) responses, then answers 200."""
+    responses: list[tuple[int, dict]] = []
+    messages: list[str] = []
+
+    def do_POST(self):
+        query = parse_qs(urlparse(self.path).query)
+        LineStandIn.messages.append(query['message'][0])
+        status, headers = LineStandIn.responses.pop(0) if LineStandIn.responses else (200, {})
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(b'{"status": %d}' % status)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class NotificationDispatcherTest(LocalServerTestCase):
+    handler = LineStandIn
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.url = f'{cls.base_url}/api/notify'
+
+    def setUp(self):
+        LineStandIn.responses = []
+        LineStandIn.messages = []
+
+    def dispatcher(self, **kwargs):
+        return NotificationDispatcher('TOKEN', url=self.url, backoff=0.01, **kwargs)
+
+    def test_sends_every_notification(self):
+        dispatcher = self.dispatcher(workers=2)
+        for ep in range(3):
+            dispatcher.submit(Notification(f'Manga {ep}', 'http://manga.com', '1', '2'))
+        results = dispatcher.close()
+
+        self.assertEqual([result.outcome for result in results], [SENT] * 3)
+        self.assertEqual(len(LineStandIn.messages), 3)
+        self.assertTrue(all(result.latency_ms >= 0 for result in results))
+
+    def test_retries_server_errors_and_rate_limits(self):
+        LineStandIn.responses = [(503, {}), (429, {'Retry-After': '0'})]
+        dispatcher = self.dispatcher(workers=1)
+        dispatcher.submit(Notification('Manga', 'http://manga.com', '1', '2'))
+        result, = dispatcher.close()
+
+        self.assertEqual(result.outcome, SENT)
+        self.assertEqual(result.attempts, 3)
+
+    def test_gives_up_on_client_errors(self):
+        LineStandIn.responses = [(401, {})]
+        dispatcher = self.dispatcher(workers=1)
+        dispatcher.submit(Notification('Manga', 'http://manga.com', '1', '2'))
+        result, = dispatcher.close()
+
+        self.assertEqual(result.outcome, FAILED)
+        self.assertEqual(result.status_code, 401)
+        self.assertEqual(result.attempts, 1)
+
+    def test_gives_up_after_max_retries(self):
+        LineStandIn.responses = [(500, {})] * 3
+        dispatcher = self.dispatcher(workers=1, max_retries=2)
+        dispatcher.submit(Notification('Manga', 'http://manga.com', '1', '2'))
+        result, = dispatcher.close()
+
+        self.assertEqual(result.outcome, FAILED)
+        self.assertEqual(result.attempts, 3)
+
+    def test_digest_sends_one_message(self):
+        dispatcher = self.dispatcher(digest=True)
+        dispatcher.submit(Notification('Manga 1', 'http://manga.com/1', '1', '2'))
+        dispatcher.submit(Notification('Manga 2', 'http://manga.com/2', '5', '6'))
+        results = dispatcher.close()
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(len(LineStandIn.messages), 1)
+        self.assertIn('2 new episodes', LineStandIn.messages[0])
+        self.assertIn('Manga 2 ep.6', LineStandIn.messages[0])
+
+
+class AsyncNotificationDispatcherTest(NotificationDispatcherTest):
+    def dispatcher(self, **kwargs):
+        return AsyncDispatcher(self.url, **kwargs)
+
+    def test_submit_waits_for_a_full_queue(self):
+        async def run():
+            http = ThreadedHttpClient(create_session())
+            dispatcher = AsyncNotificationDispatcher('TOKEN', http, url=self.url, workers=1, queue_size=1,
+                                                     backoff=0.01)
+            for ep in range(5):
+                await dispatcher.submit(Notification(f'Manga {ep}', 'http://manga.com', '1', '2'))
+                self.assertLessEqual(dispatcher._queue.qsize(), 1)
+            results = await dispatcher.close()
+            await http.close()
+            return results
+
+        self.assertEqual([result.outcome for result in asyncio.run(run())], [SENT] * 5)
+
+
+class AsyncDispatcher:
+    """Drives an AsyncNotificationDispatcher with the same calls the threaded tests make."""
+
+    def __init__(self, url, **kwargs):
+        self.url = url
+        self.kwargs = kwargs
+        self.notifications = []
+
+    def submit(self, notification):
+        self.notifications.append(notification)
+
+    def close(self):
+        async def run():
+            http = ThreadedHttpClient(create_session())
+            dispatcher = AsyncNotificationDispatcher('TOKEN', http, url=self.url, backoff=0.01, **self.kwargs)
+            for notification in self.notifications:
+                await dispatcher.submit(notification)
+            results = await dispatcher.close()
+            await http.close()
+            return results
+
+        return asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from selenium.common import JavascriptException
+from selenium.webdriver import Chrome
+
+from episode import InvalidXPathException
+from render_wait import RenderTimings, wait_for_link_texts
+
+
+class WaitForLinkTextsTest(unittest.TestCase):
+    def test_waits_until_text_is_stable(self):
+        mock_driver = MagicMock(spec=Chrome)
+        mock_driver.execute_script.side_effect = [
+            [],
+            ['Loading'],
+            ['Ep. 5', 'Ep. 4'],
+            ['Ep. 5', 'Ep. 4'],
+            ['Ep. 6', 'Ep. 5', 'Ep. 4'],
+        ]
+
+        result = wait_for_link_texts(mock_driver, '//a', timeout=5, poll_interval=0)
+
+        self.assertEqual(result, ['Ep. 5', 'Ep. 4'])
+        self.assertEqual(mock_driver.execute_script.call_count, 4)
+
+    def test_gives_up_after_timeout(self):
+        mock_driver = MagicMock(spec=Chrome)
+        mock_driver.execute_script.return_value = []
+
+        result = wait_for_link_texts(mock_driver, '//a', timeout=0.05, poll_interval=0.01)
+
+        self.assertEqual(result, [])
+
+    def test_unparsable_xpath_is_the_rows_fault(self):
+        mock_driver = MagicMock(spec=Chrome)
+        mock_driver.execute_script.side_effect = JavascriptException("Failed to execute 'evaluate' on 'Document'")
+
+        with self.assertRaises(InvalidXPathException):
+            wait_for_link_texts(mock_driver, '//a[', timeout=5, poll_interval=0)
+        self.assertEqual(mock_driver.execute_script.call_count, 1)
+
+
+class RenderTimingsTest(unittest.TestCase):
+    def test_default_timeout_until_enough_samples(self):
+        timings = RenderTimings(None, default_timeout=10, min_samples=3)
+        timings.record('a.com', 1.0)
+        timings.record('a.com', 1.0)
+
+        self.assertEqual(timings.timeout_for('a.com'), 10)
+
+    def test_timeout_follows_p95(self):
+        timings = RenderTimings(None, default_timeout=10, min_timeout=2, max_timeout=30, min_samples=3)
+        for seconds in (1.0, 1.5, 4.0):
+            timings.record('slow.com', seconds)
+        for seconds in (0.1, 0.1, 0.2):
+            timings.record('fast.com', seconds)
+
+        self.assertEqual(timings.timeout_for('slow.com'), 8.0)
+        self.assertEqual(timings.timeout_for('fast.com'), 2)
+        self.assertEqual(timings.run_summary()['slow.com'], (1.5, 4.0))
+
+    def test_samples_are_persisted_in_a_rolling_window(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'render_timings.json')
+            timings = RenderTimings(filename, window=3, min_samples=3)
+            for seconds in (9.0, 1.0, 1.0, 1.0):
+                timings.record('a.com', seconds)
+            timings.save()
+
+            reloaded = RenderTimings(filename, min_timeout=0, min_samples=3)
+            self.assertEqual(reloaded.timeout_for('a.com'), 2.0)
+            self.assertEqual(reloaded.run_summary(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
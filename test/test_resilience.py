@@ -0,0 +1,187 @@
+import asyncio
+import time
+import unittest
+
+import requests
+
+from episode import InvalidXPathException, NoElementsException
+from resilience import CIRCUIT_OPEN, ERROR, FAILED, INVALID_XPATH, NETWORK, NEW, NO_ELEMENTS, TIMEOUT, UNCHANGED, \
+    AsyncResilientChecker, CheckTimeoutException, CircuitBreaker, ResilientChecker, call_with_timeout
+from scheduler import HostPolicy, HostScheduler, group_pages, iter_pages
+
+
+def job_for(*rows):
+    return group_pages(rows)[0]
+
+
+class CallWithTimeoutTest(unittest.TestCase):
+    def test_returns_and_raises_like_the_call(self):
+        self.assertEqual(call_with_timeout(lambda x: x * 2, 1, 21), 42)
+        with self.assertRaises(ValueError):
+            call_with_timeout(int, 1, 'x')
+
+    def test_gives_up_on_a_hung_call(self):
+        start = time.monotonic()
+        with self.assertRaises(CheckTimeoutException):
+            call_with_timeout(time.sleep, 0.05, 1)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_opens_after_threshold_and_lets_one_trial_through(self):
+        now = [0.0]
+        breaker = CircuitBreaker(threshold=2, cooldown=10, clock=lambda: now[0])
+
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        now[0] = 11
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        now[0] = 22
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.trips, 1)
+
+    def test_inconclusive_trial_lets_the_next_check_be_the_trial(self):
+        now = [0.0]
+        breaker = CircuitBreaker(threshold=1, cooldown=10, clock=lambda: now[0])
+        breaker.record_failure()
+        now[0] = 11
+
+        self.assertTrue(breaker.allow())
+        breaker.record_inconclusive()
+        self.assertTrue(breaker.is_open)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+
+
+class ResilientCheckerTest(unittest.TestCase):
+    def test_typed_outcomes(self):
+        checker = ResilientChecker(lambda job: ([5.0, 2.0], 12.0))
+        job = job_for(['A', 'https://a.com/1', '//a', '4'], ['B', 'https://a.com/1', '//b', '2'])
+
+        outcomes = checker(job)
+
+        self.assertEqual([(outcome.title, outcome.status, outcome.latest_ep) for outcome in outcomes],
+                         [('A', NEW, 5.0), ('B', UNCHANGED, 2.0)])
+        self.assertEqual(checker.summary()['counts'], {NEW: 1, UNCHANGED: 1})
+
+    def test_retries_transient_failures(self):
+        calls = []
+
+        def check(job):
+            calls.append(job)
+            if len(calls) < 3:
+                raise requests.ConnectionError('reset')
+            return [3.0], 1.0
+
+        checker = ResilientChecker(check, retries=2, backoff=0)
+        outcome = checker(job_for(['A', 'https://a.com/1', '//a', '1']))[0]
+
+        self.assertEqual((outcome.status, outcome.attempts), (NEW, 3))
+
+    def test_title_failures_are_not_retried(self):
+        def check(job):
+            raise NoElementsException()
+
+        checker = ResilientChecker(check, retries=2, backoff=0)
+        outcome = checker(job_for(['A', 'https://a.com/1', '//a', '1']))[0]
+
+        self.assertEqual((outcome.status, outcome.reason, outcome.attempts), (FAILED, NO_ELEMENTS, 1))
+        self.assertFalse(checker.breaker_for('a.com').is_open)
+
+    def test_invalid_xpaths_are_title_failures(self):
+        def check(job):
+            raise InvalidXPathException(job.xpaths[0])
+
+        checker = ResilientChecker(check, retries=2, backoff=0, breaker_threshold=2)
+        outcomes = [checker(job_for([title, f'https://a.com/{title}', '//a[', '1']))[0] for title in 'ABC']
+
+        self.assertEqual([(outcome.reason, outcome.attempts) for outcome in outcomes], [(INVALID_XPATH, 1)] * 3)
+        self.assertEqual(checker.breaker_for('a.com').failures, 0)
+
+    def test_unexpected_errors_leave_the_breaker_alone(self):
+        errors = [requests.ConnectionError('refused'), ValueError('bug'), requests.ConnectionError('refused')]
+
+        def check(job):
+            raise errors.pop(0)
+
+        checker = ResilientChecker(check, retries=0, backoff=0, breaker_threshold=2)
+        outcomes = [checker(job_for([title, f'https://a.com/{title}', '//a', '1']))[0] for title in 'ABC']
+
+        self.assertEqual([outcome.reason for outcome in outcomes], [NETWORK, ERROR, NETWORK])
+        self.assertTrue(checker.breaker_for('a.com').is_open)
+
+    def test_timeout(self):
+        checker = ResilientChecker(lambda job: time.sleep(1), retries=0, timeout=0.05)
+        outcome = checker(job_for(['A', 'https://a.com/1', '//a', '1']))[0]
+
+        self.assertEqual((outcome.status, outcome.reason), (FAILED, TIMEOUT))
+
+    def test_open_circuit_skips_host_but_run_finishes(self):
+        calls = []
+
+        def check(job):
+            calls.append(job.host)
+            if job.host == 'down.com':
+                raise requests.ConnectionError('refused')
+            return [1.0], 1.0
+
+        rows = [[f'down {i}', f'https://down.com/{i}', '//a', '1'] for i in range(5)] + \
+               [[f'up {i}', f'https://up.com/{i}', '//a', '1'] for i in range(3)]
+        checker = ResilientChecker(check, retries=0, backoff=0, breaker_threshold=2, breaker_cooldown=60)
+        scheduler = HostScheduler(max_workers=1, default_policy=HostPolicy(concurrency=1, min_interval=0))
+
+        outcomes = [outcome for _, future in scheduler.run(iter_pages(rows), checker)
+                    for outcome in future.result()]
+
+        self.assertEqual(len(outcomes), 8)
+        self.assertEqual(calls.count('down.com'), 2)
+        self.assertEqual(sorted(outcome.reason for outcome in outcomes if outcome.status == FAILED),
+                         [CIRCUIT_OPEN] * 3 + [NETWORK] * 2)
+        self.assertEqual(checker.summary()['open_circuits'], ['down.com'])
+
+
+class AsyncResilientCheckerTest(unittest.TestCase):
+    def test_cancels_an_attempt_that_overruns(self):
+        cancelled = []
+
+        async def check(job):
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(job.url)
+                raise
+
+        checker = AsyncResilientChecker(check, retries=0, timeout=0.05)
+        outcome = asyncio.run(checker(job_for(['A', 'https://a.com/1', '//a', '1'])))[0]
+
+        self.assertEqual((outcome.status, outcome.reason), (FAILED, TIMEOUT))
+        self.assertEqual(cancelled, ['https://a.com/1'])
+
+    def test_retries_then_succeeds(self):
+        calls = []
+
+        async def check(job):
+            calls.append(job)
+            if len(calls) < 2:
+                raise requests.ConnectionError('reset')
+            return [3.0, 1.0], 1.0
+
+        checker = AsyncResilientChecker(check, retries=2, backoff=0)
+        job = job_for(['A', 'https://a.com/1', '//a', '1'], ['B', 'https://a.com/1', '//b', '1'])
+        outcomes = asyncio.run(checker(job))
+
+        self.assertEqual([(outcome.status, outcome.attempts) for outcome in outcomes], [(NEW, 2), (UNCHANGED, 2)])
+        self.assertEqual(checker.summary()['counts'], {NEW: 1, UNCHANGED: 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+from unittest.mock import MagicMock
+
+from selenium.webdriver import Chrome
+
+from main import load_page
+from resource_policy import BLOCKED, FONT, FULL, IMAGE, MEDIA, RESOURCE_PATTERNS, THIRD_PARTY_SCRIPT, \
+    ResourcePolicy, parse_resource_types, parse_site_allowances
+
+
+def blocked_urls(driver: MagicMock) -> list[str]:
+    return [call.args[1]['urls'] for call in driver.execute_cdp_cmd.call_args_list
+            if call.args[0] == 'Network.setBlockedURLs'][-1]
+
+
+class ParseTest(unittest.TestCase):
+    def test_resource_types(self):
+        self.assertEqual(parse_resource_types('image, FONT'), frozenset((IMAGE, FONT)))
+        self.assertEqual(parse_resource_types('none'), frozenset())
+        self.assertEqual(parse_resource_types(None), frozenset((IMAGE, MEDIA, FONT, THIRD_PARTY_SCRIPT)))
+
+    def test_unknown_types_are_ignored(self):
+        self.assertEqual(parse_resource_types('image,stylesheet'), frozenset((IMAGE,)))
+
+    def test_site_allowances(self):
+        allowances = parse_site_allowances('a.com:image+font, b.com:third_party_script, broken')
+
+        self.assertEqual(allowances, {'a.com': frozenset((IMAGE, FONT)), 'b.com': frozenset((THIRD_PARTY_SCRIPT,))})
+
+
+class ResourcePolicyTest(unittest.TestCase):
+    def test_site_allowance_is_not_blocked(self):
+        policy = ResourcePolicy(site_allowances={'a.com': frozenset((IMAGE,))}, baseline_every=0)
+        driver = MagicMock(spec=Chrome)
+
+        self.assertTrue(policy.apply(driver, 'a.com'))
+        patterns = blocked_urls(driver)
+        self.assertIn('*.woff2', patterns)
+        self.assertNotIn('*.png', patterns)
+
+        policy.apply(driver, 'b.com')
+        self.assertIn('*.png', blocked_urls(driver))
+
+    def test_pooled_driver_is_reset_for_each_site(self):
+        policy = ResourcePolicy(site_allowances={'a.com': frozenset((IMAGE, MEDIA, FONT, THIRD_PARTY_SCRIPT))},
+                                baseline_every=0)
+        driver = MagicMock(spec=Chrome)
+
+        policy.apply(driver, 'b.com')
+        self.assertFalse(policy.apply(driver, 'a.com'))
+        self.assertEqual(blocked_urls(driver), [])
+
+    def test_every_nth_load_is_a_baseline(self):
+        policy = ResourcePolicy(baseline_every=3)
+        driver = MagicMock(spec=Chrome)
+
+        blocked = [policy.apply(driver, 'a.com') for _ in range(6)]
+
+        self.assertEqual(blocked, [True, True, False, True, True, False])
+
+    def test_driver_without_devtools(self):
+        policy = ResourcePolicy()
+        driver = MagicMock(spec=Chrome)
+        driver.execute_cdp_cmd.side_effect = RuntimeError('not a Chromium browser')
+
+        self.assertFalse(policy.apply(driver, 'a.com'))
+
+    def test_report_compares_blocked_and_full_loads(self):
+        policy = ResourcePolicy()
+        driver = MagicMock(spec=Chrome)
+        for weight, blocked in (({'bytes': 100000, 'load_ms': 800, 'requests': 40}, False),
+                                ({'bytes': 20000, 'load_ms': 300, 'requests': 8}, True),
+                                ({'bytes': 30000, 'load_ms': 400, 'requests': 10}, True)):
+            driver.execute_script.return_value = weight
+            policy.measure(driver, blocked)
+
+        report = policy.report()
+
+        self.assertEqual(report[FULL], {'pages': 1, 'avg_bytes': 100000, 'avg_requests': 40.0,
+                                        'p50_load_ms': 800.0, 'p95_load_ms': 800.0})
+        self.assertEqual(report[BLOCKED]['pages'], 2)
+        self.assertEqual(report[BLOCKED]['avg_bytes'], 25000)
+        self.assertEqual(report[BLOCKED]['p95_load_ms'], 400.0)
+
+
+class LoadPageTest(unittest.TestCase):
+    def test_patterns_are_set_before_navigation(self):
+        driver = MagicMock(spec=Chrome)
+        driver.title = 'Title'
+        driver.execute_script.return_value = {'bytes': 5000, 'load_ms': 120, 'requests': 3}
+        policy = ResourcePolicy(baseline_every=0)
+
+        load_page(driver, 'https://a.com/manga', resources=policy)
+
+        method_names = [name for name, *_ in driver.method_calls]
+        self.assertLess(method_names.index('execute_cdp_cmd'), method_names.index('get'))
+        self.assertEqual(sorted(blocked_urls(driver)), sorted(
+            pattern for patterns in RESOURCE_PATTERNS.values() for pattern in patterns))
+        self.assertEqual(policy.report()[BLOCKED]['avg_bytes'], 5000)
+
+
+if __name__ == '__main__':
+    unittest.main()
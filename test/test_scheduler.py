@@ -0,0 +1,104 @@
+import threading
+import time
+import unittest
+
+from scheduler import HostPacer, HostPolicy, HostScheduler, group_pages, iter_pages, parse_host_policies
+
+
+class SchedulerTest(unittest.TestCase):
+    def test_group_pages_shares_urls(self):
+        rows = [['A', 'https://a.com/1', '//a', '1'],
+                ['B', 'https://b.com/1', '//b', '1'],
+                ['A2', 'https://a.com/1', '//p', '1']]
+
+        jobs = group_pages(rows)
+
+        self.assertEqual(len(jobs), 2)
+        self.assertEqual(jobs[0].url, 'https://a.com/1')
+        self.assertEqual(jobs[0].host, 'a.com')
+        self.assertEqual(jobs[0].row_indexes, [0, 2])
+        self.assertEqual(jobs[0].xpaths, ['//a', '//p'])
+
+    def test_parse_host_policies(self):
+        default = HostPolicy(concurrency=2, min_interval=1.0)
+
+        policies = parse_host_policies('a.com:1:2.5, b.com:3, bad:x', default)
+
+        self.assertEqual(policies['a.com'], HostPolicy(concurrency=1, min_interval=2.5))
+        self.assertEqual(policies['b.com'], HostPolicy(concurrency=3, min_interval=1.0))
+        self.assertNotIn('bad', policies)
+
+    def test_pacer_limits_and_spaces_each_host(self):
+        pacer = HostPacer(HostPolicy(concurrency=2, min_interval=1.0),
+                          {'b.com': HostPolicy(concurrency=1, min_interval=0)})
+
+        self.assertEqual(pacer.start('a.com', 10.0), 10.0)
+        # the second request is claimed straight away but starts a full interval after the first
+        self.assertEqual(pacer.start('a.com', 10.2), 11.0)
+        self.assertIsNone(pacer.ready_at('a.com'))
+        pacer.finish('a.com')
+        self.assertEqual(pacer.ready_at('a.com'), 12.0)
+
+        pacer.start('b.com', 10.0)
+        self.assertIsNone(pacer.ready_at('b.com'))
+
+    def test_per_host_concurrency_and_spacing(self):
+        rows = [[str(i), f'https://a.com/{i}', '//a', '1'] for i in range(3)] + \
+               [[str(i), f'https://b.com/{i}', '//a', '1'] for i in range(3)]
+        lock = threading.Lock()
+        active = {'a.com': 0, 'b.com': 0}
+        peak = {'a.com': 0, 'b.com': 0}
+        starts = {'a.com': [], 'b.com': []}
+
+        def worker(job):
+            with lock:
+                active[job.host] += 1
+                peak[job.host] = max(peak[job.host], active[job.host])
+                starts[job.host].append(time.monotonic())
+            time.sleep(0.05)
+            with lock:
+                active[job.host] -= 1
+            return job.url
+
+        scheduler = HostScheduler(max_workers=4, default_policy=HostPolicy(concurrency=1, min_interval=0.02))
+        results = [future.result() for _, future in scheduler.run(group_pages(rows), worker)]
+
+        self.assertEqual(len(results), 6)
+        self.assertEqual(peak, {'a.com': 1, 'b.com': 1})
+        for host_starts in starts.values():
+            gaps = [b - a for a, b in zip(host_starts, host_starts[1:])]
+            self.assertTrue(all(gap >= 0.02 for gap in gaps))
+
+    def test_streams_with_bounded_pending_jobs(self):
+        pulled = []
+
+        def rows():
+            for i in range(50):
+                pulled.append(i)
+                yield [str(i), f'https://host{i % 5}.com/{i}', '//a', '1']
+
+        scheduler = HostScheduler(max_workers=2, default_policy=HostPolicy(concurrency=2, min_interval=0),
+                                  max_pending=4)
+        seen = 0
+        for job, future in scheduler.run(iter_pages(rows()), lambda job: job.url):
+            seen += 1
+            # never more than the running and waiting jobs ahead of what has been handed back
+            self.assertLessEqual(len(pulled) - seen, 2 + 4)
+        self.assertEqual(seen, 50)
+
+    def test_waiting_rows_with_the_same_url_are_merged(self):
+        rows = [['A', 'https://a.com/1', '//a', '1'],
+                ['B', 'https://a.com/2', '//b', '2'],
+                ['A2', 'https://a.com/1', '//p', '3']]
+        scheduler = HostScheduler(max_workers=1, default_policy=HostPolicy(concurrency=1, min_interval=0))
+
+        jobs = [job for job, _ in scheduler.run(iter_pages(rows), lambda job: None)]
+
+        self.assertEqual(len(jobs), 2)
+        self.assertEqual(jobs[0].titles, ['A', 'A2'])
+        self.assertEqual(jobs[0].current_eps, [1.0, 3.0])
+        self.assertEqual(jobs[0].row_indexes, [0, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import json
+import os
+import tempfile
+import unittest
+from http.server import BaseHTTPRequestHandler
+
+from bench.site_server import LocalServer
+from resilience import CheckOutcome, FAILED, NEW, UNCHANGED
+from shard import ShardJournal, journal_files, merge, read_journal, run_workers, shard_config, shard_of, shard_rows
+from storage import CsvStorage, read_csv, write_csv
+
+HEADER = ['name', 'url', 'xpath', 'latest_ep']
+
+
+class EpisodeHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        # /title/<n> lists episodes up to n + 1
+        latest = int(self.path.rstrip('/').split('/')[-1]) + 1
+        body = f'<html><body><a class="ep">Ep. {latest}</a><a class="ep">Ep. {latest - 1}</a></body></html>'.encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ShardTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.journal_dir = os.path.join(self.tmp_dir.name, 'journal')
+        self.csv_path = os.path.join(self.tmp_dir.name, 'watchlist.csv')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_shard_of_is_stable_and_spread(self):
+        urls = [f'https://a.com/title/{i}' for i in range(400)]
+        shards = [shard_of(url, 4) for url in urls]
+
+        self.assertEqual(shards, [shard_of(url, 4) for url in urls])
+        # pinned so a change of hash, which would move every title to another shard, is noticed
+        self.assertEqual(shard_of('https://a.com/title/1', 4), 2)
+        self.assertTrue(all(60 < shards.count(shard) < 140 for shard in range(4)))
+
+    def test_every_row_lands_in_exactly_one_shard(self):
+        rows = [[f'T{i}', f'https://a.com/{i % 7}', '//a', '1'] for i in range(50)]
+
+        parts = [list(shard_rows(rows, shard, 3)) for shard in range(3)]
+
+        self.assertEqual(sorted(row[0] for part in parts for row in part), sorted(row[0] for row in rows))
+        for part in parts:
+            urls = {row[1] for row in part}
+            self.assertFalse(any(row[1] in urls for other in parts if other is not part for row in other))
+
+    def test_state_files_are_per_shard(self):
+        config = shard_config({'SITE_MODES': 'modes.json'}, 2)
+
+        self.assertEqual(config['SITE_MODES'], 'modes.shard-2.json')
+        self.assertEqual(config['RENDER_TIMINGS'], 'render_timings.shard-2.json')
+
+    def test_merge_last_writer_wins(self):
+        write_csv(self.csv_path, [HEADER, ['A', 'https://a.com/1', '//a', '5.0'],
+                                  ['B', 'https://b.com/1', '//a', '3.0'], ['C', 'https://c.com/1', '//a', '1.0']])
+        first = ShardJournal(self.journal_dir, 0, 2)
+        first.write(CheckOutcome('A', 'https://a.com/1', NEW, 5.0, latest_ep=6.0))
+        first.write(CheckOutcome('B', 'https://b.com/1', NEW, 3.0, latest_ep=4.0))
+        first.close()
+        # a later check of A on another machine, and a failure that must not erase B
+        second = ShardJournal(self.journal_dir, 1, 2)
+        second.write(CheckOutcome('A', 'https://a.com/1', NEW, 5.0, latest_ep=7.0))
+        second.write(CheckOutcome('B', 'https://b.com/1', FAILED, 3.0, reason='timeout'))
+        second.write(CheckOutcome('C', 'https://c.com/1', UNCHANGED, 1.0, latest_ep=1.0))
+        second.close()
+        with open(second.filename, 'a') as f:
+            f.write('{"title": "C", "url"')
+
+        storage = CsvStorage(self.csv_path)
+        notifications = merge(storage, self.journal_dir)
+
+        self.assertEqual([(n.manga_name, n.current_ep, n.latest_ep) for n in notifications],
+                         [('A', '5', '7'), ('B', '3', '4')])
+        self.assertEqual([row[3] for row in read_csv(self.csv_path)[1:]], ['7.0', '4.0', '1.0'])
+        self.assertEqual(journal_files(self.journal_dir), [])
+
+    def test_merge_keeps_a_title_on_two_sites_apart(self):
+        write_csv(self.csv_path, [HEADER, ['A', 'https://a.com/1', '//a', '5.0'],
+                                  ['A', 'https://b.com/1', '//a', '2.0']])
+        journal = ShardJournal(self.journal_dir, 0, 1)
+        journal.write(CheckOutcome('A', 'https://a.com/1', UNCHANGED, 5.0, latest_ep=5.0))
+        journal.write(CheckOutcome('A', 'https://b.com/1', NEW, 2.0, latest_ep=3.0))
+        journal.close()
+
+        notifications = merge(CsvStorage(self.csv_path), self.journal_dir)
+
+        self.assertEqual([(n.manga_url, n.latest_ep) for n in notifications], [('https://b.com/1', '3')])
+        self.assertEqual([row[3] for row in read_csv(self.csv_path)[1:]], ['5.0', '3.0'])
+
+    def test_worker_processes_journal_their_shards(self):
+        server = LocalServer(EpisodeHandler).start()
+        self.addCleanup(server.stop)
+        base_url = server.base_url
+
+        rows = [[f'Title {i}', f'{base_url}/title/{i}', '//a[@class="ep"]', str(float(i))] for i in range(12)]
+        write_csv(self.csv_path, [HEADER] + rows)
+        state = lambda name: os.path.join(self.tmp_dir.name, name)
+        config = {'CSV': self.csv_path, 'LATEST_RELEASE_URL': '', 'LINE_TOKEN': 'token',
+                  'SITE_MODES': state('site_modes.json'), 'RENDER_TIMINGS': state('render_timings.json'),
+                  'VALIDATOR_CACHE': state('validator_cache.json'), 'TRACE_REPORT': state('run_report.json'),
+                  'DRIVER_CACHE': state('driver_cache.json'), 'HOST_MIN_INTERVAL': '0', 'HOST_CONCURRENCY': '4'}
+
+        exitcodes = run_workers(config, 3, self.journal_dir)
+
+        self.assertEqual(exitcodes, [0, 0, 0])
+        filenames = journal_files(self.journal_dir)
+        self.assertEqual(len(filenames), 3)
+        entries = [entry for filename in filenames for entry in read_journal(filename)]
+        self.assertEqual(sorted(entry.title for entry in entries), sorted(row[0] for row in rows))
+        self.assertTrue(all(entry.shard == shard_of(entry.url, 3) for entry in entries))
+        self.assertEqual(len({filename.split('.')[-2] for filename in filenames}), 3)
+
+        notifications = merge(CsvStorage(self.csv_path), self.journal_dir)
+
+        self.assertEqual(len(notifications), 12)
+        self.assertEqual(read_csv(self.csv_path)[1:],
+                         [[row[0], row[1], row[2], str(float(i + 1))] for i, row in enumerate(rows)])
+        with open(state('run_report.shard-0.json')) as f:
+            self.assertIn('stages', json.load(f))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import gzip
+import os
+import tempfile
+import unittest
+from http.server import BaseHTTPRequestHandler
+from unittest.mock import MagicMock
+
+from local_server import LocalServerTestCase
+from main import check_page
+from resilience import NO_ELEMENTS
+from snapshot import NO_SNAPSHOT, SnapshotStore, replay
+from static_fetch import BROWSER, STATIC, SiteModes, create_session
+
+PAGE = b"""<html><body>
+<ul class="episodes"><li><a>Ep. 12</a></li><li><a>Ep. 11</a></li></ul>
+<div class="extras"><a>Chapter 3</a></div>
+</body></html>"""
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.end_headers()
+        self.wfile.write(PAGE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SnapshotStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = SnapshotStore(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_pages_are_stored_once_by_content(self):
+        first = self.store.put('https://a.com/1', PAGE, STATIC, ['//a'], [12.0])
+        second = self.store.put('https://b.com/1', PAGE.decode(), BROWSER, ['//a'], [12.0])
+        self.store.save()
+
+        self.assertEqual(first, second)
+        with gzip.open(self.store.object_path(first), 'rb') as f:
+            self.assertEqual(f.read(), PAGE)
+        objects = [name for _, _, names in os.walk(os.path.join(self.directory.name, 'objects')) for name in names]
+        self.assertEqual(len(objects), 1)
+
+        reloaded = SnapshotStore(self.directory.name)
+        self.assertEqual(reloaded.entry('https://b.com/1')['source'], BROWSER)
+        self.assertEqual(reloaded.entry('https://a.com/1')['latest_eps'], {'//a': 12.0})
+
+    def test_prune_keeps_referenced_pages(self):
+        old = self.store.put('https://a.com/1', b'<html>old</html>', STATIC, ['//a'])
+        new = self.store.put('https://a.com/1', PAGE, STATIC, ['//a'])
+
+        self.assertEqual(self.store.prune(), 1)
+        self.assertFalse(os.path.exists(self.store.object_path(old)))
+        self.assertTrue(os.path.exists(self.store.object_path(new)))
+
+    def test_replay_reports_changes_against_the_recording(self):
+        self.store.put('https://a.com/1', PAGE, STATIC, ['//ul//a', '//div/a'], [12.0, 3.0])
+        rows = [['A', 'https://a.com/1', '//ul//a', '12'],
+                ['B', 'https://a.com/1', '//div/a', '3'],
+                ['C', 'https://a.com/1', '//ul/li[last()]/a', '11'],
+                ['D', 'https://a.com/1', '//table//a', '1'],
+                ['E', 'https://b.com/1', '//a', '1']]
+
+        results = {result.title: result for result in replay(self.store, rows)}
+
+        self.assertFalse(results['A'].changed)
+        self.assertEqual(results['B'].latest_ep, 3.0)
+        self.assertEqual((results['C'].latest_ep, results['C'].recorded_ep), (11.0, None))
+        self.assertTrue(results['C'].changed)
+        self.assertEqual(results['D'].reason, NO_ELEMENTS)
+        self.assertEqual(results['E'].reason, NO_SNAPSHOT)
+
+    def test_replay_in_several_processes(self):
+        rows = []
+        for i in range(20):
+            self.store.put(f'https://a.com/{i}', PAGE.replace(b'12', str(i + 12).encode()), STATIC, ['//ul//a'],
+                           [i + 12.0])
+            rows.append([f'T{i}', f'https://a.com/{i}', '//ul//a', '1'])
+
+        results = list(replay(self.store, rows, workers=2))
+
+        self.assertEqual([result.latest_ep for result in results], [i + 12.0 for i in range(20)])
+        self.assertFalse(any(result.changed for result in results))
+
+
+class RecordTest(LocalServerTestCase):
+    handler = PageHandler
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.url = f'{cls.base_url}/manga/1/'
+
+    def test_check_page_records_what_it_extracted_from(self):
+        with tempfile.TemporaryDirectory() as tmp_dir, create_session() as session:
+            store = SnapshotStore(os.path.join(tmp_dir, 'snapshots'))
+
+            latest_eps = check_page(self.url, ['//ul//a', '//div/a'], MagicMock(), session,
+                                    SiteModes(os.path.join(tmp_dir, 'site_modes.json')), snapshots=store)
+
+            entry = store.entry(self.url)
+            self.assertEqual(latest_eps, [12.0, 3.0])
+            self.assertEqual(entry['source'], STATIC)
+            self.assertEqual(entry['latest_eps'], {'//ul//a': 12.0, '//div/a': 3.0})
+            self.assertEqual(store.read(entry['digest']), PAGE)
+            self.assertEqual([result.latest_ep for result in replay(store, [['A', self.url, '//ul//a', '1']])],
+                             [12.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler
+from unittest.mock import patch
+
+from episode import NoElementsException
+from local_server import LocalServerTestCase
+from static_fetch import STATIC, BROWSER, SiteModes, create_session, evaluate_xpath, get_latest_ep_static
+
+PAGE = b"""<html><body>
+<a href="/ep/12"><h2>Ep. 12</h2></a>
+<a href="/ep/11"><h2>Ep. 11.5</h2></a>
+<a href="/ep/1"><h2>Ep. 1</h2></a>
+</body></html>"""
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.end_headers()
+        self.wfile.write(PAGE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StaticFetchTest(LocalServerTestCase):
+    handler = PageHandler
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.url = f'{cls.base_url}/manga/1/'
+
+    def test_evaluate_xpath_returns_text(self):
+        self.assertEqual(evaluate_xpath(PAGE, '//a/h2'), ['Ep. 12', 'Ep. 11.5', 'Ep. 1'])
+
+    def test_get_latest_ep_static(self):
+        with create_session() as session:
+            self.assertEqual(get_latest_ep_static(session, self.url, '//a/h2'), 12.0)
+
+    def test_get_latest_ep_static_no_elements(self):
+        with create_session() as session:
+            with self.assertRaises(NoElementsException):
+                get_latest_ep_static(session, self.url, '//main/div/p')
+
+    def test_site_modes_are_persisted(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'site_modes.json')
+            site_modes = SiteModes(filename)
+            site_modes.remember('mangakakalot.com', STATIC)
+            site_modes.remember('mangaplus.shueisha.co.jp', BROWSER)
+            site_modes.save()
+
+            reloaded = SiteModes(filename)
+            self.assertEqual(reloaded.get('mangakakalot.com'), STATIC)
+            self.assertEqual(reloaded.get('mangaplus.shueisha.co.jp'), BROWSER)
+            self.assertIsNone(reloaded.get('www.nekopost.net'))
+
+    def test_browser_mode_expires(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'site_modes.json')
+            with open(filename, 'w') as f:
+                json.dump({'mangaplus.shueisha.co.jp': BROWSER, 'mangakakalot.com': STATIC}, f)
+            site_modes = SiteModes(filename, browser_ttl=3600)
+
+            # a file written before modes expired is re-probed once
+            self.assertIsNone(site_modes.get('mangaplus.shueisha.co.jp'))
+            self.assertEqual(site_modes.get('mangakakalot.com'), STATIC)
+
+            site_modes.remember('mangaplus.shueisha.co.jp', BROWSER)
+            self.assertEqual(site_modes.get('mangaplus.shueisha.co.jp'), BROWSER)
+            with patch('static_fetch.time.time', return_value=time.time() + 1800):
+                # confirming the mode doesn't push the re-probe back
+                site_modes.remember('mangaplus.shueisha.co.jp', BROWSER)
+                self.assertEqual(site_modes.get('mangaplus.shueisha.co.jp'), BROWSER)
+            with patch('static_fetch.time.time', return_value=time.time() + 3600):
+                self.assertIsNone(site_modes.get('mangaplus.shueisha.co.jp'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import asyncio
+import unittest
+
+from steps import run_steps, run_steps_async
+
+
+def doubling_steps():
+    total = 0
+    for value in (1, 2, 3):
+        try:
+            total += yield value
+        except ValueError:
+            total += 100
+    return total
+
+
+def perform(step):
+    if step == 2:
+        raise ValueError(step)
+    return step * 2
+
+
+async def perform_async(step):
+    return perform(step)
+
+
+class StepsTest(unittest.TestCase):
+    def test_results_are_sent_and_errors_thrown_back(self):
+        self.assertEqual(run_steps(doubling_steps(), perform), 1 * 2 + 100 + 3 * 2)
+
+    def test_async_runner_takes_the_same_steps(self):
+        self.assertEqual(asyncio.run(run_steps_async(doubling_steps(), perform_async)), 1 * 2 + 100 + 3 * 2)
+
+    def test_an_error_the_steps_dont_handle_propagates(self):
+        def failing(step):
+            raise KeyError(step)
+
+        with self.assertRaises(KeyError):
+            run_steps(doubling_steps(), failing)
+
+
+if __name__ == '__main__':
+    unittest.main()
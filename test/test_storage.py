@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from storage import CsvStorage, SqliteStorage, open_storage, read_csv, write_csv
+
+CSV_DATA = [['name', 'url', 'xpath', 'latest_ep'],
+            ['Manga 1', 'http://manga.com', '//a', '1.0'],
+            ['Manga 2', 'http://manga2.com', '//div', '2.0']]
+
+
+class StorageTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.tmp_dir.name, 'watchlist.csv')
+        self.db_path = os.path.join(self.tmp_dir.name, 'watchlist.db')
+        write_csv(self.csv_path, CSV_DATA)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_open_storage_by_extension(self):
+        self.assertIsInstance(open_storage(self.csv_path), CsvStorage)
+        storage = open_storage(self.db_path)
+        self.assertIsInstance(storage, SqliteStorage)
+        storage.close()
+
+    def test_csv_storage_writes_on_flush(self):
+        storage = CsvStorage(self.csv_path)
+        self.assertEqual(storage.read_rows(), CSV_DATA[1:])
+
+        storage.update_ep('Manga 2', 'http://manga2.com', 3.5, fetch_ms=12.0)
+        self.assertEqual(read_csv(self.csv_path), CSV_DATA)
+        storage.flush()
+
+        self.assertEqual(read_csv(self.csv_path)[2], ['Manga 2', 'http://manga2.com', '//div', '3.5'])
+        self.assertFalse(os.path.exists(f'{self.csv_path}.tmp'))
+
+    def test_csv_storage_streams_rows(self):
+        storage = CsvStorage(self.csv_path)
+        rows = storage.iter_rows()
+
+        self.assertEqual(next(rows), CSV_DATA[1])
+        storage.update_ep('Manga 1', 'http://manga.com', 4.0)
+        self.assertEqual(list(rows), CSV_DATA[2:])
+        storage.flush()
+
+        self.assertEqual(read_csv(self.csv_path)[1], ['Manga 1', 'http://manga.com', '//a', '4.0'])
+
+    def test_sqlite_streams_rows_in_batches_around_updates(self):
+        storage = SqliteStorage(self.db_path)
+        storage.import_csv(self.csv_path)
+        rows = storage.iter_rows(batch_size=1)
+
+        self.assertEqual(next(rows)[0], 'Manga 1')
+        storage.update_ep('Manga 2', 'http://manga2.com', 9.0)
+        self.assertEqual(list(rows), [['Manga 2', 'http://manga2.com', '//div', '9.0']])
+        storage.close()
+
+    def test_sqlite_commits_each_update_with_history(self):
+        storage = SqliteStorage(self.db_path)
+        self.assertEqual(storage.import_csv(self.csv_path), 2)
+        storage.update_ep('Manga 1', 'http://manga.com', 2.0, fetch_ms=40.0)
+        storage.update_ep('Manga 1', 'http://manga.com', 3.0, fetch_ms=35.0)
+        # no flush or close: the updates must already be on disk
+        reopened = SqliteStorage(self.db_path)
+
+        self.assertEqual(reopened.read_rows()[0], ['Manga 1', 'http://manga.com', '//a', '3.0'])
+        history = reopened.history('Manga 1', 'http://manga.com')
+        self.assertEqual([(episode, fetch_ms) for episode, _, fetch_ms in history],
+                         [(2.0, 40.0), (3.0, 35.0)])
+        reopened.close()
+        storage.close()
+
+    def test_sqlite_import_keeps_newer_ep_and_exports(self):
+        storage = SqliteStorage(self.db_path)
+        storage.import_csv(self.csv_path)
+        storage.update_ep('Manga 1', 'http://manga.com', 5.0)
+        storage.import_csv(self.csv_path)
+        export_path = os.path.join(self.tmp_dir.name, 'export.csv')
+
+        self.assertEqual(storage.export_csv(export_path), 2)
+        self.assertEqual(read_csv(export_path)[1], ['Manga 1', 'http://manga.com', '//a', '5.0'])
+        storage.close()
+
+    def test_same_title_on_two_sites_stays_two_rows(self):
+        write_csv(self.csv_path, CSV_DATA + [['Manga 1', 'http://manga3.com', '//p', '7.0']])
+        csv_storage = CsvStorage(self.csv_path)
+        csv_storage.read_rows()
+        csv_storage.update_ep('Manga 1', 'http://manga3.com', 8.0)
+        csv_storage.flush()
+        sqlite_storage = SqliteStorage(self.db_path)
+        self.assertEqual(sqlite_storage.import_csv(self.csv_path), 3)
+        sqlite_storage.update_ep('Manga 1', 'http://manga.com', 2.0)
+
+        self.assertEqual([row[3] for row in read_csv(self.csv_path)[1:]], ['1.0', '2.0', '8.0'])
+        self.assertEqual(sqlite_storage.read_rows(), [['Manga 1', 'http://manga.com', '//a', '2.0'],
+                                                      ['Manga 2', 'http://manga2.com', '//div', '2.0'],
+                                                      ['Manga 1', 'http://manga3.com', '//p', '8.0']])
+        self.assertEqual(len(sqlite_storage.history('Manga 1', 'http://manga.com')), 1)
+        self.assertEqual(sqlite_storage.history('Manga 1', 'http://manga3.com'), [])
+        sqlite_storage.close()
+
+    def test_sqlite_keyed_by_name_is_migrated(self):
+        connection = sqlite3.connect(self.db_path)
+        connection.executescript("""
+            CREATE TABLE watchlist (name TEXT PRIMARY KEY, url TEXT NOT NULL, xpath TEXT NOT NULL,
+                                    latest_ep REAL NOT NULL, updated_at TEXT);
+            CREATE INDEX watchlist_url ON watchlist (url);
+            CREATE TABLE history (id INTEGER PRIMARY KEY, title TEXT NOT NULL, episode REAL NOT NULL,
+                                  detected_at TEXT NOT NULL, fetch_ms REAL);
+            INSERT INTO watchlist VALUES ('Manga 1', 'http://manga.com', '//a', 4.0, NULL);
+            INSERT INTO history (title, episode, detected_at) VALUES ('Manga 1', 4.0, '2024-01-01T00:00:00+00:00');
+        """)
+        connection.close()
+
+        storage = SqliteStorage(self.db_path)
+        storage.import_csv(self.csv_path)
+        storage.update_ep('Manga 1', 'http://manga.com', 5.0)
+
+        self.assertEqual(storage.read_rows(), [['Manga 1', 'http://manga.com', '//a', '5.0'],
+                                               ['Manga 2', 'http://manga2.com', '//div', '2.0']])
+        self.assertEqual([episode for episode, _, _ in storage.history('Manga 1', 'http://manga.com')], [4.0, 5.0])
+        storage.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
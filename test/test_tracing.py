@@ -0,0 +1,68 @@
+import json
+import os
+import tempfile
+import unittest
+
+from tracing import Tracer
+
+
+class TracerTest(unittest.TestCase):
+    def test_spans_pick_up_thread_tags(self):
+        tracer = Tracer()
+        with tracer.tags(title='Blue Box', host='mangaplus.shueisha.co.jp'):
+            with tracer.span('page_load'):
+                pass
+        with tracer.span('notify'):
+            pass
+
+        self.assertEqual([(span['stage'], span['title'], span['host']) for span in tracer.spans],
+                         [('page_load', 'Blue Box', 'mangaplus.shueisha.co.jp'), ('notify', '', '')])
+
+    def test_errors_are_counted_and_raised(self):
+        tracer = Tracer()
+        with self.assertRaises(ValueError):
+            with tracer.span('parse', host='a.com'):
+                raise ValueError
+
+        stage, = tracer.summary()
+        self.assertEqual((stage['stage'], stage['host'], stage['count'], stage['errors']), ('parse', 'a.com', 1, 1))
+        self.assertEqual(tracer.spans[0]['error'], 'ValueError')
+
+    def test_prometheus_histogram(self):
+        tracer = Tracer()
+        tracer.record('page_load', 0.2, host='a.com')
+        tracer.record('page_load', 3.0, host='a.com', error='TimeoutException')
+
+        text = tracer.prometheus_text()
+
+        self.assertIn('manga_checker_stage_seconds_bucket{stage="page_load",host="a.com",le="0.25"} 1', text)
+        self.assertIn('manga_checker_stage_seconds_bucket{stage="page_load",host="a.com",le="5.0"} 2', text)
+        self.assertIn('manga_checker_stage_seconds_bucket{stage="page_load",host="a.com",le="+Inf"} 2', text)
+        self.assertIn('manga_checker_stage_seconds_count{stage="page_load",host="a.com"} 2', text)
+        self.assertIn('manga_checker_stage_errors_total{stage="page_load",host="a.com"} 1', text)
+
+    def test_exports(self):
+        tracer = Tracer()
+        tracer.record('check', 0.5, title='Manga', host='a.com')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            json_name = os.path.join(tmp_dir, 'run_report.json')
+            prom_name = os.path.join(tmp_dir, 'manga_checker.prom')
+            tracer.write_json(json_name)
+            tracer.write_prometheus(prom_name)
+
+            with open(json_name) as f:
+                report = json.load(f)
+            self.assertEqual(report['stages'][0]['p50_ms'], 500.0)
+            self.assertEqual(report['spans'][0]['title'], 'Manga')
+            self.assertTrue(os.path.getsize(prom_name) > 0)
+            self.assertEqual(sorted(os.listdir(tmp_dir)), ['manga_checker.prom', 'run_report.json'])
+
+    def test_sections_are_added_to_report(self):
+        tracer = Tracer()
+        tracer.add_section('resources', {'blocked': {'pages': 1}})
+
+        self.assertEqual(tracer.report()['resources'], {'blocked': {'pages': 1}})
+
+
+if __name__ == '__main__':
+    unittest.main()
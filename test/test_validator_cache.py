@@ -0,0 +1,149 @@
+import os
+import tempfile
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler
+from unittest.mock import MagicMock
+
+from local_server import LocalServerTestCase
+from main import RENDER, page_check_steps
+from static_fetch import SiteModes, create_session, perform_fetch
+from steps import run_steps
+from validator_cache import HASH_MATCH, MISS, NOT_MODIFIED, ValidatorCache
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    etag = '"v1"'
+    latest_ep = 10
+    requests_seen = 0
+
+    def do_GET(self):
+        SiteHandler.requests_seen += 1
+        if self.path.startswith('/etag') and self.headers.get('If-None-Match') == SiteHandler.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        # the ad changes on every request, the chapter list only when latest_ep does
+        body = (f'<html><body><div class="ad">{time.time()}</div>'
+                f'<a><h2>Ep. {SiteHandler.latest_ep}</h2></a></body></html>').encode()
+        self.send_response(200)
+        if self.path.startswith('/etag'):
+            self.send_header('ETag', SiteHandler.etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ValidatorCacheTest(LocalServerTestCase):
+    handler = SiteHandler
+
+    def setUp(self):
+        SiteHandler.latest_ep = 10
+        self.session = create_session()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.site_modes = SiteModes(os.path.join(self.tmp_dir.name, 'site_modes.json'))
+
+    def tearDown(self):
+        self.session.close()
+        self.tmp_dir.cleanup()
+
+    def check(self, cache, url, xpath='//a/h2', rendered=None) -> tuple[list[float], list]:
+        """Runs the page check's steps against the local site; Chrome "finds" ``rendered``."""
+        steps = []
+
+        def perform(step):
+            steps.append(step)
+            return rendered if step is RENDER else perform_fetch(self.session, step)
+
+        return run_steps(page_check_steps(url, [xpath], self.site_modes, validators=cache), perform), steps
+
+    def test_not_modified(self):
+        cache = ValidatorCache(None, ttl=60)
+        url = f'{self.base_url}/etag/1/'
+        self.check(cache, url)
+
+        latest_eps, steps = self.check(cache, url)
+
+        self.assertEqual(latest_eps, [10.0])
+        self.assertEqual(len(steps), 1)
+        self.assertEqual(cache.stats['127.0.0.1'], {NOT_MODIFIED: 1, HASH_MATCH: 0, MISS: 1})
+
+    def test_region_hash_ignores_the_rest_of_the_page(self):
+        cache = ValidatorCache(None, ttl=60)
+        url = f'{self.base_url}/plain/1/'
+        self.check(cache, url)
+
+        latest_eps, _ = self.check(cache, url)
+        self.assertEqual(latest_eps, [10.0])
+        self.assertEqual(cache.stats['127.0.0.1'], {NOT_MODIFIED: 0, HASH_MATCH: 1, MISS: 1})
+
+        SiteHandler.latest_ep = 11
+        latest_eps, steps = self.check(cache, url)
+        self.assertEqual(latest_eps, [11.0])
+        # the conditional fetch's response is parsed instead of fetching the page again
+        self.assertEqual(len(steps), 1)
+        self.assertEqual(cache.stats['127.0.0.1'], {NOT_MODIFIED: 0, HASH_MATCH: 1, MISS: 2})
+
+    def test_expired_entries_are_not_used(self):
+        cache = ValidatorCache(None, ttl=60)
+        url = f'{self.base_url}/etag/2/'
+        self.check(cache, url)
+        cache._entries[url]['stored_at'] -= 61
+
+        self.check(cache, url)
+
+        self.assertEqual(cache.stats['127.0.0.1'], {NOT_MODIFIED: 0, HASH_MATCH: 0, MISS: 2})
+
+    def test_host_is_untrusted_when_hash_misses_a_change(self):
+        cache = ValidatorCache(None, ttl=60)
+        # the XPath matches a heading that stays put while the episode list moves on
+        response = MagicMock(content=b'<html><body><main><p>Chapters</p></main></body></html>', headers={})
+        cache.store('http://a.com/1', 'a.com', ['//main/p'], [1.0], response)
+        cache.store('http://a.com/1', 'a.com', ['//main/p'], [2.0], response)
+
+        self.assertIn('a.com', cache._untrusted_hosts)
+
+    def test_page_the_xpath_finds_nothing_on_is_never_skipped_by_hash(self):
+        cache = ValidatorCache(None, ttl=60)
+        # a JavaScript app's shell is the same before and after a release
+        shell = MagicMock(content=b'<html><body><div id="root"></div></body></html>', headers={}, ok=True,
+                          status_code=200)
+        cache.store('http://spa.com/1', 'spa.com', ['//main/p'], [1.0], shell)
+        entry, _ = cache.conditional_request('http://spa.com/1', ['//main/p'])
+
+        cached_eps, response = cache.judge('spa.com', ['//main/p'], entry, shell)
+
+        self.assertIsNone(cached_eps)
+        self.assertIs(response, shell)
+        self.assertNotIn('spa.com', cache._untrusted_hosts)
+
+    def test_rendered_page_is_not_skipped_on_a_304_for_its_shell(self):
+        cache = ValidatorCache(None, ttl=60)
+        url = f'{self.base_url}/etag/shell/'
+        # the episode comes from Chrome; the HTML the ETag stands for has nothing the XPath finds
+        self.check(cache, url, xpath='//main/p', rendered=[12.0])
+
+        latest_eps, steps = self.check(cache, url, xpath='//main/p', rendered=[13.0])
+
+        self.assertEqual(latest_eps, [13.0])
+        self.assertIs(steps[-1], RENDER)
+        self.assertEqual(cache.stats['127.0.0.1'], {NOT_MODIFIED: 0, HASH_MATCH: 0, MISS: 2})
+
+    def test_entries_are_persisted(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'validator_cache.json')
+            cache = ValidatorCache(filename, ttl=60)
+            url = f'{self.base_url}/etag/3/'
+            self.check(cache, url)
+            cache.save()
+
+            reloaded = ValidatorCache(filename, ttl=60)
+            self.assertEqual(reloaded.lookup(url, ['//a/h2'])['latest_eps'], {'//a/h2': 10.0})
+            self.assertIsNone(reloaded.lookup(url, ['//other']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from bcolors import bcolors
+from stats import percentile
+
+# seconds; wide enough for a cached lxml parse as well as a slow SPA render
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    # recent samples kept for percentiles; the bucket counts cover everything
+    MAX_SAMPLES = 10000
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.samples: list[float] = []
+
+    def observe(self, seconds: float, error: bool):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.samples.append(seconds)
+        if len(self.samples) > self.MAX_SAMPLES:
+            del self.samples[:len(self.samples) - self.MAX_SAMPLES]
+        if error:
+            self.errors += 1
+
+
+class Tracer:
+    """Times each stage of a title check and aggregates the spans per (stage, host).
+
+    ``tags()`` sets the title and host for every span opened by the current
+    thread or asyncio task, so code deep inside a check doesn't need to know
+    what it works on.
+    """
+
+    def __init__(self, keep_spans: int = 100000):
+        self.keep_spans = keep_spans
+        self.spans: list[dict] = []
+        self.started_at = time.time()
+        self._histograms: dict[tuple[str, str], Histogram] = {}
+        self._sections: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        # a context variable rather than a thread local, so tasks sharing the event loop thread keep their own
+        self._tags: contextvars.ContextVar[tuple[str, str]] = contextvars.ContextVar('tags', default=('', ''))
+
+    @contextmanager
+    def tags(self, title: str = '', host: str = '') -> Iterator[None]:
+        token = self._tags.set((title, host))
+        try:
+            yield
+        finally:
+            self._tags.reset(token)
+
+    @contextmanager
+    def span(self, stage: str, title: Optional[str] = None, host: Optional[str] = None) -> Iterator[None]:
+        context_title, context_host = self._tags.get()
+        title = context_title if title is None else title
+        host = context_host if host is None else host
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - start, title=title, host=host, error=error)
+
+    def record(self, stage: str, seconds: float, title: str = '', host: str = '', error: Optional[str] = None):
+        with self._lock:
+            histogram = self._histograms.get((stage, host))
+            if histogram is None:
+                histogram = self._histograms[(stage, host)] = Histogram()
+            histogram.observe(seconds, error is not None)
+            if len(self.spans) < self.keep_spans:
+                self.spans.append({'stage': stage, 'title': title, 'host': host,
+                                   'ms': round(seconds * 1000, 3), 'error': error})
+
+    def add_section(self, name: str, data: dict):
+        # other run-wide numbers that belong in the report next to the stage timings
+        with self._lock:
+            self._sections[name] = data
+
+    def summary(self) -> list[dict]:
+        with self._lock:
+            items = sorted(self._histograms.items())
+            return [{'stage': stage, 'host': host, 'count': histogram.count, 'errors': histogram.errors,
+                     'total_ms': round(histogram.total * 1000, 1),
+                     'p50_ms': round(percentile(histogram.samples, 50) * 1000, 1),
+                     'p95_ms': round(percentile(histogram.samples, 95) * 1000, 1)}
+                    for (stage, host), histogram in items]
+
+    def by_stage(self) -> dict[str, tuple[list[float], int]]:
+        stages: dict[str, tuple[list[float], int]] = {}
+        with self._lock:
+            for (stage, _), histogram in self._histograms.items():
+                samples, errors = stages.get(stage, ([], 0))
+                stages[stage] = (samples + histogram.samples, errors + histogram.errors)
+        return stages
+
+    def report(self) -> dict:
+        summary = self.summary()
+        with self._lock:
+            spans = list(self.spans)
+            sections = dict(self._sections)
+        return {'started_at': self.started_at, 'finished_at': time.time(), 'stages': summary, **sections,
+                'spans': spans}
+
+    def write_json(self, filename: str):
+        write_atomic(filename, json.dumps(self.report(), indent=2))
+
+    def prometheus_text(self) -> str:
+        lines = ['# HELP manga_checker_stage_seconds Time spent in each stage of a title check.',
+                 '# TYPE manga_checker_stage_seconds histogram']
+        with self._lock:
+            items = sorted(self._histograms.items())
+            for (stage, host), histogram in items:
+                labels = f'stage="{escape_label(stage)}",host="{escape_label(host)}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    lines.append(f'manga_checker_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'manga_checker_stage_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f'manga_checker_stage_seconds_sum{{{labels}}} {histogram.total:.6f}')
+                lines.append(f'manga_checker_stage_seconds_count{{{labels}}} {histogram.count}')
+
+            lines += ['# HELP manga_checker_stage_errors_total Stages that ended with an exception.',
+                      '# TYPE manga_checker_stage_errors_total counter']
+            for (stage, host), histogram in items:
+                labels = f'stage="{escape_label(stage)}",host="{escape_label(host)}"'
+                lines.append(f'manga_checker_stage_errors_total{{{labels}}} {histogram.errors}')
+
+        lines += ['# HELP manga_checker_last_run_timestamp_seconds When the metrics were last written.',
+                  '# TYPE manga_checker_last_run_timestamp_seconds gauge',
+                  f'manga_checker_last_run_timestamp_seconds {time.time():.0f}']
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, filename: str):
+        # the node exporter may read the file at any moment, so never let it see a partial one
+        write_atomic(filename, self.prometheus_text())
+
+
+def escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def write_atomic(filename: str, text: str):
+    tmp_name = f'{filename}.tmp'
+    with open(tmp_name, 'w') as f:
+        f.write(text)
+    os.replace(tmp_name, filename)
+
+
+def print_trace_summary(tracer: Tracer):
+    stages = tracer.by_stage()
+    if not stages:
+        return
+    print(f'\n{bcolors.OKCYAN}Time per stage{bcolors.ENDC}')
+    for stage, (samples, errors) in sorted(stages.items(), key=lambda item: -sum(item[1][0])):
+        print(f'{stage}: {len(samples)} spans, total {sum(samples):.2f}s, p50 {percentile(samples, 50) * 1000:.0f}ms, '
+              f'p95 {percentile(samples, 95) * 1000:.0f}ms, {errors} errors')
+
+
+# Shared by every module, like the root logger
+tracer = Tracer()
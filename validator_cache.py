@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+import requests
+from lxml import etree, html
+
+from bcolors import bcolors
+from static_fetch import evaluate_xpath
+
+NOT_MODIFIED = 'not_modified'
+HASH_MATCH = 'hash_match'
+MISS = 'miss'
+
+
+def region_hash(content: bytes, xpaths: list[str]) -> Optional[str]:
+    # Hash only what the XPaths match so ads and timestamps elsewhere on the page don't count as a change.
+    # Pages rendered by JavaScript have nothing to match yet, and their shell stays the same across releases,
+    # so they get no hash and only a 304 can skip them.
+    try:
+        tree = html.fromstring(content)
+        link_texts = [evaluate_xpath(tree, xpath) for xpath in xpaths]
+    except (etree.ParserError, etree.XPathError, ValueError):
+        return None
+    if not all(link_texts):
+        return None
+    return hashlib.sha256(json.dumps(link_texts).encode()).hexdigest()
+
+
+class ValidatorCache:
+    """Per-URL ETag, Last-Modified and content hash from the last full check.
+
+    If the server answers a conditional request with 304, or the region the
+    XPaths match is unchanged, the cached episodes are reused and the page is
+    never rendered. Entries older than ``ttl`` are not used, so every page still gets
+    a full check at least once per ``ttl``; they are evicted after twice that.
+    A host whose episodes changed while its region hash did not is no longer
+    trusted by hash.
+    """
+
+    def __init__(self, filename: Optional[str], ttl: float = 21600):
+        self.filename = filename
+        self.ttl = ttl
+        self.stats: dict[str, dict[str, int]] = {}
+        self._entries: dict[str, dict] = {}
+        self._untrusted_hosts: set[str] = set()
+        self._lock = threading.Lock()
+        if filename and os.path.exists(filename):
+            try:
+                with open(filename, 'r') as f:
+                    data = json.load(f)
+                self._entries = data.get('entries', {})
+                self._untrusted_hosts = set(data.get('untrusted_hosts', []))
+            except (OSError, ValueError, AttributeError) as e:
+                print(f'{bcolors.WARNING}Ignoring unreadable {filename}: {e}{bcolors.ENDC}')
+        self.evict()
+
+    def evict(self):
+        now = time.time()
+        with self._lock:
+            # expired entries are kept a while longer to compare against the next full check
+            self._entries = {url: entry for url, entry in self._entries.items()
+                             if now - entry['stored_at'] < self.ttl * 2}
+
+    def lookup(self, url: str, xpaths: list[str]) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(url)
+        if entry is None or time.time() - entry['stored_at'] >= self.ttl:
+            return None
+        if not all(xpath in entry['latest_eps'] for xpath in xpaths):
+            return None
+        return entry
+
+    def conditional_request(self, url: str, xpaths: list[str]) -> tuple[Optional[dict], dict[str, str]]:
+        """The cache entry for ``url`` and the validator headers to send with its fetch."""
+        entry = self.lookup(url, xpaths)
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return entry, headers
+
+    def judge(self, host: str, xpaths: list[str], entry: Optional[dict], response) -> \
+            tuple[Optional[list[float]], Optional[requests.Response]]:
+        # response is None when the fetch failed. A 304 only vouches for the HTML: when the XPath found nothing in it
+        # the episodes came from rendering, and a JavaScript app's shell keeps its ETag across releases
+        if entry and entry['region_hash'] and response is not None and response.status_code == 304:
+            self._count(host, NOT_MODIFIED)
+            return [entry['latest_eps'][xpath] for xpath in xpaths], None
+        if entry and entry['region_hash'] and response is not None and response.ok \
+                and host not in self._untrusted_hosts and region_hash(response.content, xpaths) == entry['region_hash']:
+            self._count(host, HASH_MATCH)
+            return [entry['latest_eps'][xpath] for xpath in xpaths], None
+
+        self._count(host, MISS)
+        # a 304 has no body to read the episodes from
+        return None, response if response is not None and response.ok and response.status_code != 304 else None
+
+    def store(self, url: str, host: str, xpaths: list[str], latest_eps: list[float],
+              response: Optional[requests.Response]):
+        if response is None:
+            return
+        new_hash = region_hash(response.content, xpaths)
+        eps = dict(zip(xpaths, latest_eps))
+        with self._lock:
+            previous = self._entries.get(url)
+            if previous and new_hash and previous['region_hash'] == new_hash and \
+                    any(previous['latest_eps'].get(xpath, ep) != ep for xpath, ep in eps.items()):
+                # the hash stayed the same although the episode moved on, so it can't be trusted for this host
+                self._untrusted_hosts.add(host)
+            self._entries[url] = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'region_hash': new_hash,
+                'latest_eps': eps,
+                'stored_at': time.time(),
+            }
+
+    def _count(self, host: str, outcome: str):
+        with self._lock:
+            host_stats = self.stats.setdefault(host, {NOT_MODIFIED: 0, HASH_MATCH: 0, MISS: 0})
+            host_stats[outcome] += 1
+
+    def save(self):
+        if not self.filename:
+            return
+        self.evict()
+        with self._lock:
+            data = {'entries': self._entries, 'untrusted_hosts': sorted(self._untrusted_hosts)}
+            tmp_name = f'{self.filename}.tmp'
+            with open(tmp_name, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_name, self.filename)
+
+
+def print_validator_stats(cache: ValidatorCache):
+    if not cache.stats:
+        return
+    print(f'\n{bcolors.OKCYAN}Unchanged page short-circuit{bcolors.ENDC}')
+    for host, host_stats in sorted(cache.stats.items()):
+        total = sum(host_stats.values())
+        hits = host_stats[NOT_MODIFIED] + host_stats[HASH_MATCH]
+        print(f'{host}: {hits}/{total} skipped ({hits / total * 100:.0f}%), '
+              f'{host_stats[NOT_MODIFIED]} by 304, {host_stats[HASH_MATCH]} by hash')